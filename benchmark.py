@@ -0,0 +1,390 @@
+"""오프라인 벤치마크: 가짜 Bot API 서버와 합성 업데이트로 포워더 처리량/지연 시간 측정
+
+네트워크나 실제 텔레그램 계정 없이 실행됩니다.
+
+    python benchmark.py --updates 2000 --latency-ms 20 --rate-429 0.01
+
+처리량이 --min-throughput보다 낮거나 포워딩되지 않은 메시지가 있으면 종료 코드 1로 끝나므로
+CI에서 핸들러 경로의 성능 저하를 잡는 데 사용할 수 있습니다.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import resource
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from tornado.web import Application as TornadoApplication, RequestHandler
+
+BOT_TOKEN = '123456:BENCHMARK'
+GROUP_CHAT_ID = -1001000000000
+MAPPED_BOTS = ['news_bot', 'weather_bot', 'stock_bot', 'alerts_bot']
+UNMAPPED_BOTS = ['spam_bot', 'other_bot']
+
+# 합성 업데이트 구성 비율
+DEFAULT_MIX = {
+    'text': 0.50,
+    'photo': 0.15,
+    'album': 0.10,
+    'unmapped': 0.15,
+    'human': 0.10
+}
+ALBUM_SIZE = 3
+# 텍스트 메시지 본문 형식 (묶음 전송된 sendMessage에서 원래 메시지 ID를 찾는 데 사용)
+TEXT_PATTERN = re.compile(r'알림 (\d+)')
+
+
+def percentile(values, ratio):
+    """정렬된 값 목록의 백분위수"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(ratio * (len(values) - 1)))))
+    return values[index]
+
+
+class UpdateGenerator:
+    """텍스트/사진/앨범/매핑되지 않은 봇/사람 메시지가 섞인 업데이트 생성기"""
+
+    def __init__(self, seed=0, mix=None):
+        self.random = random.Random(seed)
+        self.mix = mix or DEFAULT_MIX
+        self.update_id = 0
+        self.message_id = 0
+        self.expected = set()
+        self.senders = {}
+
+    def _user(self, username, is_bot=True):
+        user_id = self.senders.setdefault(username, 1000 + len(self.senders))
+        return {'id': user_id, 'is_bot': is_bot, 'first_name': username, 'username': username}
+
+    def _message(self, sender, **fields):
+        self.update_id += 1
+        self.message_id += 1
+        message = {
+            'message_id': self.message_id,
+            'date': int(time.time()),
+            'chat': {'id': GROUP_CHAT_ID, 'type': 'supergroup', 'title': 'benchmark'},
+            'from': sender
+        }
+        message.update(fields)
+        return {'update_id': self.update_id, 'message': message}
+
+    def _photo(self):
+        file_id = f"photo-{self.message_id + 1}"
+        return [{'file_id': file_id, 'file_unique_id': file_id, 'width': 800, 'height': 600}]
+
+    def generate(self, count):
+        """최소 count개의 업데이트 생성 (앨범은 항목 수만큼 업데이트가 생김)"""
+        kinds = list(self.mix)
+        weights = [self.mix[kind] for kind in kinds]
+        updates = []
+        while len(updates) < count:
+            kind = self.random.choices(kinds, weights)[0]
+            if kind == 'human':
+                updates.append(self._message(self._user('someone', is_bot=False), text='안녕하세요'))
+            elif kind == 'unmapped':
+                updates.append(self._message(self._user(self.random.choice(UNMAPPED_BOTS)), text='무시할 메시지'))
+            elif kind == 'text':
+                sender = self._user(self.random.choice(MAPPED_BOTS))
+                update = self._message(sender, text=f"알림 {self.message_id + 1}")
+                self.expected.add(update['message']['message_id'])
+                updates.append(update)
+            elif kind == 'photo':
+                sender = self._user(self.random.choice(MAPPED_BOTS))
+                update = self._message(sender, photo=self._photo(), caption='사진')
+                self.expected.add(update['message']['message_id'])
+                updates.append(update)
+            else:
+                sender = self._user(self.random.choice(MAPPED_BOTS))
+                media_group_id = f"album-{self.update_id + 1}"
+                for _ in range(ALBUM_SIZE):
+                    update = self._message(sender, photo=self._photo(), media_group_id=media_group_id)
+                    self.expected.add(update['message']['message_id'])
+                    updates.append(update)
+        return updates
+
+
+class FakeBotAPI:
+    """getUpdates/copyMessage/sendMediaGroup 등을 흉내 내는 로컬 Bot API 서버
+
+    응답마다 latency초를 기다리고, 전송 메서드는 rate_429 확률로 429(RetryAfter)를 돌려줍니다.
+    메시지가 getUpdates로 전달된 시각과 포워딩 호출이 끝난 시각으로 지연 시간을 계산합니다.
+    """
+
+    SEND_METHODS = ('copyMessage', 'forwardMessage', 'sendMessage', 'sendPhoto', 'sendMediaGroup', 'copyMessages')
+
+    def __init__(self, updates, latency=0.0, rate_429=0.0, retry_after=1, seed=0):
+        self.pending = list(updates)
+        self.latency = latency
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.rejected = 0
+        self.delivered_at = {}
+        self.forwarded_at = {}
+        self.first_delivery = None
+        self.all_forwarded = asyncio.Event()
+        self.expected = set()
+        self._new_updates = asyncio.Event()
+        self._next_message_id = 10 ** 6
+        self._server = None
+
+    def _forwarded(self, message_ids):
+        now = time.monotonic()
+        for message_id in message_ids:
+            self.forwarded_at.setdefault(message_id, now)
+        if self.expected and self.expected.issubset(self.forwarded_at):
+            self.all_forwarded.set()
+
+    def _sent_message(self, chat_id):
+        self._next_message_id += 1
+        return {
+            'message_id': self._next_message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'supergroup'}
+        }
+
+    async def handle(self, method, params):
+        """Bot API 메서드 하나 처리 후 (HTTP 상태 코드, 응답 본문) 반환"""
+        self.calls[method] += 1
+
+        if method == 'getUpdates':
+            offset = int(params.get('offset') or 0)
+            limit = int(params.get('limit') or 100)
+            self.pending = [update for update in self.pending if update['update_id'] >= offset]
+            if not self.pending and not self._new_updates.is_set():
+                try:
+                    await asyncio.wait_for(self._new_updates.wait(), timeout=float(params.get('timeout') or 0))
+                except asyncio.TimeoutError:
+                    pass
+            batch = self.pending[:limit]
+            now = time.monotonic()
+            if batch and self.first_delivery is None:
+                self.first_delivery = now
+            for update in batch:
+                self.delivered_at.setdefault(update['message']['message_id'], now)
+            return 200, {'ok': True, 'result': batch}
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method in self.SEND_METHODS and self.rate_429 and self.random.random() < self.rate_429:
+            self.rejected += 1
+            return 429, {
+                'ok': False,
+                'error_code': 429,
+                'description': f"Too Many Requests: retry after {self.retry_after}",
+                'parameters': {'retry_after': self.retry_after}
+            }
+
+        chat_id = int(params.get('chat_id') or GROUP_CHAT_ID)
+        if method == 'getMe':
+            result = {'id': 123456, 'is_bot': True, 'first_name': 'forwarder', 'username': 'forwarder_bot'}
+        elif method == 'getChatMember':
+            result = {'status': 'administrator', 'user': {'id': int(params['user_id']), 'is_bot': False,
+                                                          'first_name': 'admin'},
+                      'can_be_edited': False, 'is_anonymous': False, 'can_manage_chat': True,
+                      'can_delete_messages': True, 'can_manage_video_chats': True,
+                      'can_restrict_members': True, 'can_promote_members': True, 'can_change_info': True,
+                      'can_invite_users': True}
+        elif method == 'copyMessage':
+            self._forwarded([int(params['message_id'])])
+            result = {'message_id': self._sent_message(chat_id)['message_id']}
+        elif method == 'copyMessages':
+            message_ids = json.loads(params['message_ids'])
+            self._forwarded(message_ids)
+            result = [{'message_id': self._sent_message(chat_id)['message_id']} for _ in message_ids]
+        elif method == 'forwardMessage':
+            self._forwarded([int(params['message_id'])])
+            result = self._sent_message(chat_id)
+        elif method == 'sendMediaGroup':
+            media = json.loads(params['media'])
+            # 생성기가 만든 file_id는 'photo-<메시지 ID>' 형식
+            self._forwarded([int(item['media'].rsplit('-', 1)[-1]) for item in media])
+            result = [self._sent_message(chat_id) for _ in media]
+        elif method in ('sendMessage', 'sendPhoto'):
+            # 묶음 전송된 텍스트는 본문에 들어 있는 원래 메시지 ID로 기록
+            self._forwarded([int(message_id) for message_id in TEXT_PATTERN.findall(params.get('text') or '')])
+            result = self._sent_message(chat_id)
+        else:
+            # deleteWebhook, setMyCommands 등
+            result = True
+        return 200, {'ok': True, 'result': result}
+
+    def start(self, port=0, address='127.0.0.1'):
+        """실행 중인 이벤트 루프에서 서버 시작, 실제 포트 반환"""
+        api = self
+
+        class BotAPIHandler(RequestHandler):
+            async def post(self, token, method):
+                params = {name: values[-1].decode('utf-8') for name, values in self.request.body_arguments.items()}
+                if self.request.headers.get('Content-Type', '').startswith('application/json') and self.request.body:
+                    params.update(json.loads(self.request.body))
+                status, body = await api.handle(method, params)
+                self.set_status(status)
+                self.set_header('Content-Type', 'application/json')
+                self.write(json.dumps(body))
+
+            get = post
+
+        app = TornadoApplication([(r'/bot([^/]+)/([A-Za-z]+)', BotAPIHandler)])
+        self._server = app.listen(port, address=address)
+        return next(iter(self._server._sockets.values())).getsockname()[1]
+
+    def stop(self):
+        # 대기 중인 getUpdates 롱 폴링을 바로 끝냄
+        self._new_updates.set()
+        if self._server:
+            self._server.stop()
+            self._server = None
+
+
+def configure_environment(workdir, port, args):
+    """포워더가 가짜 서버와 임시 파일만 사용하도록 환경 변수 설정"""
+    os.environ.update({
+        'BOT_TOKEN': BOT_TOKEN,
+        'GROUP_CHAT_ID': str(GROUP_CHAT_ID),
+        'BOT_API_BASE_URL': f"http://127.0.0.1:{port}",
+        'NO_PROXY': '127.0.0.1,localhost',
+        'OUTBOX_PATH': os.path.join(workdir, 'outbox.db'),
+        'DEDUP_STATE_PATH': os.path.join(workdir, 'dedup_state.json'),
+        'CONFIG_WATCH': 'false',
+        'BOT_MODE': 'polling',
+        'BOT_ROLE': 'all',
+        'LOG_ASYNC': 'false',
+        'LOG_LEVEL': os.getenv('LOG_LEVEL', 'WARNING'),
+        'MEDIA_GROUP_WINDOW': str(args.media_group_window),
+        'MAX_CONCURRENT_UPDATES': str(args.workers)
+    })
+    os.environ.pop('METRICS_PORT', None)
+    if not args.rate_limits:
+        # 핸들러 경로만 측정하도록 전송 제한 해제
+        os.environ['SEND_RATE_GLOBAL'] = '1000000'
+        os.environ['SEND_RATE_PER_CHAT_PER_MINUTE'] = '60000000'
+
+    with open(os.path.join(workdir, 'bot_mapping.json'), 'w', encoding='utf-8') as f:
+        json.dump({
+            'bot_mappings': [
+                dict(
+                    {'source_bot_username': username, 'target_topic_id': index + 10, 'description': ''},
+                    **({'digest': {'window_seconds': args.digest_window}} if args.digest_window else {})
+                )
+                for index, username in enumerate(MAPPED_BOTS)
+            ],
+            'settings': {'forward_all_unknown_bots': False, 'default_topic_id': None, 'log_unknown_bots': False}
+        }, f)
+
+
+async def run_benchmark(args):
+    mix = None
+    if args.text_ratio is not None:
+        others = {kind: ratio for kind, ratio in DEFAULT_MIX.items() if kind != 'text'}
+        scale = (1.0 - args.text_ratio) / sum(others.values())
+        mix = dict({kind: ratio * scale for kind, ratio in others.items()}, text=args.text_ratio)
+    generator = UpdateGenerator(seed=args.seed, mix=mix)
+    updates = generator.generate(args.updates)
+    api = FakeBotAPI(updates, latency=args.latency_ms / 1000.0, rate_429=args.rate_429,
+                     retry_after=args.retry_after, seed=args.seed)
+    api.expected = set(generator.expected)
+    port = api.start()
+
+    workdir = tempfile.mkdtemp(prefix='forwarder-bench-')
+    configure_environment(workdir, port, args)
+    os.chdir(workdir)
+
+    from log_setup import setup_logging
+    setup_logging()
+    from telegram_forwarder_bot import TelegramForwarderBot
+
+    bot = TelegramForwarderBot()
+    application = bot.application
+    await application.initialize()
+    await bot.post_init(application)
+    await application.updater.start_polling(poll_interval=0.0, timeout=1,
+                                            allowed_updates=bot.get_allowed_updates())
+    await application.start()
+
+    timed_out = False
+    try:
+        await asyncio.wait_for(api.all_forwarded.wait(), timeout=args.timeout)
+    except asyncio.TimeoutError:
+        timed_out = True
+    finally:
+        await bot.shutdown_gracefully()
+        api.stop()
+        await asyncio.sleep(0)
+
+    latencies = sorted(
+        api.forwarded_at[message_id] - api.delivered_at[message_id]
+        for message_id in api.forwarded_at if message_id in api.delivered_at
+    )
+    forwarded = len(api.forwarded_at)
+    elapsed = (max(api.forwarded_at.values()) - api.first_delivery) if forwarded else 0.0
+    api_calls = sum(count for method, count in api.calls.items() if method != 'getUpdates')
+    return {
+        'updates': len(updates),
+        'expected': len(api.expected),
+        'forwarded': forwarded,
+        'timed_out': timed_out,
+        'elapsed_seconds': elapsed,
+        'messages_per_second': forwarded / elapsed if elapsed else 0.0,
+        'latency_p50_ms': percentile(latencies, 0.50) * 1000,
+        'latency_p99_ms': percentile(latencies, 0.99) * 1000,
+        'api_calls_per_message': api_calls / forwarded if forwarded else 0.0,
+        'api_calls': dict(api.calls),
+        'injected_429': api.rejected,
+        # 리눅스에서 ru_maxrss 단위는 KB
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='가짜 Bot API로 포워더 처리량/지연 시간 측정 (오프라인)')
+    parser.add_argument('--updates', type=int, default=1000, help='생성할 업데이트 수')
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='가짜 API 응답 지연(ms)')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='전송 호출에 429를 돌려줄 확률')
+    parser.add_argument('--retry-after', type=int, default=1, help='429 응답의 retry_after(초)')
+    parser.add_argument('--workers', type=int, default=8, help='MAX_CONCURRENT_UPDATES')
+    parser.add_argument('--media-group-window', type=float, default=0.2, help='앨범 수집 시간(초)')
+    parser.add_argument('--rate-limits', action='store_true', help='텔레그램 전송 제한을 그대로 적용')
+    parser.add_argument('--digest-window', type=float, default=0.0,
+                        help='매핑된 봇의 텍스트 메시지를 묶어 보낼 시간(초, 0이면 묶지 않음)')
+    parser.add_argument('--text-ratio', type=float, default=None,
+                        help='텍스트 메시지 비율 (나머지 종류는 기본 비율대로 나눔)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=120.0, help='전체 제한 시간(초)')
+    parser.add_argument('--min-throughput', type=float, default=0.0, help='이보다 느리면 실패 (메시지/초)')
+    parser.add_argument('--json', action='store_true', help='결과를 JSON으로 출력')
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    result = asyncio.run(run_benchmark(args))
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        print("=== 포워더 벤치마크 ===")
+        print(f"업데이트: {result['updates']}개 (포워딩 대상 {result['expected']}개)")
+        print(f"포워딩 완료: {result['forwarded']}개 / {result['elapsed_seconds']:.2f}초")
+        print(f"처리량: {result['messages_per_second']:.1f} 메시지/초")
+        print(f"지연 시간: p50 {result['latency_p50_ms']:.1f}ms, p99 {result['latency_p99_ms']:.1f}ms")
+        print(f"메시지당 API 호출: {result['api_calls_per_message']:.2f} (429 주입 {result['injected_429']}회)")
+        print(f"최대 RSS: {result['peak_rss_mb']:.1f}MB")
+
+    failed = result['timed_out'] or result['forwarded'] < result['expected']
+    if args.min_throughput and result['messages_per_second'] < args.min_throughput:
+        print(f"❌ 처리량이 기준({args.min_throughput} 메시지/초)보다 낮습니다.")
+        failed = True
+    if result['timed_out']:
+        print("❌ 제한 시간 안에 모든 메시지가 포워딩되지 않았습니다.")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
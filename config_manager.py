@@ -1,11 +1,142 @@
+import csv
+import io
 import json
 import os
+import re
 from typing import Dict, List, Optional
 
+from dotenv import load_dotenv
+
+from digest import parse_digest
+from mapping_store import MappingRecord, MappingStore, SqliteMappingStore
+from persistence import atomic_write_json
+
+# CSV 가져오기/내보내기 열 (extra_targets, digest 등은 JSON으로만 주고받음)
+CSV_FIELDS = ('source_bot_username', 'target_topic_id', 'description', 'source_bot_id')
+USERNAME_PATTERN = re.compile(r'\w+')
+
+
+class MappingImportError(ValueError):
+    """가져올 매핑 문서의 오류 (errors에 항목별 오류 목록)"""
+
+    def __init__(self, errors: List[str]):
+        super().__init__('\n'.join(errors))
+        self.errors = errors
+
+
+def detect_format(filename: str = '', content: str = '') -> str:
+    """파일 이름이나 내용으로 문서 형식 판별 ('json' 또는 'csv')"""
+    if filename.lower().endswith('.csv'):
+        return 'csv'
+    if filename.lower().endswith('.json'):
+        return 'json'
+    stripped = content.lstrip('\ufeff \t\r\n')
+    return 'csv' if stripped and stripped[0] not in '[{' else 'json'
+
+
+def read_mapping_document(content: str, fmt: str) -> List[Dict]:
+    """JSON/CSV 문서에서 매핑 항목 목록 읽기
+
+    JSON은 항목 목록 또는 bot_mappings 목록이 있는 객체(bot_mapping.json 형식)를 받고,
+    CSV는 첫 줄이 열 이름(source_bot_username, target_topic_id, description, source_bot_id)이어야 합니다.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(io.StringIO(content.lstrip('\ufeff')))
+        if not reader.fieldnames or 'source_bot_username' not in reader.fieldnames:
+            raise MappingImportError(["CSV 첫 줄에 source_bot_username, target_topic_id 열 이름이 필요합니다."])
+        return [
+            {field: row[field] for field in CSV_FIELDS if row.get(field) not in (None, '')}
+            for row in reader
+        ]
+
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError as e:
+        raise MappingImportError([f"JSON 파싱 오류: {e}"])
+    if isinstance(data, dict):
+        data = data.get('bot_mappings')
+    if not isinstance(data, list):
+        raise MappingImportError(["JSON은 매핑 목록이거나 bot_mappings 목록이 있는 객체여야 합니다."])
+    return data
+
+
+def validate_mappings(entries: List) -> List[Dict]:
+    """매핑 항목 전체를 검사하고 파일 형식으로 정리 (오류가 하나라도 있으면 아무것도 반영하지 않도록 예외)"""
+    errors = []
+    validated = []
+    seen = set()
+    for number, entry in enumerate(entries, 1):
+        if not isinstance(entry, dict):
+            errors.append(f"{number}번: 항목이 객체가 아닙니다.")
+            continue
+        username = str(entry.get('source_bot_username') or '').strip().replace('@', '')
+        if not USERNAME_PATTERN.fullmatch(username):
+            errors.append(f"{number}번: 잘못된 봇 사용자명 '{entry.get('source_bot_username')}'")
+            continue
+        if username.lower() in seen:
+            errors.append(f"{number}번: @{username}이 문서에 두 번 이상 있습니다.")
+            continue
+        seen.add(username.lower())
+
+        try:
+            mapping = {'source_bot_username': username, 'target_topic_id': int(entry['target_topic_id'])}
+        except (KeyError, TypeError, ValueError):
+            errors.append(f"{number}번: @{username}의 target_topic_id가 숫자가 아닙니다.")
+            continue
+        if entry.get('description') is not None:
+            mapping['description'] = str(entry['description'])
+        try:
+            if entry.get('source_bot_id') not in (None, ''):
+                mapping['source_bot_id'] = int(entry['source_bot_id'])
+            if entry.get('extra_targets'):
+                mapping['extra_targets'] = [
+                    dict(
+                        {'target_topic_id': int(target['target_topic_id'])},
+                        **({'target_chat_id': int(target['target_chat_id'])}
+                           if target.get('target_chat_id') is not None else {})
+                    )
+                    for target in entry['extra_targets']
+                ]
+            if entry.get('digest'):
+                mapping['digest'] = parse_digest(entry['digest'])
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            errors.append(f"{number}번: @{username}의 설정이 잘못되었습니다 ({e})")
+            continue
+        validated.append(mapping)
+
+    if errors:
+        raise MappingImportError(errors)
+    return validated
+
+
+def export_mapping_document(entries: List[Dict], fmt: str = 'json') -> str:
+    """매핑 목록을 JSON/CSV 문서로 변환 (JSON은 그대로 다시 가져올 수 있는 bot_mappings 형식)"""
+    if fmt == 'csv':
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=CSV_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(entries)
+        return output.getvalue()
+    return json.dumps({'bot_mappings': entries}, ensure_ascii=False, indent=2)
+
+
 class BotMappingManager:
-    def __init__(self, config_file: str = 'bot_mapping.json'):
+    """bot_mapping.json의 기본 그룹 매핑 관리 (봇과 같은 MappingStore 사용)
+
+    mapping_db를 주면 매핑은 매핑 DB(chat_id 그룹)에 바뀐 행만 저장하고, 파일에는 나머지 설정만 저장합니다.
+    """
+
+    def __init__(self, config_file: str = 'bot_mapping.json', mapping_db: Optional[SqliteMappingStore] = None,
+                 chat_id: Optional[int] = None):
         self.config_file = config_file
+        self.mapping_db = mapping_db
+        self.chat_id = chat_id
         self.config = self.load_config()
+        entries = self.config.pop('bot_mappings', [])
+        if mapping_db is not None and mapping_db.has(chat_id):
+            self.store = mapping_db.load(chat_id)
+        else:
+            self.store = MappingStore.from_entries(entries)
     
     def load_config(self) -> Dict:
         """설정 파일 로드"""
@@ -28,8 +159,13 @@ class BotMappingManager:
     
     def save_config(self):
         """설정 파일 저장"""
-        with open(self.config_file, 'w', encoding='utf-8') as f:
-            json.dump(self.config, f, ensure_ascii=False, indent=2)
+        data = dict(self.config)
+        if self.mapping_db is not None:
+            written = self.mapping_db.save(self.chat_id, self.store)
+            print(f"✅ 매핑 DB에 {written}개 행을 기록했습니다.")
+        else:
+            data = dict({'bot_mappings': self.store.entries()}, **data)
+        atomic_write_json(self.config_file, data)
         print(f"✅ 설정이 {self.config_file}에 저장되었습니다.")
     
     def add_bot_mapping(self, bot_username: str, topic_id: int, description: str = ""):
@@ -37,19 +173,17 @@ class BotMappingManager:
         bot_username = bot_username.replace('@', '')
         
         # 기존 매핑 확인
-        for mapping in self.config['bot_mappings']:
-            if mapping['source_bot_username'] == bot_username:
-                print(f"⚠️  @{bot_username}은 이미 토픽 {mapping['target_topic_id']}에 매핑되어 있습니다.")
-                return False
+        existing = self.store.get(bot_username)
+        if existing is not None:
+            print(f"⚠️  @{existing.username}은 이미 토픽 {existing.topic_id}에 매핑되어 있습니다.")
+            return False
         
         # 새 매핑 추가
-        new_mapping = {
-            "source_bot_username": bot_username,
-            "target_topic_id": topic_id,
-            "description": description or f"@{bot_username}의 메시지를 토픽 {topic_id}로 포워딩"
-        }
-        
-        self.config['bot_mappings'].append(new_mapping)
+        self.store.put(MappingRecord(
+            bot_username,
+            topic_id,
+            description=description or f"@{bot_username}의 메시지를 토픽 {topic_id}로 포워딩"
+        ))
         print(f"✅ @{bot_username} -> 토픽 {topic_id} 매핑이 추가되었습니다.")
         return True
     
@@ -57,11 +191,10 @@ class BotMappingManager:
         """봇 매핑 제거"""
         bot_username = bot_username.replace('@', '')
         
-        for i, mapping in enumerate(self.config['bot_mappings']):
-            if mapping['source_bot_username'] == bot_username:
-                removed = self.config['bot_mappings'].pop(i)
-                print(f"✅ @{bot_username} 매핑이 제거되었습니다. (토픽 {removed['target_topic_id']})")
-                return True
+        removed = self.store.remove(bot_username)
+        if removed is not None:
+            print(f"✅ @{removed.username} 매핑이 제거되었습니다. (토픽 {removed.topic_id})")
+            return True
         
         print(f"❌ @{bot_username}에 대한 매핑을 찾을 수 없습니다.")
         return False
@@ -70,30 +203,44 @@ class BotMappingManager:
         """봇 매핑 업데이트"""
         bot_username = bot_username.replace('@', '')
         
-        for mapping in self.config['bot_mappings']:
-            if mapping['source_bot_username'] == bot_username:
-                old_topic = mapping['target_topic_id']
-                mapping['target_topic_id'] = topic_id
-                if description is not None:
-                    mapping['description'] = description
-                print(f"✅ @{bot_username} 매핑이 업데이트되었습니다. (토픽 {old_topic} -> {topic_id})")
-                return True
+        record = self.store.get(bot_username)
+        if record is not None:
+            changes = {'topic_id': topic_id}
+            if description is not None:
+                changes['description'] = description
+            self.store.put(record.replace(**changes))
+            print(f"✅ @{record.username} 매핑이 업데이트되었습니다. (토픽 {record.topic_id} -> {topic_id})")
+            return True
         
         print(f"❌ @{bot_username}에 대한 매핑을 찾을 수 없습니다.")
         return False
     
+    def import_mappings(self, content: str, fmt: str, replace: bool = False) -> Dict[str, List[str]]:
+        """JSON/CSV 문서의 매핑을 한 번에 검사해 반영 (오류가 있으면 MappingImportError, 아무것도 바꾸지 않음)"""
+        incoming = validate_mappings(read_mapping_document(content, fmt))
+        self.store, summary = self.store.merged(incoming, replace)
+        print(
+            f"✅ 가져오기 완료: 추가 {len(summary['added'])}, 변경 {len(summary['updated'])}, "
+            f"삭제 {len(summary['removed'])}, 그대로 {len(summary['unchanged'])}"
+        )
+        return summary
+    
+    def export_mappings(self, fmt: str = 'json') -> str:
+        """현재 매핑을 JSON/CSV 문서로 변환"""
+        return export_mapping_document(self.store.entries(), fmt)
+    
     def list_mappings(self):
         """모든 봇 매핑 목록 출력"""
-        if not self.config['bot_mappings']:
+        if not self.store:
             print("📝 설정된 봇 매핑이 없습니다.")
             return
         
         print("📝 현재 봇 매핑 설정:")
         print("-" * 60)
-        for i, mapping in enumerate(self.config['bot_mappings'], 1):
-            print(f"{i}. @{mapping['source_bot_username']} -> 토픽 {mapping['target_topic_id']}")
-            if mapping.get('description'):
-                print(f"   설명: {mapping['description']}")
+        for i, record in enumerate(self.store, 1):
+            print(f"{i}. @{record.username} -> 토픽 {record.topic_id}")
+            if record.description:
+                print(f"   설명: {record.description}")
         print("-" * 60)
     
     def update_settings(self, **kwargs):
@@ -113,7 +260,16 @@ class BotMappingManager:
             print(f"  {key}: {value}")
 
 def main():
-    manager = BotMappingManager()
+    # 봇과 같은 .env를 읽어 MAPPING_DB_PATH가 있으면 같은 매핑 DB를 관리
+    load_dotenv()
+    mapping_db_path = os.getenv('MAPPING_DB_PATH', '')
+    if mapping_db_path:
+        manager = BotMappingManager(
+            mapping_db=SqliteMappingStore(mapping_db_path),
+            chat_id=int(os.getenv('GROUP_CHAT_ID', 0))
+        )
+    else:
+        manager = BotMappingManager()
     
     while True:
         print("\n=== 텔레그램 봇 매핑 관리자 ===")
@@ -123,9 +279,11 @@ def main():
         print("4. 봇 매핑 삭제")
         print("5. 설정 보기/수정")
         print("6. 저장 및 종료")
+        print("7. 파일에서 매핑 가져오기 (JSON/CSV)")
+        print("8. 매핑을 파일로 내보내기 (JSON/CSV)")
         print("0. 저장하지 않고 종료")
         
-        choice = input("\n선택하세요 (0-6): ").strip()
+        choice = input("\n선택하세요 (0-8): ").strip()
         
         if choice == '1':
             manager.list_mappings()
@@ -147,7 +305,7 @@ def main():
         
         elif choice == '3':
             manager.list_mappings()
-            if not manager.config['bot_mappings']:
+            if not manager.store:
                 continue
             
             bot_username = input("수정할 봇 사용자명: ").strip()
@@ -165,7 +323,7 @@ def main():
         
         elif choice == '4':
             manager.list_mappings()
-            if not manager.config['bot_mappings']:
+            if not manager.store:
                 continue
             
             bot_username = input("삭제할 봇 사용자명: ").strip()
@@ -196,6 +354,33 @@ def main():
             print("👋 설정이 저장되었습니다. 프로그램을 종료합니다.")
             break
         
+        elif choice == '7':
+            path = input("가져올 파일 경로: ").strip()
+            if not path:
+                continue
+            replace = input("파일에 없는 기존 매핑을 삭제할까요? (y/N): ").strip().lower() == 'y'
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    content = f.read()
+                manager.import_mappings(content, detect_format(path, content), replace)
+            except OSError as e:
+                print(f"❌ 파일을 읽을 수 없습니다: {e}")
+            except MappingImportError as e:
+                print("❌ 가져오기 실패 (아무것도 바뀌지 않았습니다):")
+                for error in e.errors:
+                    print(f"  - {error}")
+        
+        elif choice == '8':
+            path = input("내보낼 파일 경로 (.json 또는 .csv): ").strip()
+            if not path:
+                continue
+            try:
+                with open(path, 'w', encoding='utf-8', newline='') as f:
+                    f.write(manager.export_mappings(detect_format(path)))
+                print(f"✅ 매핑 {len(manager.store)}개를 {path}에 저장했습니다.")
+            except OSError as e:
+                print(f"❌ 파일을 쓸 수 없습니다: {e}")
+        
         elif choice == '0':
             print("👋 설정을 저장하지 않고 종료합니다.")
             break
@@ -0,0 +1,142 @@
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# inotify 이벤트 마스크 (linux/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def _load_inotify():
+    """libc의 inotify 함수 로드 (리눅스가 아니면 None)"""
+    if not hasattr(os, 'O_NONBLOCK'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class ConfigFileWatcher:
+    """설정 파일 변경 감시 (inotify 사용, 지원되지 않으면 주기적 stat 폴링)
+
+    파일이 바뀌면 debounce초 동안 추가 변경을 기다린 뒤 on_change를 한 번 호출합니다.
+    원자적 저장(임시 파일 + rename)도 감지할 수 있도록 디렉터리를 감시합니다.
+    signature를 주면 파일 대신 그 값(예: SQLite data_version)을 폴링해 변경을 감지합니다.
+    """
+
+    def __init__(self, path: str, on_change: Callable[[], Awaitable[None]],
+                 poll_interval: float = 2.0, debounce: float = 0.2,
+                 signature: Optional[Callable[[], Any]] = None):
+        self.path = os.path.abspath(path)
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self._custom_signature = signature
+        self.mode = None
+        self._fd: Optional[int] = None
+        self._changed: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _signature(self):
+        if self._custom_signature is not None:
+            return self._custom_signature()
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def _start_inotify(self, loop) -> bool:
+        libc = _load_inotify()
+        if libc is None:
+            return False
+
+        fd = libc.inotify_init1(os.O_NONBLOCK | getattr(os, 'O_CLOEXEC', 0))
+        if fd < 0:
+            return False
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        if libc.inotify_add_watch(fd, os.path.dirname(self.path).encode(), mask) < 0:
+            os.close(fd)
+            return False
+
+        self._fd = fd
+        loop.add_reader(fd, self._read_events)
+        return True
+
+    def _read_events(self):
+        try:
+            buffer = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+
+        target = os.path.basename(self.path).encode()
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(buffer):
+            _, _, _, name_length = _EVENT_HEADER.unpack_from(buffer, offset)
+            start = offset + _EVENT_HEADER.size
+            name = buffer[start:start + name_length].rstrip(b'\0')
+            offset = start + name_length
+            if name == target:
+                self._changed.set()
+
+    async def _poll(self, signature):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            current = self._signature()
+            if current != signature:
+                signature = current
+                self._changed.set()
+
+    async def _run(self, poll_task: Optional[asyncio.Task]):
+        try:
+            while True:
+                await self._changed.wait()
+                # 연속된 쓰기가 끝날 때까지 잠시 대기
+                await asyncio.sleep(self.debounce)
+                self._changed.clear()
+                try:
+                    await self.on_change()
+                except Exception as e:
+                    logger.error(f"설정 파일 다시 로드 중 오류: {e}")
+        finally:
+            if poll_task:
+                poll_task.cancel()
+
+    def start(self):
+        """감시 시작 (실행 중인 이벤트 루프 안에서 호출)"""
+        loop = asyncio.get_running_loop()
+        self._changed = asyncio.Event()
+        use_inotify = self._custom_signature is None and self._start_inotify(loop)
+        self.mode = 'inotify' if use_inotify else 'polling'
+        poll_task = None
+        if self.mode == 'polling':
+            poll_task = asyncio.create_task(self._poll(self._signature()))
+        self._task = asyncio.create_task(self._run(poll_task))
+        logger.info(f"👀 설정 파일 감시 시작 ({self.mode}): {self.path}")
+
+    async def stop(self):
+        """감시 중지"""
+        if self._fd is not None:
+            asyncio.get_running_loop().remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = None
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
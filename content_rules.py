@@ -0,0 +1,230 @@
+import logging
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from aho_corasick import AhoCorasick
+from copy_engine import MESSAGE_TYPES, message_type
+
+logger = logging.getLogger(__name__)
+
+# 규칙 종류 (규칙 하나에 하나만 지정)
+RULE_KINDS = ('keyword', 'regex', 'hashtag', 'media_type')
+HASHTAG_PATTERN = re.compile(r'#(\w+)')
+# 합친 정규식에서 다른 규칙의 그룹을 가리키게 되는 구문 (번호 역참조, 이름 역참조, 조건부 그룹)
+GROUP_REFERENCE_PATTERN = re.compile(r'(?<!\\)(?:\\\\)*\\[1-9]|\(\?P=|\(\?\(')
+
+
+class RuleError(ValueError):
+    """잘못된 내용 규칙"""
+
+
+def rule_kind(rule: Dict) -> str:
+    """규칙 종류 (keyword, regex, hashtag, media_type 중 하나)"""
+    return next(kind for kind in RULE_KINDS if kind in rule)
+
+
+def wrap_regex(pattern: str, index: int, case_sensitive: bool = False) -> str:
+    """합친 정규식에 넣을 규칙 하나의 조각 (이름 붙은 전방 탐색, 대소문자 무시는 규칙마다 지역 플래그로)"""
+    return f"(?=(?P<r{index}>(?{'' if case_sensitive else 'i'}:{pattern})))"
+
+
+def check_regex(pattern: str, case_sensitive: bool = False):
+    """정규식 규칙이 다른 규칙과 합쳐도 같은 뜻으로 컴파일되는지 검사 (아니면 RuleError)"""
+    try:
+        compiled = re.compile(pattern)
+    except re.error as e:
+        raise RuleError(f"잘못된 정규식 '{pattern}': {e}")
+    if compiled.groupindex:
+        raise RuleError(f"정규식 '{pattern}'에는 이름 붙은 그룹 (?P<...>)을 쓸 수 없습니다.")
+    if GROUP_REFERENCE_PATTERN.search(pattern):
+        raise RuleError(f"정규식 '{pattern}'에는 역참조(\\1, (?P=...))나 조건부 그룹을 쓸 수 없습니다.")
+    try:
+        # 합칠 때와 같은 형태로 감싸서 컴파일 - (?i) 같은 전역 플래그는 여기서 걸러짐
+        re.compile(wrap_regex(pattern, 0, case_sensitive))
+    except re.error:
+        raise RuleError(
+            f"정규식 '{pattern}'에는 (?i) 같은 전역 플래그를 쓸 수 없습니다 "
+            f"(대소문자 구분은 case_sensitive로 지정)."
+        )
+
+
+def normalize_rule(entry: Dict) -> Dict:
+    """파일/명령어로 받은 규칙을 검사하고 저장 형식으로 정리"""
+    kinds = [kind for kind in RULE_KINDS if entry.get(kind)]
+    if len(kinds) != 1:
+        raise RuleError("규칙에는 keyword, regex, hashtag, media_type 중 하나만 지정해야 합니다.")
+    kind = kinds[0]
+    pattern = str(entry[kind]).strip()
+
+    if kind == 'regex':
+        check_regex(pattern, bool(entry.get('case_sensitive')))
+    elif kind == 'hashtag':
+        pattern = pattern.lstrip('#')
+        if not re.fullmatch(r'\w+', pattern):
+            raise RuleError(f"잘못된 해시태그: {entry[kind]}")
+    elif kind == 'media_type' and pattern not in MESSAGE_TYPES:
+        raise RuleError(f"알 수 없는 미디어 타입 '{pattern}' (사용 가능: {', '.join(MESSAGE_TYPES)})")
+
+    try:
+        topic_id = int(entry['target_topic_id'])
+    except (KeyError, TypeError, ValueError):
+        raise RuleError("규칙에는 숫자 target_topic_id가 필요합니다.")
+
+    rule = {kind: pattern, 'target_topic_id': topic_id}
+    if kind == 'regex' and entry.get('case_sensitive'):
+        rule['case_sensitive'] = True
+    if entry.get('source_bot_username'):
+        rule['source_bot_username'] = entry['source_bot_username'].replace('@', '')
+    if entry.get('description'):
+        rule['description'] = entry['description']
+    return rule
+
+
+def parse_rules(entries: Iterable[Dict]) -> List[Dict]:
+    """파일의 규칙 목록 검사 (잘못된 규칙은 로그를 남기고 건너뜀)"""
+    rules = []
+    for number, entry in enumerate(entries, 1):
+        try:
+            rules.append(normalize_rule(entry))
+        except RuleError as e:
+            logger.error(f"내용 규칙 {number}번을 건너뜁니다: {e}")
+    return rules
+
+
+class CompiledRules:
+    """규칙 목록을 종류별 매처 하나씩으로 컴파일
+
+    키워드는 Aho-Corasick 오토마톤 하나, 정규식은 합친 정규식 하나,
+    해시태그와 미디어 타입은 딕셔너리 조회로 처리하므로 메시지마다 규칙을 순회하지 않습니다.
+    여러 규칙이 일치하면 번호가 가장 작은(파일에서 먼저 나온) 규칙이 선택됩니다.
+    """
+
+    def __init__(self, indexed_rules: List[Tuple[int, Dict]]):
+        keywords: List[Tuple[str, int]] = []
+        regexes: List[Tuple[str, int, bool]] = []
+        self._hashtags: Dict[str, int] = {}
+        self._media_types: Dict[str, int] = {}
+
+        for index, rule in indexed_rules:
+            kind = rule_kind(rule)
+            if kind == 'keyword':
+                keywords.append((rule['keyword'].lower(), index))
+            elif kind == 'regex':
+                regexes.append((rule['regex'], index, bool(rule.get('case_sensitive'))))
+            elif kind == 'hashtag':
+                self._hashtags.setdefault(rule['hashtag'].lower(), index)
+            else:
+                self._media_types.setdefault(rule['media_type'], index)
+
+        self._keyword_matcher = AhoCorasick(pattern for pattern, _ in keywords) if keywords else None
+        self._keyword_rules = [index for _, index in keywords]
+
+        # 각 정규식을 이름 붙은 전방 탐색으로 감싸 합침 - 위치마다 가장 앞선 규칙이 잡히고
+        # 폭이 0인 일치라 겹치는 위치의 일치도 놓치지 않음
+        self._regex = None
+        self._separate_regexes: List[Tuple[int, re.Pattern]] = []
+        if regexes:
+            try:
+                self._regex = re.compile(
+                    '|'.join(wrap_regex(pattern, index, case_sensitive) for pattern, index, case_sensitive in regexes)
+                )
+            except re.error as e:
+                # 합칠 수 없는 규칙이 섞여 있으면 규칙마다 따로 컴파일해 순서대로 검사
+                logger.warning(f"정규식 규칙을 하나로 합칠 수 없어 규칙별로 검사합니다: {e}")
+                for pattern, index, case_sensitive in regexes:
+                    try:
+                        self._separate_regexes.append(
+                            (index, re.compile(pattern, 0 if case_sensitive else re.IGNORECASE))
+                        )
+                    except re.error as e:
+                        logger.error(f"정규식 규칙 '{pattern}'을 건너뜁니다: {e}")
+                self._separate_regexes.sort(key=lambda item: item[0])
+
+        # 종류별 가장 앞선 규칙 번호 (이미 더 앞선 규칙을 찾았으면 그 종류는 검사하지 않음)
+        self._first = {
+            'keyword': min(self._keyword_rules, default=None),
+            'regex': min((index for _, index, _ in regexes), default=None),
+            'hashtag': min(self._hashtags.values(), default=None),
+            'media_type': min(self._media_types.values(), default=None)
+        }
+
+    def _worth_checking(self, kind: str, best: Optional[int]) -> bool:
+        first = self._first[kind]
+        return first is not None and (best is None or first < best)
+
+    def match(self, message, text: str, best: Optional[int] = None) -> Optional[int]:
+        """일치하는 규칙 중 가장 앞선 번호 (best보다 앞선 것이 없으면 best 그대로)"""
+        if self._worth_checking('media_type', best):
+            index = self._media_types.get(message_type(message))
+            if index is not None and (best is None or index < best):
+                best = index
+
+        if text and self._worth_checking('hashtag', best):
+            for tag in HASHTAG_PATTERN.findall(text):
+                index = self._hashtags.get(tag.lower())
+                if index is not None and (best is None or index < best):
+                    best = index
+
+        if text and self._worth_checking('keyword', best):
+            for position in self._keyword_matcher.iter_matches(text.lower()):
+                index = self._keyword_rules[position]
+                if best is None or index < best:
+                    best = index
+                    if index == self._first['keyword']:
+                        break
+
+        if text and self._worth_checking('regex', best) and self._regex is None:
+            for index, regex in self._separate_regexes:
+                if best is not None and index >= best:
+                    break
+                if regex.search(text):
+                    best = index
+                    break
+        elif text and self._worth_checking('regex', best):
+            for found in self._regex.finditer(text):
+                index = int(found.lastgroup[1:])
+                if best is None or index < best:
+                    best = index
+                    if index == self._first['regex']:
+                        break
+        return best
+
+
+class ContentRouter:
+    """그룹 하나의 내용 기반 라우팅 규칙 (매핑이 바뀔 때 한 번 컴파일)
+
+    source_bot_username이 있는 규칙은 해당 봇의 메시지에만, 없는 규칙은 모든 봇에 적용됩니다.
+    메시지마다 공통 규칙 매처와 발신 봇 전용 매처를 한 번씩만 평가합니다.
+    """
+
+    def __init__(self, rules: List[Dict]):
+        self.rules = rules
+        shared = []
+        by_sender: Dict[str, List[Tuple[int, Dict]]] = {}
+        for index, rule in enumerate(rules):
+            sender = rule.get('source_bot_username')
+            if sender:
+                by_sender.setdefault(sender.lower(), []).append((index, rule))
+            else:
+                shared.append((index, rule))
+        self._shared = CompiledRules(shared) if shared else None
+        self._by_sender = {sender: CompiledRules(indexed) for sender, indexed in by_sender.items()}
+
+    def __len__(self):
+        return len(self.rules)
+
+    @property
+    def has_sender_rules(self) -> bool:
+        return bool(self._by_sender)
+
+    def topic_for(self, message, sender: Optional[str] = None) -> Optional[int]:
+        """메시지 내용에 맞는 규칙의 대상 토픽 ID (일치하는 규칙이 없으면 None)"""
+        text = message.text or message.caption or ''
+        best = None
+        if sender:
+            compiled = self._by_sender.get(sender.lower())
+            if compiled is not None:
+                best = compiled.match(message, text)
+        if self._shared is not None:
+            best = self._shared.match(message, text, best)
+        return self.rules[best]['target_topic_id'] if best is not None else None
@@ -0,0 +1,132 @@
+import logging
+import time
+from typing import Dict, List, Optional
+
+from telegram.error import BadRequest
+
+logger = logging.getLogger(__name__)
+
+# 메시지 타입 판별 순서 (Message 속성 이름)
+MESSAGE_TYPES = (
+    'text', 'photo', 'video', 'animation', 'document', 'audio', 'voice', 'video_note',
+    'sticker', 'poll', 'dice', 'venue', 'location', 'contact'
+)
+
+# copyMessage가 이 문구로 실패하면(정답을 모르는 퀴즈 등) 전달로 대체 - 다른 BadRequest는 그대로 실패
+UNCOPYABLE_ERROR = "can't be copied"
+
+
+def is_uncopyable(error: BadRequest) -> bool:
+    """복사할 수 없는 메시지라서 실패한 것인지 (다른 요청 오류와 구분)"""
+    return UNCOPYABLE_ERROR in error.message.lower()
+
+
+def message_type(message) -> str:
+    """메시지 타입 이름 (통계용)"""
+    for attribute in MESSAGE_TYPES:
+        if getattr(message, attribute, None):
+            return attribute
+    return 'other'
+
+
+class LatencyStats:
+    """타입별 전송 지연 시간 집계"""
+
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    @property
+    def average(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class CopyEngine:
+    """copyMessage/copyMessages로 메시지를 서버 측에서 복사
+
+    타입별로 메시지를 다시 만드는 대신 copy_message 한 번으로 엔티티와 미디어를
+    그대로 복사합니다. 라이브러리가 copy_messages를 지원하면 앨범처럼 묶을 수 있는
+    메시지는 한 번의 호출로 복사합니다.
+    """
+
+    def __init__(self, send_scheduler):
+        self.send_scheduler = send_scheduler
+        self.latency: Dict[str, LatencyStats] = {}
+        self.fallbacks = 0
+
+    def _observe(self, kind: str, started_at: float):
+        stats = self.latency.get(kind)
+        if stats is None:
+            stats = self.latency[kind] = LatencyStats()
+        stats.observe(time.monotonic() - started_at)
+
+    @staticmethod
+    def supports_batch(bot) -> bool:
+        """copy_messages 지원 여부 (python-telegram-bot 20.8+)"""
+        return hasattr(bot, 'copy_messages')
+
+    async def copy(self, bot, message, chat_id: int, topic_id: Optional[int]):
+        """메시지 하나를 토픽으로 복사 (복사할 수 없는 메시지는 전달)"""
+        kind = message_type(message)
+        started_at = time.monotonic()
+        try:
+            result = await self.send_scheduler.send(
+                chat_id,
+                bot.copy_message,
+                chat_id=chat_id,
+                from_chat_id=message.chat.id,
+                message_id=message.message_id,
+                message_thread_id=topic_id
+            )
+        except BadRequest as e:
+            # 정답을 모르는 퀴즈 등 복사할 수 없는 메시지만 전달로 대체 (토픽 없음 등은 재시도 대상)
+            if not is_uncopyable(e):
+                raise
+            logger.warning(f"메시지 복사 불가 - 전달로 대체: {e}")
+            self.fallbacks += 1
+            result = await self.send_scheduler.send(
+                chat_id,
+                bot.forward_message,
+                chat_id=chat_id,
+                from_chat_id=message.chat.id,
+                message_id=message.message_id,
+                message_thread_id=topic_id
+            )
+        self._observe(kind, started_at)
+        return result
+
+    async def copy_batch(self, bot, messages: List, chat_id: int, topic_id: Optional[int]) -> bool:
+        """같은 채팅의 메시지들을 copy_messages 한 번으로 복사 (지원하지 않으면 False)"""
+        if not self.supports_batch(bot):
+            return False
+
+        started_at = time.monotonic()
+        await self.send_scheduler.send(
+            chat_id,
+            bot.copy_messages,
+            chat_id=chat_id,
+            from_chat_id=messages[0].chat.id,
+            message_ids=[message.message_id for message in messages],
+            message_thread_id=topic_id
+        )
+        self._observe('batch', started_at)
+        return True
+
+    def observe_media_group(self, started_at: float):
+        """sendMediaGroup 지연 시간 기록"""
+        self._observe('media_group', started_at)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """타입별 지연 시간 통계"""
+        return {
+            kind: {'count': stats.count, 'avg': stats.average, 'max': stats.max}
+            for kind, stats in sorted(self.latency.items())
+        }
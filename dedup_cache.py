@@ -0,0 +1,125 @@
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from persistence import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+UPDATE = 'update'
+CONTENT = 'content'
+
+
+def content_hash(message) -> Optional[str]:
+    """텍스트/캡션과 미디어 file_unique_id로 만든 내용 해시 (비교할 내용이 없으면 None)"""
+    parts = [message.text or message.caption or '']
+    for attribute in ('animation', 'document', 'audio', 'video', 'voice', 'video_note', 'sticker'):
+        media = getattr(message, attribute, None)
+        if media:
+            parts.append(media.file_unique_id)
+    if message.photo:
+        parts.append(message.photo[-1].file_unique_id)
+    if not any(parts):
+        return None
+    return hashlib.sha1('\0'.join(parts).encode('utf-8')).hexdigest()
+
+
+class DedupCache:
+    """중복 업데이트/중복 내용 억제 캐시 - TTL 만료 + 용량 초과 시 오래된 항목부터 제거
+
+    (채팅 ID, 메시지 ID)가 window초 안에 다시 들어오면 같은 업데이트로,
+    content_dedup이 켜져 있으면 같은 대상 토픽으로 같은 내용이 다시 들어와도 중복으로 봅니다.
+    모든 항목의 TTL이 같으므로 삽입 순서가 곧 만료 순서입니다.
+    """
+
+    def __init__(self, window_seconds: float = 3600.0, max_entries: int = 100000, content_dedup: bool = False):
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self.content_dedup = content_dedup
+        self._entries: "OrderedDict[Tuple, float]" = OrderedDict()
+        self.suppressed = {UPDATE: 0, CONTENT: 0}
+        self.evictions = 0
+
+    def _expire(self, now: float):
+        while self._entries:
+            key, expires_at = next(iter(self._entries.items()))
+            if expires_at >= now:
+                break
+            self._entries.popitem(last=False)
+
+    def _seen(self, key: Tuple, now: float) -> bool:
+        if key in self._entries:
+            return True
+        self._entries[key] = now + self.window_seconds
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return False
+
+    def check(self, message, target_chat_id: int, topic_id: Optional[int]) -> Optional[str]:
+        """중복이면 사유('update' 또는 'content'), 처음 보는 메시지면 기록 후 None"""
+        now = time.monotonic()
+        self._expire(now)
+
+        if self._seen((UPDATE, message.chat.id, message.message_id), now):
+            self.suppressed[UPDATE] += 1
+            return UPDATE
+
+        # 앨범 항목은 캡션이 첫 항목에만 붙으므로 내용 비교에서 제외
+        if self.content_dedup and not message.media_group_id:
+            digest = content_hash(message)
+            if digest and self._seen((CONTENT, target_chat_id, topic_id, digest), now):
+                self.suppressed[CONTENT] += 1
+                return CONTENT
+        return None
+
+    def forget(self, message, target_chat_id: int, topic_id: Optional[int]):
+        """check로 기록한 항목을 되돌림 (포워딩 대기열에 넣기 전에 처리가 중단된 경우)"""
+        self._entries.pop((UPDATE, message.chat.id, message.message_id), None)
+        if self.content_dedup and not message.media_group_id:
+            digest = content_hash(message)
+            if digest:
+                self._entries.pop((CONTENT, target_chat_id, topic_id, digest), None)
+
+    def snapshot(self) -> Dict:
+        """남은 항목을 만료 시각(벽시계 기준)과 함께 저장용 딕셔너리로 변환"""
+        now = time.monotonic()
+        self._expire(now)
+        offset = time.time() - now
+        return {'entries': [[list(key), expires_at + offset] for key, expires_at in self._entries.items()]}
+
+    def save(self, path: str):
+        """현재 상태를 파일에 저장"""
+        atomic_write_json(path, self.snapshot())
+
+    def load(self, path: str) -> int:
+        """저장된 항목 복원 (만료된 항목은 버림), 복원한 항목 수 반환"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except (json.JSONDecodeError, OSError) as e:
+            logger.error(f"중복 억제 상태 파일을 읽을 수 없습니다 - 비어 있는 상태로 시작: {e}")
+            return 0
+
+        now = time.monotonic()
+        offset = time.time() - now
+        for key, expires_at in data.get('entries', []):
+            if expires_at - offset > now:
+                self._entries[tuple(key)] = expires_at - offset
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        """중복 억제 통계"""
+        return {
+            'size': len(self._entries),
+            'suppressed_updates': self.suppressed[UPDATE],
+            'suppressed_content': self.suppressed[CONTENT],
+            'evictions': self.evictions
+        }
@@ -0,0 +1,199 @@
+import asyncio
+import logging
+from bisect import bisect_right
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Sequence, Set, Tuple
+
+from telegram import MessageEntity
+
+logger = logging.getLogger(__name__)
+
+# sendMessage 한 번에 보낼 수 있는 최대 길이 (엔티티 오프셋과 같은 UTF-16 코드 단위 기준)
+MAX_MESSAGE_LENGTH = 4096
+# 합친 메시지 사이 구분자
+SEPARATOR = '\n'
+
+# 매핑의 digest 설정 기본값
+DEFAULT_DIGEST = {'window_seconds': 10.0, 'max_messages': 50, 'max_chars': MAX_MESSAGE_LENGTH}
+
+
+def parse_digest(entry: Dict) -> Dict:
+    """파일/명령어로 받은 digest 설정을 검사하고 기본값을 채움"""
+    digest = dict(DEFAULT_DIGEST)
+    digest['window_seconds'] = float(entry.get('window_seconds', digest['window_seconds']))
+    digest['max_messages'] = int(entry.get('max_messages', digest['max_messages']))
+    digest['max_chars'] = int(entry.get('max_chars', digest['max_chars']))
+    if digest['window_seconds'] <= 0 or digest['max_messages'] < 1 or digest['max_chars'] < 1:
+        raise ValueError(f"잘못된 digest 설정: {entry}")
+    return digest
+
+
+def utf16_length(text: str) -> int:
+    """텔레그램이 길이와 엔티티 오프셋을 세는 UTF-16 코드 단위 길이"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _shift_entity(entity: MessageEntity, offset: int, length: int) -> MessageEntity:
+    data = entity.to_dict()
+    data.update(offset=offset, length=length)
+    return MessageEntity.de_json(data, None)
+
+
+def split_text(text: str, entities: Sequence[MessageEntity] = (),
+               limit: int = MAX_MESSAGE_LENGTH) -> List[Tuple[str, List[MessageEntity]]]:
+    """limit보다 긴 텍스트를 줄바꿈 > 공백 > 글자 경계 순으로 나누고 엔티티도 조각에 맞게 자름"""
+    # 글자 i 앞까지의 UTF-16 길이 (서로게이트 쌍이 둘로 나뉘지 않도록 글자 단위로 자름)
+    offsets = [0]
+    for char in text:
+        offsets.append(offsets[-1] + (2 if ord(char) > 0xFFFF else 1))
+    if offsets[-1] <= limit:
+        return [(text, list(entities))]
+
+    pieces = []
+    start = 0
+    while start < len(text):
+        end = bisect_right(offsets, offsets[start] + limit) - 1
+        resume = end
+        if end < len(text):
+            for separator in ('\n', ' '):
+                cut = text.rfind(separator, start + 1, end + 1)
+                if cut > start:
+                    # 나눈 자리의 구분자는 어느 조각에도 넣지 않음
+                    end, resume = cut, cut + 1
+                    break
+        low, high = offsets[start], offsets[end]
+        piece_entities = []
+        for entity in entities:
+            entity_start = max(entity.offset, low)
+            entity_end = min(entity.offset + entity.length, high)
+            if entity_end > entity_start:
+                piece_entities.append(_shift_entity(entity, entity_start - low, entity_end - entity_start))
+        pieces.append((text[start:end], piece_entities))
+        start = resume
+    return pieces
+
+
+class DigestDeliveryError(Exception):
+    """묶음 메시지 일부만 전송됨 (delivered는 모든 조각이 전송된 앞쪽 원본 메시지 수)"""
+
+    def __init__(self, error: Exception, delivered: int):
+        super().__init__(str(error))
+        self.error = error
+        self.delivered = delivered
+
+
+def merge_texts(parts: Sequence[Tuple[str, Sequence[MessageEntity]]],
+                limit: int = MAX_MESSAGE_LENGTH) -> List[Tuple[str, List[MessageEntity], int]]:
+    """여러 텍스트를 구분자로 이어 붙여 limit 이하의 메시지들로 묶음
+
+    메시지 경계에서 먼저 나누므로 원래 메시지가 limit 이하면 중간에서 잘리지 않고,
+    엔티티 오프셋은 합친 텍스트 기준으로 옮겨집니다.
+    각 묶음의 세 번째 값은 그 묶음까지 보내면 전부 전송되는 앞쪽 원본 텍스트 수입니다.
+    """
+    separator_length = utf16_length(SEPARATOR)
+    chunks = []
+    texts: List[str] = []
+    chunk_entities: List[MessageEntity] = []
+    length = 0
+    completed = 0
+    for text, entities in parts:
+        for piece, piece_entities in split_text(text, entities, limit):
+            piece_length = utf16_length(piece)
+            if texts and length + separator_length + piece_length > limit:
+                chunks.append((''.join(texts), chunk_entities, completed))
+                texts, chunk_entities, length = [], [], 0
+            if texts:
+                texts.append(SEPARATOR)
+                length += separator_length
+            chunk_entities.extend(
+                _shift_entity(entity, entity.offset + length, entity.length) for entity in piece_entities
+            )
+            texts.append(piece)
+            length += piece_length
+        completed += 1
+    if texts:
+        chunks.append((''.join(texts), chunk_entities, completed))
+    return chunks
+
+
+class _PendingDigest:
+    __slots__ = ('topic_key', 'items', 'chars', 'timer')
+
+    def __init__(self, topic_key: Hashable):
+        self.topic_key = topic_key
+        self.items: List[Any] = []
+        self.chars = 0
+        self.timer = None
+
+
+class DigestCollector:
+    """발신 봇 하나가 같은 토픽으로 연달아 보낸 텍스트 메시지를 모아 한 번에 전달
+
+    첫 항목이 들어온 뒤 window_seconds초가 지나거나 max_messages개 또는 max_chars자가 모이면
+    on_flush(topic_key, items)를 호출합니다. 같은 토픽에 다른 메시지를 보내기 전에는
+    flush_topic으로 먼저 비워야 토픽 안의 메시지 순서가 유지됩니다.
+    """
+
+    def __init__(self, on_flush: Callable[[Hashable, List[Any]], Awaitable[None]]):
+        self.on_flush = on_flush
+        self._digests: Dict[Hashable, _PendingDigest] = {}
+        self._flushing: Set[asyncio.Task] = set()
+        self.digests = 0
+        self.items = 0
+
+    async def add(self, digest_key: Hashable, topic_key: Hashable, item: Any, chars: int, settings: Dict):
+        """텍스트 메시지 항목 추가 (settings는 매핑의 digest 설정)"""
+        # 같은 토픽에 다른 봇의 묶음이 있으면 먼저 전달
+        for other_key in [key for key, digest in self._digests.items()
+                          if digest.topic_key == topic_key and key != digest_key]:
+            await self._flush(other_key)
+
+        digest = self._digests.get(digest_key)
+        if digest is None:
+            digest = self._digests[digest_key] = _PendingDigest(topic_key)
+            loop = asyncio.get_running_loop()
+            digest.timer = loop.call_later(settings['window_seconds'], self._start_flush, digest_key)
+        digest.items.append(item)
+        digest.chars += chars
+        self.items += 1
+
+        if len(digest.items) >= settings['max_messages'] or digest.chars >= settings['max_chars']:
+            await self._flush(digest_key)
+
+    def _start_flush(self, digest_key: Hashable):
+        # 타이머로 시작한 전달도 flush_all이 기다릴 수 있도록 기록
+        task = asyncio.ensure_future(self._flush(digest_key))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def _flush(self, digest_key: Hashable):
+        digest = self._digests.pop(digest_key, None)
+        if digest is None:
+            return
+        if digest.timer:
+            digest.timer.cancel()
+        self.digests += 1
+        try:
+            await self.on_flush(digest.topic_key, digest.items)
+        except Exception as e:
+            logger.error(f"묶음 메시지 전달 중 오류: {e}")
+
+    async def flush_topic(self, topic_key: Hashable):
+        """해당 토픽으로 갈 묶음을 즉시 전달"""
+        for digest_key in [key for key, digest in self._digests.items() if digest.topic_key == topic_key]:
+            await self._flush(digest_key)
+
+    async def flush_all(self):
+        """모아 둔 모든 묶음을 즉시 전달하고 전달 중인 묶음도 끝날 때까지 대기 (종료 시 호출)"""
+        for digest_key in list(self._digests):
+            await self._flush(digest_key)
+        if self._flushing:
+            await asyncio.gather(*self._flushing, return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        """메시지 묶음 통계"""
+        return {
+            'pending': len(self._digests),
+            'digests': self.digests,
+            'items': self.items,
+            'saved_calls': self.items - self.digests
+        }
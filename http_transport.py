@@ -0,0 +1,44 @@
+import logging
+import os
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+
+def http2_available() -> bool:
+    """HTTP/2 사용 가능 여부 (httpx[http2], 즉 h2 패키지 설치 여부)"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def request_settings(pool_size: int) -> Dict:
+    """환경 변수에서 HTTPXRequest 설정 읽기 (풀 크기는 용도별로 지정)"""
+    # 지정하지 않으면 h2 패키지가 있을 때 HTTP/2 사용 (HTTP_VERSION=1.1로 끌 수 있음)
+    http_version = os.getenv('HTTP_VERSION') or ('2' if http2_available() else '1.1')
+    if http_version in ('2', '2.0') and not http2_available():
+        logger.warning("HTTP/2를 사용하려면 python-telegram-bot[http2]가 필요합니다 - HTTP/1.1을 사용합니다.")
+        http_version = '1.1'
+
+    return {
+        'connection_pool_size': pool_size,
+        'pool_timeout': float(os.getenv('HTTP_POOL_TIMEOUT', 10)),
+        'connect_timeout': float(os.getenv('HTTP_CONNECT_TIMEOUT', 5)),
+        'read_timeout': float(os.getenv('HTTP_READ_TIMEOUT', 5)),
+        'write_timeout': float(os.getenv('HTTP_WRITE_TIMEOUT', 5)),
+        'http_version': http_version
+    }
+
+
+def build_bot_requests(metrics):
+    """전송용/getUpdates용으로 분리된 요청 객체 생성
+
+    getUpdates 롱 폴링은 연결 하나를 계속 붙잡고 있으므로 전송과 같은 풀을 쓰면
+    몰려오는 전송이 풀을 기다리게 됩니다. 두 풀을 분리하고 전송 풀 크기는
+    HTTP_POOL_SIZE로 조절합니다.
+    """
+    send_request = metrics.request('send', **request_settings(int(os.getenv('HTTP_POOL_SIZE', 256))))
+    updates_request = metrics.request('updates', **request_settings(1))
+    return send_request, updates_request
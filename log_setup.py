@@ -0,0 +1,91 @@
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+from datetime import datetime, timezone
+from typing import Optional
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# LogRecord 기본 속성 (이 외의 속성은 extra로 넘긴 구조화 필드)
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'sampled'}
+
+
+class JsonFormatter(logging.Formatter):
+    """한 줄짜리 JSON 로그 포맷 (extra 필드 포함)"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """extra={'sampled': True}로 표시된 메시지별 로그는 일부만 기록"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, 'sampled', False):
+            return self.rate >= 1.0 or random.random() < self.rate
+        return True
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """레코드를 포맷하지 않고 그대로 큐에 넣는 QueueHandler
+
+    기본 QueueHandler는 호출한 스레드(이벤트 루프)에서 메시지를 포맷하므로,
+    같은 프로세스 안의 큐에서는 포맷까지 리스너 스레드로 미룹니다.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging() -> Optional[logging.handlers.QueueListener]:
+    """환경 변수에 따라 로깅 구성
+
+    LOG_FORMAT=text|json, LOG_LEVEL, LOG_SAMPLE_RATE(메시지별 디버그 로그 비율),
+    LOG_ASYNC=true 이면 로그 출력은 별도 스레드(QueueListener)에서 처리합니다.
+    비동기 모드일 때 반환되는 리스너는 종료 시 stop()해야 합니다.
+    """
+    level = getattr(logging, os.getenv('LOG_LEVEL', 'INFO').upper(), logging.INFO)
+    stream_handler = logging.StreamHandler()
+    if os.getenv('LOG_FORMAT', 'text').lower() == 'json':
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    sampling_filter = SamplingFilter(float(os.getenv('LOG_SAMPLE_RATE', 0.01)))
+    listener = None
+    if os.getenv('LOG_ASYNC', 'true').lower() == 'true':
+        queue_handler = DeferredQueueHandler(queue.SimpleQueue())
+        queue_handler.addFilter(sampling_filter)
+        root.addHandler(queue_handler)
+        listener = logging.handlers.QueueListener(queue_handler.queue, stream_handler, respect_handler_level=True)
+        listener.start()
+    else:
+        stream_handler.addFilter(sampling_filter)
+        root.addHandler(stream_handler)
+
+    # httpx는 요청마다 INFO 로그를 남기므로 경고 이상만 기록
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    return listener
@@ -0,0 +1,347 @@
+import json
+import logging
+import sqlite3
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from digest import parse_digest
+
+logger = logging.getLogger(__name__)
+
+# SQLite 매핑 저장소의 행 위치 간격과, 새 행을 넣을 자리가 이보다 좁으면 그룹 전체 위치를 다시 매기는 기준
+POSITION_STEP = 1024.0
+POSITION_EPSILON = 1e-6
+
+
+class MappingRecord:
+    """봇 매핑 하나 (매핑이 수만 개여도 메모리를 적게 쓰도록 __slots__ 사용)
+
+    extra_targets는 ((대상 채팅 ID 또는 None, 토픽 ID), ...), digest는 묶음 전송 설정(없으면 None)입니다.
+    레코드는 바꾸지 않고 replace로 새 레코드를 만들어 교체합니다.
+    """
+
+    __slots__ = ('username', 'topic_id', 'description', 'user_id', 'extra_targets', 'digest')
+
+    def __init__(self, username: str, topic_id: int, description: str = '', user_id: Optional[int] = None,
+                 extra_targets: Tuple[Tuple[Optional[int], int], ...] = (), digest: Optional[Dict] = None):
+        self.username = username
+        self.topic_id = topic_id
+        self.description = description
+        self.user_id = user_id
+        self.extra_targets = extra_targets
+        self.digest = digest
+
+    @classmethod
+    def from_entry(cls, entry: Dict) -> 'MappingRecord':
+        """파일 형식의 매핑 항목을 레코드로 변환 (잘못된 항목이면 KeyError/TypeError/ValueError)"""
+        username = str(entry['source_bot_username']).replace('@', '')
+        topic_id = int(entry['target_topic_id'])
+        # 기본 토픽 외에 함께 보낼 대상 (target_chat_id가 없으면 그룹의 대상 채팅)
+        extra_targets = []
+        for target in entry.get('extra_targets') or ():
+            chat_id = int(target['target_chat_id']) if target.get('target_chat_id') is not None else None
+            extra_target = (chat_id, int(target['target_topic_id']))
+            if extra_target != (None, topic_id) and extra_target not in extra_targets:
+                extra_targets.append(extra_target)
+        return cls(
+            username,
+            topic_id,
+            description=entry.get('description') or '',
+            # 한 번 확인된 봇 사용자 ID (이후에는 ID로만 라우팅)
+            user_id=int(entry['source_bot_id']) if entry.get('source_bot_id') not in (None, '') else None,
+            extra_targets=tuple(extra_targets),
+            # 연달아 오는 텍스트 메시지를 묶어 보낼 설정
+            digest=parse_digest(entry['digest']) if entry.get('digest') else None
+        )
+
+    def to_entry(self) -> Dict:
+        """파일 형식의 매핑 항목으로 변환"""
+        entry = {
+            'source_bot_username': self.username,
+            'target_topic_id': self.topic_id,
+            'description': self.description
+        }
+        if self.user_id is not None:
+            entry['source_bot_id'] = self.user_id
+        if self.extra_targets:
+            entry['extra_targets'] = [
+                dict({'target_topic_id': topic_id}, **({'target_chat_id': chat_id} if chat_id is not None else {}))
+                for chat_id, topic_id in self.extra_targets
+            ]
+        if self.digest:
+            entry['digest'] = dict(self.digest)
+        return entry
+
+    def replace(self, **changes) -> 'MappingRecord':
+        """일부 필드만 바꾼 새 레코드"""
+        fields = {name: getattr(self, name) for name in self.__slots__}
+        fields.update(changes)
+        return MappingRecord(**fields)
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, MappingRecord):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return f"MappingRecord(@{self.username} -> {self.topic_id})"
+
+
+class MappingStore:
+    """사용자명 -> 매핑 레코드 (CLI와 봇이 함께 쓰는 메모리 저장소)
+
+    삽입 순서를 유지하는 딕셔너리와 대소문자를 무시하는 사용자명 색인으로 조회/추가/삭제가 O(1)입니다.
+    봇은 매핑을 바꿀 때 copy로 복사본을 만들어 수정한 뒤 라우팅 스냅샷째 교체합니다(copy-on-write).
+    """
+
+    __slots__ = ('_records', '_keys')
+
+    def __init__(self, records: Iterable[MappingRecord] = ()):
+        self._records: Dict[str, MappingRecord] = {}
+        self._keys: Dict[str, str] = {}
+        for record in records:
+            self.put(record)
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[Dict]) -> 'MappingStore':
+        """파일 형식의 매핑 목록으로 저장소 생성 (잘못된 항목은 로그를 남기고 건너뜀)"""
+        store = cls()
+        for number, entry in enumerate(entries, 1):
+            try:
+                store.put(MappingRecord.from_entry(entry))
+            except (AttributeError, KeyError, TypeError, ValueError) as e:
+                logger.error(f"봇 매핑 {number}번을 건너뜁니다: {e}")
+        return store
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, username) -> bool:
+        return str(username).replace('@', '').lower() in self._keys
+
+    def __iter__(self) -> Iterator[MappingRecord]:
+        return iter(self._records.values())
+
+    def __eq__(self, other):
+        if not isinstance(other, MappingStore):
+            return NotImplemented
+        return list(self._records.items()) == list(other._records.items())
+
+    def get(self, username: str) -> Optional[MappingRecord]:
+        """사용자명으로 레코드 조회 (@와 대소문자 무시)"""
+        key = self._keys.get(username.replace('@', '').lower())
+        return self._records[key] if key is not None else None
+
+    def usernames(self) -> List[str]:
+        return list(self._records)
+
+    def put(self, record: MappingRecord):
+        """레코드 추가 또는 교체 (같은 사용자명이 있으면 그 자리에서 교체)"""
+        key = record.username.lower()
+        existing = self._keys.get(key)
+        if existing is not None and existing != record.username:
+            # 대소문자만 다른 사용자명이면 기존 위치를 유지하며 이름도 바꿈
+            self._records = {
+                (record.username if name == existing else name): (record if name == existing else value)
+                for name, value in self._records.items()
+            }
+        else:
+            self._records[record.username] = record
+        self._keys[key] = record.username
+
+    def rename(self, username: str, new_username: str):
+        """사용자명 변경 (목록에서의 위치는 유지)"""
+        key = self._keys.pop(username.replace('@', '').lower())
+        self._records = {
+            (new_username if name == key else name): (record.replace(username=new_username) if name == key else record)
+            for name, record in self._records.items()
+        }
+        self._keys[new_username.lower()] = new_username
+
+    def remove(self, username: str) -> Optional[MappingRecord]:
+        """레코드 삭제 (없으면 None)"""
+        key = self._keys.pop(username.replace('@', '').lower(), None)
+        return self._records.pop(key) if key is not None else None
+
+    def copy(self) -> 'MappingStore':
+        """레코드는 공유하는 얕은 복사본"""
+        store = MappingStore()
+        store._records = dict(self._records)
+        store._keys = dict(self._keys)
+        return store
+
+    def entries(self) -> List[Dict]:
+        """파일 형식의 매핑 목록"""
+        return [record.to_entry() for record in self._records.values()]
+
+    def merged(self, entries: List[Dict], replace: bool = False) -> Tuple['MappingStore', Dict[str, List[str]]]:
+        """파일 형식 항목들을 반영한 새 저장소와 변경 요약 반환
+
+        항목에 없는 필드(확인된 source_bot_id 등)는 기존 값을 유지하고,
+        replace면 entries에 없는 기존 매핑을 삭제합니다.
+        요약은 added, updated, unchanged, removed 키에 사용자명 목록을 담습니다.
+        """
+        summary = {'added': [], 'updated': [], 'unchanged': [], 'removed': []}
+        store = self.copy()
+        incoming = set()
+        for entry in entries:
+            existing = self.get(entry['source_bot_username'])
+            if existing is None:
+                entry = dict(entry)
+                entry.setdefault(
+                    'description',
+                    f"@{entry['source_bot_username']}의 메시지를 토픽 {entry['target_topic_id']}로 포워딩"
+                )
+                record = MappingRecord.from_entry(entry)
+                summary['added'].append(record.username)
+            else:
+                merged_entry = existing.to_entry()
+                merged_entry.update(entry)
+                merged_entry['source_bot_username'] = existing.username
+                record = MappingRecord.from_entry(merged_entry)
+                if record == existing:
+                    # 바뀌지 않은 레코드는 그대로 두어 저장할 때 다시 쓰지 않음
+                    record = existing
+                    summary['unchanged'].append(existing.username)
+                else:
+                    summary['updated'].append(existing.username)
+            store.put(record)
+            incoming.add(record.username.lower())
+
+        if replace:
+            for username in self.usernames():
+                if username.lower() not in incoming:
+                    store.remove(username)
+                    summary['removed'].append(username)
+        return store, summary
+
+
+class SqliteMappingStore:
+    """그룹별 매핑을 SQLite(WAL)에 행 단위로 저장하는 저장소 (매핑이 많은 배포용)
+
+    매핑을 하나 바꿔도 JSON 파일 전체를 다시 쓰지 않고 바뀐 행만 한 트랜잭션으로 기록합니다.
+    save는 마지막으로 읽거나 저장한 내용과 레코드 값을 비교하며, 레코드를 공유하는 복사본이면 객체 동일성 확인으로 끝납니다.
+    """
+
+    def __init__(self, path: str = 'bot_mappings.db'):
+        self.path = path
+        self._lock = threading.RLock()
+        self._saved: Dict[int, MappingStore] = {}
+        self._positions: Dict[int, Dict[str, float]] = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            '''CREATE TABLE IF NOT EXISTS bot_mappings (
+                chat_id INTEGER NOT NULL,
+                username_key TEXT NOT NULL,
+                position REAL NOT NULL,
+                entry TEXT NOT NULL,
+                PRIMARY KEY (chat_id, username_key)
+            )'''
+        )
+
+    def has(self, chat_id: int) -> bool:
+        """그룹의 매핑이 저장되어 있는지"""
+        with self._lock:
+            row = self._conn.execute('SELECT 1 FROM bot_mappings WHERE chat_id = ? LIMIT 1', (chat_id,)).fetchone()
+        return row is not None
+
+    def load(self, chat_id: int) -> MappingStore:
+        """그룹의 매핑 읽기 (저장된 순서대로)"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT username_key, position, entry FROM bot_mappings WHERE chat_id = ? ORDER BY position',
+                (chat_id,)
+            ).fetchall()
+            store = MappingStore.from_entries(json.loads(entry) for _, _, entry in rows)
+            self._saved[chat_id] = store.copy()
+            self._positions[chat_id] = {key: position for key, position, _ in rows}
+        return store
+
+    def save(self, chat_id: int, store: MappingStore) -> int:
+        """그룹의 매핑 중 마지막으로 읽거나 저장한 뒤 바뀐 행만 기록, 기록한 행 수 반환
+
+        위치(순서)는 행마다 한 번 정해지고 그대로 유지되므로 중간 매핑을 지워도 다른 행은 다시 쓰지 않습니다.
+        중간에 새로 생긴 행(사용자명이 바뀐 매핑 등)은 앞뒤 행 위치의 중간값을 받고,
+        같은 자리에 계속 끼워 넣어 간격이 POSITION_EPSILON보다 좁아지면 그룹의 위치를 POSITION_STEP 간격으로 다시 매깁니다.
+        """
+        with self._lock:
+            return self._save(chat_id, store)
+
+    def _save(self, chat_id: int, store: MappingStore) -> int:
+        previous = self._saved.get(chat_id)
+        if previous is None:
+            previous = self.load(chat_id)
+        positions = dict(self._positions[chat_id])
+        deletes = [(chat_id, record.username.lower()) for record in previous if record.username not in store]
+        for _, key in deletes:
+            positions.pop(key, None)
+
+        # 각 레코드 뒤에서 가장 가까운 기존 행의 위치
+        records = list(store)
+        following: List[Optional[float]] = [None] * len(records)
+        upcoming = None
+        for i in range(len(records) - 1, -1, -1):
+            following[i] = upcoming
+            upcoming = positions.get(records[i].username.lower(), upcoming)
+
+        last = None
+        for record, after in zip(records, following):
+            key = record.username.lower()
+            if key not in positions:
+                if last is None:
+                    position = after - POSITION_STEP if after is not None else 0.0
+                elif after is None:
+                    position = last + POSITION_STEP
+                elif after - last < 2 * POSITION_EPSILON:
+                    # 끼워 넣을 자리가 없으므로 전체 위치를 다시 매김
+                    positions = {r.username.lower(): i * POSITION_STEP for i, r in enumerate(records)}
+                    break
+                else:
+                    position = (last + after) / 2
+                positions[key] = position
+            last = positions[key]
+
+        saved_positions = self._positions[chat_id]
+        upserts = []
+        moves = []
+        for record in records:
+            key = record.username.lower()
+            old = previous.get(record.username)
+            # 다시 읽은 저장소는 레코드 객체가 달라도 값이 같으면 기록하지 않음
+            if old is not record and old != record:
+                upserts.append((chat_id, key, positions[key], json.dumps(record.to_entry(), ensure_ascii=False)))
+            elif saved_positions.get(key) != positions[key]:
+                moves.append((positions[key], chat_id, key))
+
+        if upserts or deletes or moves:
+            self._conn.execute('BEGIN')
+            try:
+                self._conn.executemany('DELETE FROM bot_mappings WHERE chat_id = ? AND username_key = ?', deletes)
+                self._conn.executemany(
+                    'UPDATE bot_mappings SET position = ? WHERE chat_id = ? AND username_key = ?', moves
+                )
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO bot_mappings (chat_id, username_key, position, entry) '
+                    'VALUES (?, ?, ?, ?)',
+                    upserts
+                )
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        self._saved[chat_id] = store.copy()
+        self._positions[chat_id] = positions
+        return len(upserts) + len(deletes) + len(moves)
+
+    def data_version(self) -> int:
+        """다른 연결(설정 관리 도구 등)이 커밋할 때마다 바뀌는 값 (변경 감지용)"""
+        with self._lock:
+            return self._conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
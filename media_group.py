@@ -0,0 +1,91 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Set
+
+logger = logging.getLogger(__name__)
+
+# sendMediaGroup 한 번에 보낼 수 있는 최대 항목 수
+MAX_MEDIA_GROUP_SIZE = 10
+
+
+class _PendingGroup:
+    __slots__ = ('topic_key', 'items', 'timer')
+
+    def __init__(self, topic_key: Hashable):
+        self.topic_key = topic_key
+        self.items: List[Any] = []
+        self.timer = None
+
+
+class MediaGroupCollector:
+    """media_group_id가 같은 메시지(앨범)를 짧은 시간 동안 모아 한 번에 전달
+
+    마지막 항목이 들어온 뒤 window초가 지나거나 10개가 모이면 on_flush(topic_key, items)를
+    호출합니다. 같은 토픽에 다른 메시지를 보내기 전에는 flush_topic으로 먼저 비워야
+    토픽 안의 메시지 순서가 유지됩니다.
+    """
+
+    def __init__(self, on_flush: Callable[[Hashable, List[Any]], Awaitable[None]],
+                 window: float = 1.0, max_items: int = MAX_MEDIA_GROUP_SIZE):
+        self.on_flush = on_flush
+        self.window = window
+        self.max_items = max_items
+        self._groups: Dict[Hashable, _PendingGroup] = {}
+        self._flushing: Set[asyncio.Task] = set()
+        self.albums = 0
+        self.items = 0
+
+    async def add(self, group_key: Hashable, topic_key: Hashable, item: Any):
+        """앨범 항목 추가"""
+        group = self._groups.get(group_key)
+        if group is None:
+            group = self._groups[group_key] = _PendingGroup(topic_key)
+        group.items.append(item)
+        self.items += 1
+
+        if group.timer:
+            group.timer.cancel()
+        if len(group.items) >= self.max_items:
+            await self._flush(group_key)
+            return
+        loop = asyncio.get_running_loop()
+        group.timer = loop.call_later(self.window, self._start_flush, group_key)
+
+    def _start_flush(self, group_key: Hashable):
+        # 타이머로 시작한 전달도 flush_all이 기다릴 수 있도록 기록
+        task = asyncio.ensure_future(self._flush(group_key))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def _flush(self, group_key: Hashable):
+        group = self._groups.pop(group_key, None)
+        if group is None:
+            return
+        if group.timer:
+            group.timer.cancel()
+        self.albums += 1
+        try:
+            await self.on_flush(group.topic_key, group.items)
+        except Exception as e:
+            logger.error(f"앨범 전달 중 오류: {e}")
+
+    async def flush_topic(self, topic_key: Hashable):
+        """해당 토픽으로 갈 앨범을 즉시 전달"""
+        for group_key in [key for key, group in self._groups.items() if group.topic_key == topic_key]:
+            await self._flush(group_key)
+
+    async def flush_all(self):
+        """모아 둔 모든 앨범을 즉시 전달하고 전달 중인 앨범도 끝날 때까지 대기 (종료 시 호출)"""
+        for group_key in list(self._groups):
+            await self._flush(group_key)
+        if self._flushing:
+            await asyncio.gather(*self._flushing, return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        """앨범 묶음 통계"""
+        return {
+            'pending': len(self._groups),
+            'albums': self.albums,
+            'items': self.items,
+            'saved_calls': self.items - self.albums
+        }
@@ -0,0 +1,79 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+ADMIN_STATUSES = ('administrator', 'creator')
+
+
+class MembershipCache:
+    """채팅 멤버 권한(status) 캐시 - TTL 만료 + LRU 제거"""
+
+    def __init__(self, ttl_seconds: float = 300.0, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[int, int], Tuple[str, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, chat_id: int, user_id: int) -> Optional[str]:
+        """캐시된 권한 상태 조회 (없거나 만료되면 None)"""
+        key = (chat_id, user_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        status, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return status
+
+    def peek(self, chat_id: int, user_id: int) -> Optional[str]:
+        """캐시된 권한 상태를 적중/미스 통계와 LRU 순서에 반영하지 않고 조회 (로그용)"""
+        entry = self._entries.get((chat_id, user_id))
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        return entry[0]
+
+    def set(self, chat_id: int, user_id: int, status: str):
+        """권한 상태 저장 (용량 초과 시 가장 오래 사용되지 않은 항목 제거)"""
+        key = (chat_id, user_id)
+        self._entries[key] = (status, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, chat_id: int, user_id: int):
+        """특정 멤버의 캐시 항목 제거"""
+        self._entries.pop((chat_id, user_id), None)
+
+    async def get_status(self, bot, chat_id: int, user_id: int) -> str:
+        """캐시에서 권한을 조회하고, 없으면 get_chat_member로 가져와 저장"""
+        status = self.get(chat_id, user_id)
+        if status is None:
+            chat_member = await bot.get_chat_member(chat_id, user_id)
+            status = chat_member.status
+            self.set(chat_id, user_id, status)
+        return status
+
+    async def is_admin(self, bot, chat_id: int, user_id: int) -> bool:
+        """관리자(administrator/creator) 여부 확인"""
+        return await self.get_status(bot, chat_id, user_id) in ADMIN_STATUSES
+
+    def stats(self) -> Dict[str, float]:
+        """캐시 적중/미스 통계"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / total if total else 0.0
+        }
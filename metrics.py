@@ -0,0 +1,259 @@
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from telegram.error import TimedOut
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence, extra: str = '') -> str:
+    pairs = [
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in zip(labelnames, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """단조 증가 카운터 (라벨별)"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    """누적 버킷 히스토그램 (라벨별)"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple, List] = {}
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            # [버킷별 개수..., +Inf 개수, 합계]
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                le = 'le="{}"'.format('+Inf' if bound == float('inf') else repr(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {series[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """스크레이프 시점에 콜백으로 값을 읽는 게이지
+
+    다른 구성 요소가 이미 세고 있는 누적 값은 metric_type='counter'로 내보냅니다.
+    """
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], Iterable[Tuple[Tuple, float]]],
+                 labelnames: Sequence[str] = (), metric_type: str = 'gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self.metric_type = metric_type
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        try:
+            samples = list(self.callback())
+        except Exception as e:
+            logger.error(f"{self.name} 게이지 수집 중 오류: {e}")
+            samples = []
+        for labels, value in samples:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class MetricsRegistry:
+    """Prometheus 텍스트 형식으로 내보낼 지표 모음"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, documentation: str, callback, labelnames: Sequence[str] = (),
+              metric_type: str = 'gauge') -> Gauge:
+        metric = Gauge(name, documentation, callback, labelnames, metric_type)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class ForwarderMetrics:
+    """포워더 봇이 직접 기록하는 지표 정의"""
+
+    def __init__(self):
+        self.registry = MetricsRegistry()
+        registry = self.registry
+        self.updates_dropped = registry.counter(
+            'forwarder_updates_dropped_total', '핸들러 필터에서 버려진 업데이트 수', ['reason'])
+        self.routing_lookups = registry.counter(
+            'forwarder_routing_lookups_total', '봇 -> 토픽 라우팅 조회 수', ['result'])
+        self.forwarded = registry.counter(
+            'forwarder_messages_forwarded_total', '포워딩 완료된 메시지 수', ['bot', 'chat', 'topic'])
+        self.forward_failures = registry.counter(
+            'forwarder_forward_failures_total', '포워딩 실패 수 (재시도 포함)', ['chat', 'topic'])
+        self.forward_latency_by_topic = registry.histogram(
+            'forwarder_forward_latency_seconds', '메시지 수신부터 포워딩 완료까지 걸린 시간 (토픽별)', ['chat', 'topic'])
+        self.forward_latency_by_bot = registry.histogram(
+            'forwarder_bot_forward_latency_seconds', '메시지 수신부터 포워딩 완료까지 걸린 시간 (원본 봇별)', ['bot'])
+        self.api_calls = registry.counter(
+            'forwarder_bot_api_calls_total', 'Bot API 호출 수', ['method'])
+        self.api_errors = registry.counter(
+            'forwarder_bot_api_errors_total', 'Bot API 오류 수', ['method', 'error'])
+        self.api_latency = registry.histogram(
+            'forwarder_bot_api_latency_seconds', 'Bot API 호출 지연 시간', ['method'])
+        self.pool_wait = registry.histogram(
+            'forwarder_http_pool_wait_seconds', 'HTTP 연결 풀에서 연결을 기다린 시간', ['pool'],
+            buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+        self.pool_timeouts = registry.counter(
+            'forwarder_http_pool_timeouts_total', 'HTTP 연결 풀 대기 시간 초과 수', ['pool'])
+        self._pools: Dict[str, 'InstrumentedHTTPXRequest'] = {}
+        registry.gauge(
+            'forwarder_http_pool_in_use', '사용 중인 HTTP 연결 수',
+            lambda: [((name,), pool.in_use) for name, pool in self._pools.items()], ['pool'])
+
+    def request(self, pool: str = 'send', **kwargs) -> 'InstrumentedHTTPXRequest':
+        """Bot API 호출을 기록하는 요청 객체 생성 (pool은 지표 라벨)"""
+        request = InstrumentedHTTPXRequest(self, pool, **kwargs)
+        self._pools[pool] = request
+        return request
+
+
+class InstrumentedHTTPXRequest(HTTPXRequest):
+    """Bot API 메서드별 호출 수, 오류 수, 지연 시간과 연결 풀 대기 시간을 기록하는 HTTPXRequest
+
+    httpx는 풀 대기 시간을 알려 주지 않으므로, 풀 크기와 같은 세마포어로 동시 요청 수를
+    제한하고 그 대기 시간을 풀 대기 시간으로 기록합니다. 대기 시간이 pool_timeout을 넘으면
+    httpx와 같은 TimedOut(Pool timeout)을 발생시킵니다.
+    """
+
+    def __init__(self, metrics: ForwarderMetrics, pool: str, connection_pool_size: int = 1,
+                 pool_timeout: Optional[float] = 1.0, **kwargs):
+        super().__init__(connection_pool_size=connection_pool_size, pool_timeout=pool_timeout, **kwargs)
+        self.metrics = metrics
+        self.pool = pool
+        self.pool_size = connection_pool_size
+        self.pool_timeout = pool_timeout
+        self.in_use = 0
+        self._slots = None
+
+    async def _acquire_slot(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.pool_size)
+        started_at = time.monotonic()
+        try:
+            if self.pool_timeout is None:
+                await self._slots.acquire()
+            else:
+                await asyncio.wait_for(self._slots.acquire(), timeout=self.pool_timeout)
+        except asyncio.TimeoutError:
+            self.metrics.pool_timeouts.inc(self.pool)
+            raise TimedOut(
+                message=f"Pool timeout: '{self.pool}' 연결 풀의 연결이 모두 사용 중입니다. 요청은 전송되지 않았습니다."
+            )
+        finally:
+            self.metrics.pool_wait.observe(time.monotonic() - started_at, self.pool)
+
+    async def do_request(self, url: str, method: str, *args, **kwargs) -> Tuple[int, bytes]:
+        api_method = url.rsplit('/', 1)[-1]
+        metrics = self.metrics
+        await self._acquire_slot()
+        metrics.api_calls.inc(api_method)
+        self.in_use += 1
+        started_at = time.monotonic()
+        try:
+            status_code, payload = await super().do_request(url, method, *args, **kwargs)
+        except Exception as e:
+            metrics.api_errors.inc(api_method, type(e).__name__)
+            raise
+        finally:
+            self.in_use -= 1
+            self._slots.release()
+            metrics.api_latency.observe(time.monotonic() - started_at, api_method)
+        if status_code >= 400:
+            metrics.api_errors.inc(api_method, str(status_code))
+        return status_code, payload
+
+
+class MetricsServer:
+    """/metrics 엔드포인트를 제공하는 로컬 HTTP 서버 (tornado, 웹훅 의존성과 공유)"""
+
+    def __init__(self, registry: MetricsRegistry, port: int, address: str = '127.0.0.1'):
+        self.registry = registry
+        self.port = port
+        self.address = address
+        self._server = None
+
+    def start(self):
+        """실행 중인 이벤트 루프에서 서버 시작"""
+        from tornado.web import Application, RequestHandler
+
+        registry = self.registry
+
+        class MetricsHandler(RequestHandler):
+            def get(self):
+                self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.write(registry.render())
+
+        self._server = Application([(r'/metrics', MetricsHandler)]).listen(self.port, address=self.address)
+        logger.info(f"📈 지표 엔드포인트: http://{self.address}:{self.port}/metrics")
+
+    def stop(self):
+        if self._server:
+            self._server.stop()
+            self._server = None
+
@@ -0,0 +1,199 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class ForwardOutbox:
+    """SQLite(WAL) 기반 포워딩 대기열
+
+    포워딩을 시도하기 전에 메시지를 기록해 두고, 실패한 항목은 지수 백오프로
+    다시 시도합니다. (chat_id, message_id, 대상 채팅, topic_id)를 멱등성 키로 사용하므로
+    재시작 후 같은 업데이트를 다시 받아도 이미 전송된 메시지는 다시 보내지 않습니다.
+    한 메시지를 여러 대상으로 보내는 항목들은 첫 대상(업데이트를 처리하는 워커의 순서 키)을
+    owner로 함께 기록해, 워커를 나눠 실행해도 한 워커만 재시도하도록 합니다.
+    """
+
+    PENDING = 'pending'
+    DONE = 'done'
+    DEAD = 'dead'
+
+    def __init__(self, path: str = 'forward_outbox.db', max_attempts: int = 10,
+                 base_delay: float = 2.0, max_delay: float = 600.0):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            '''CREATE TABLE IF NOT EXISTS outbox (
+                key TEXT PRIMARY KEY,
+                chat_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                topic_id INTEGER,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )'''
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at)')
+        # 이전 버전 DB에는 대상 채팅 컬럼이 없음 (NULL이면 원본 채팅으로 전송)
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(outbox)')}
+        if 'target_chat_id' not in columns:
+            self._conn.execute('ALTER TABLE outbox ADD COLUMN target_chat_id INTEGER')
+        # 재시도를 맡을 경로 (NULL이면 항목 자신의 대상)
+        if 'owner_chat_id' not in columns:
+            self._conn.execute('ALTER TABLE outbox ADD COLUMN owner_chat_id INTEGER')
+            self._conn.execute('ALTER TABLE outbox ADD COLUMN owner_topic_id INTEGER')
+
+    @staticmethod
+    def make_key(chat_id: int, message_id: int, topic_id: Optional[int],
+                 target_chat_id: Optional[int] = None) -> str:
+        """멱등성 키 생성 (같은 그룹 안으로 포워딩하면 대상 채팅은 생략)"""
+        if target_chat_id is None or target_chat_id == chat_id:
+            return f"{chat_id}:{message_id}:{topic_id}"
+        return f"{chat_id}:{message_id}:{target_chat_id}:{topic_id}"
+
+    def _enqueue(self, chat_id, message_id, topic_id, payload, target_chat_id) -> bool:
+        return self._enqueue_many(chat_id, message_id, payload, [(target_chat_id, topic_id)])[0]
+
+    def _enqueue_many(self, chat_id, message_id, payload, targets) -> List[bool]:
+        now = time.time()
+        owner_chat_id, owner_topic_id = targets[0]
+        encoded = json.dumps(payload, ensure_ascii=False)
+        keys = [self.make_key(chat_id, message_id, topic_id, target_chat_id) for target_chat_id, topic_id in targets]
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                self._conn.executemany(
+                    'INSERT OR IGNORE INTO outbox '
+                    '(key, chat_id, message_id, topic_id, target_chat_id, payload, status, next_attempt_at, '
+                    'created_at, updated_at, owner_chat_id, owner_topic_id) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    [
+                        (key, chat_id, message_id, topic_id, target_chat_id, encoded, self.PENDING, now, now, now,
+                         owner_chat_id, owner_topic_id)
+                        for key, (target_chat_id, topic_id) in zip(keys, targets)
+                    ]
+                )
+                statuses = [
+                    self._conn.execute('SELECT status FROM outbox WHERE key = ?', (key,)).fetchone()[0]
+                    for key in keys
+                ]
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        return [status == self.PENDING for status in statuses]
+
+    def _mark_done(self, key):
+        with self._lock:
+            self._conn.execute(
+                'UPDATE outbox SET status = ?, attempts = attempts + 1, last_error = NULL, updated_at = ? WHERE key = ?',
+                (self.DONE, time.time(), key)
+            )
+
+    def _mark_failed(self, key, error) -> str:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT attempts FROM outbox WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return self.DEAD
+            attempts = row[0] + 1
+            status = self.DEAD if attempts >= self.max_attempts else self.PENDING
+            delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+            self._conn.execute(
+                'UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, updated_at = ? '
+                'WHERE key = ?',
+                (status, attempts, now + delay, str(error)[:500], now, key)
+            )
+        return status
+
+    def _due_entries(self, limit) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT key, chat_id, message_id, topic_id, target_chat_id, payload, attempts, '
+                'owner_chat_id, owner_topic_id FROM outbox '
+                'WHERE status = ? AND next_attempt_at <= ? ORDER BY created_at LIMIT ?',
+                (self.PENDING, time.time(), limit)
+            ).fetchall()
+        entries = []
+        for key, chat_id, message_id, topic_id, target_chat_id, payload, attempts, owner_chat_id, owner_topic_id in rows:
+            target_chat_id = target_chat_id if target_chat_id is not None else chat_id
+            # 재시도를 맡을 경로 (owner가 없는 이전 버전 항목은 자신의 대상)
+            if owner_chat_id is None and owner_topic_id is None:
+                owner = (target_chat_id, topic_id)
+            else:
+                owner = (owner_chat_id if owner_chat_id is not None else chat_id, owner_topic_id)
+            entries.append({
+                'key': key,
+                'chat_id': chat_id,
+                'message_id': message_id,
+                'topic_id': topic_id,
+                'target_chat_id': target_chat_id,
+                'payload': json.loads(payload),
+                'attempts': attempts,
+                'owner': owner
+            })
+        return entries
+
+    def _counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute('SELECT status, COUNT(*) FROM outbox GROUP BY status').fetchall()
+        counts = {self.PENDING: 0, self.DONE: 0, self.DEAD: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def _purge_done(self, older_than_seconds) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                'DELETE FROM outbox WHERE status = ? AND updated_at < ?',
+                (self.DONE, time.time() - older_than_seconds)
+            )
+        return cursor.rowcount
+
+    async def enqueue(self, chat_id: int, message_id: int, topic_id: Optional[int], payload: Dict,
+                      target_chat_id: Optional[int] = None) -> bool:
+        """포워딩 항목 기록 (이미 전송 완료된 항목이면 False)"""
+        return await asyncio.to_thread(self._enqueue, chat_id, message_id, topic_id, payload, target_chat_id)
+
+    async def enqueue_many(self, chat_id: int, message_id: int, payload: Dict,
+                           targets: List[Tuple[Optional[int], Optional[int]]]) -> List[bool]:
+        """한 메시지를 여러 (대상 채팅, 토픽)으로 보낼 항목을 한 트랜잭션으로 기록 (대상별로 enqueue와 같은 결과)
+
+        모든 항목의 재시도는 첫 대상의 경로가 맡습니다.
+        """
+        return await asyncio.to_thread(self._enqueue_many, chat_id, message_id, payload, targets)
+
+    async def mark_done(self, key: str):
+        """전송 완료 처리"""
+        await asyncio.to_thread(self._mark_done, key)
+
+    async def mark_failed(self, key: str, error) -> str:
+        """실패 처리 후 다음 재시도 시각 예약 (재시도 한도 초과 시 dead)"""
+        return await asyncio.to_thread(self._mark_failed, key, error)
+
+    async def due_entries(self, limit: int = 50) -> List[Dict]:
+        """재시도할 때가 된 대기 항목 조회"""
+        return await asyncio.to_thread(self._due_entries, limit)
+
+    async def counts(self) -> Dict[str, int]:
+        """상태별 항목 수"""
+        return await asyncio.to_thread(self._counts)
+
+    async def purge_done(self, older_than_seconds: float) -> int:
+        """오래된 전송 완료 항목 삭제"""
+        return await asyncio.to_thread(self._purge_done, older_than_seconds)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
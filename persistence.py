@@ -0,0 +1,106 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def atomic_write_json(path: str, data: Dict):
+    """임시 파일에 쓰고 fsync 후 rename하여 원자적으로 JSON 저장
+
+    쓰는 도중 프로세스가 죽어도 기존 파일은 손상되지 않습니다.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+    # rename 자체도 디스크에 반영되도록 디렉터리 fsync (POSIX만 지원)
+    if hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+class DebouncedJsonWriter:
+    """이벤트 루프를 막지 않고 여러 번의 저장 요청을 한 번의 쓰기로 묶는 JSON 저장기
+
+    delay초 안에 들어온 저장 요청은 마지막 데이터로 한 번만 기록되며,
+    각 요청은 해당 쓰기가 끝날 때 성공 여부를 돌려받습니다.
+    쓰기는 한 번에 하나씩만 진행되므로 오래된 데이터가 나중에 기록되는 일이 없습니다.
+    """
+
+    def __init__(self, path: str, delay: float = 0.5):
+        self.path = path
+        self.delay = delay
+        self.writes = 0
+        self.requests = 0
+        # 마지막으로 기록한 데이터 (파일 감시가 자기 저장을 다시 읽지 않도록 비교용)
+        self.last_written: Optional[Dict] = None
+        self._data: Optional[Dict] = None
+        self._result: Optional[asyncio.Future] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def save(self, data: Dict) -> bool:
+        """저장 요청 (같은 배치의 쓰기가 끝날 때까지 대기)"""
+        self.requests += 1
+        self._data = data
+        if self._result is None:
+            self._result = asyncio.get_running_loop().create_future()
+            self._task = asyncio.create_task(self._flush_later())
+        return await asyncio.shield(self._result)
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.delay)
+        await self._write_pending()
+
+    async def _write_pending(self) -> bool:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # 이전 쓰기가 끝난 뒤 그동안 모인 마지막 데이터를 기록
+        async with self._lock:
+            data, result = self._data, self._result
+            if result is None:
+                return True
+            # 쓰는 동안 들어온 요청은 다음 배치로 모음 (쓰기 시작 후에는 flush가 취소하지 않음)
+            self._data, self._result, self._task = None, None, None
+
+            try:
+                await asyncio.to_thread(atomic_write_json, self.path, data)
+                self.last_written = data
+                self.writes += 1
+                success = True
+            except Exception as e:
+                logger.error(f"{self.path} 저장 중 오류: {e}")
+                success = False
+        if not result.done():
+            result.set_result(success)
+        return success
+
+    async def flush(self) -> bool:
+        """대기 중인 저장을 즉시 기록 (종료 시 호출, 진행 중인 쓰기도 끝날 때까지 대기)"""
+        # 아직 쓰기를 시작하지 않은 배치는 대기를 취소하고 바로 기록
+        task = self._task
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        return await self._write_pending()
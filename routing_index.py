@@ -0,0 +1,246 @@
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from aho_corasick import AhoCorasick
+from content_rules import ContentRouter
+from mapping_store import MappingStore
+
+
+class RoutingIndex:
+    """봇 매핑으로부터 한 번 컴파일되는 봇 -> 토픽 라우팅 인덱스
+
+    매핑이 변경될 때만 다시 만들며, 조회 우선순위는 다음과 같습니다.
+    1. 사용자 ID 정확히 일치 (source_bot_id로 확인된 매핑)
+    2. 사용자명 정확히 일치 (대소문자 무시)
+    3. 봇 이름에 매핑된 사용자명이 포함됨 (가장 긴 사용자명 우선)
+    4. 매핑된 사용자명에 봇 이름이 포함됨 (가장 짧은 사용자명 우선)
+    사용자 ID가 확인된 매핑은 3, 4번 이름 부분 일치에서 제외되므로
+    비슷한 이름의 다른 봇과 혼동되지 않습니다.
+    extra_targets가 있는 매핑은 기본 토픽 외의 추가 대상도, digest가 있는 매핑은 묶음 설정도 함께 인덱싱합니다.
+    """
+
+    def __init__(self, bot_mappings: MappingStore, negative_cache_size: int = 4096):
+        self._topics: Dict[str, int] = {}
+        self._by_username: Dict[str, str] = {}
+        self._by_user_id: Dict[int, int] = {}
+        self._owners: Dict[int, str] = {}
+        self._extra_targets: Dict[str, Tuple[Tuple[Optional[int], int], ...]] = {}
+        self._digests: Dict[str, dict] = {}
+        unresolved = []
+
+        for record in bot_mappings:
+            username = record.username
+            self._topics[username] = record.topic_id
+            key = username.lower()
+            if key:
+                self._by_username.setdefault(key, username)
+            if record.user_id is not None:
+                self._by_user_id[record.user_id] = record.topic_id
+                self._owners[record.user_id] = username
+            elif key:
+                unresolved.append(key)
+            if record.extra_targets:
+                self._extra_targets[username] = record.extra_targets
+            if record.digest:
+                self._digests[username] = record.digest
+
+        # 이름 부분 일치용: 길이가 긴 사용자명이 먼저 오도록 정렬
+        self._contained_order = sorted(unresolved, key=lambda name: (-len(name), name))
+        self._name_matcher = AhoCorasick(self._contained_order)
+
+        # 역방향 부분 일치용: 짧은 사용자명부터 이어 붙인 검색 문자열
+        self._containing_order = sorted(unresolved, key=lambda name: (len(name), name))
+        self._haystack_offsets: List[int] = []
+        offset = 0
+        for name in self._containing_order:
+            self._haystack_offsets.append(offset)
+            offset += len(name) + 1
+        self._haystack = '\0'.join(self._containing_order)
+
+        self.negative_cache_size = negative_cache_size
+        self._unmapped: "OrderedDict[Tuple, None]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._topics)
+
+    def lookup(self, bot_user) -> Optional[int]:
+        """봇 사용자에 매핑된 토픽 ID (매핑이 없으면 None)"""
+        # 확인된 봇은 정수 키 조회 한 번으로 끝남
+        topic_id = self._by_user_id.get(bot_user.id)
+        if topic_id is not None:
+            return topic_id
+
+        username = self.match(bot_user)
+        return self._topics[username] if username is not None else None
+
+    @property
+    def has_fan_out(self) -> bool:
+        """추가 대상이 있는 매핑이 하나라도 있는지"""
+        return bool(self._extra_targets)
+
+    def extra_targets(self, bot_user) -> Tuple[Tuple[Optional[int], int], ...]:
+        """봇 사용자 매핑의 추가 대상 ((대상 채팅 ID 또는 None, 토픽 ID), ...)"""
+        username = self.owner(bot_user.id) or self.match(bot_user)
+        return self._extra_targets.get(username, ()) if username is not None else ()
+
+    def digest(self, bot_user) -> Optional[dict]:
+        """봇 사용자 매핑의 묶음 설정 (묶지 않는 매핑이면 None)"""
+        if not self._digests:
+            return None
+        username = self.owner(bot_user.id) or self.match(bot_user)
+        return self._digests.get(username) if username is not None else None
+
+    def owner(self, user_id: int) -> Optional[str]:
+        """사용자 ID가 확인된 매핑의 사용자명 (없으면 None)"""
+        return self._owners.get(user_id)
+
+    def resolve(self, user_id: int, username: str, previous_id: Optional[int] = None):
+        """확인된 봇 사용자 ID를 인덱스에 바로 추가 (인덱스 전체를 다시 만들지 않음)
+
+        이름 부분 일치 목록에서는 다음 재생성 때 빠지지만, 그 전에도 사용자 ID 조회가 먼저 일치합니다.
+        """
+        if previous_id is not None and self._owners.get(previous_id) == username:
+            del self._by_user_id[previous_id]
+            del self._owners[previous_id]
+        self._by_user_id[user_id] = self._topics[username]
+        self._owners[user_id] = username
+
+    def match_username(self, bot_user) -> Optional[str]:
+        """사용자명이 정확히 일치하는 매핑의 사용자명 (대소문자 무시)"""
+        username = (bot_user.username or '').lower()
+        return self._by_username.get(username) if username else None
+
+    def match(self, bot_user) -> Optional[str]:
+        """사용자명/이름으로 봇 사용자에 해당하는 매핑의 사용자명 찾기 (사용자 ID는 보지 않음)"""
+        username = (bot_user.username or '').replace('@', '').lower()
+        if username:
+            mapped = self._by_username.get(username)
+            if mapped is not None:
+                return mapped
+
+        bot_name = (bot_user.first_name or '').replace('@', '').lower()
+        negative_key = (bot_user.id, username, bot_name)
+        if negative_key in self._unmapped:
+            self._unmapped.move_to_end(negative_key)
+            return None
+
+        mapped = self._match_name(bot_name)
+        if mapped is None:
+            self._unmapped[negative_key] = None
+            if len(self._unmapped) > self.negative_cache_size:
+                self._unmapped.popitem(last=False)
+        return mapped
+
+    def _match_name(self, bot_name: str) -> Optional[str]:
+        if not bot_name or not self._contained_order:
+            return None
+
+        # 봇 이름에 포함된 매핑 사용자명 중 가장 구체적인(긴) 것
+        best = min(self._name_matcher.iter_matches(bot_name), default=None)
+        if best is not None:
+            return self._by_username[self._contained_order[best]]
+
+        # 봇 이름을 포함하는 매핑 사용자명 중 가장 짧은 것
+        position = self._haystack.find(bot_name)
+        if position >= 0:
+            name = self._containing_order[bisect_right(self._haystack_offsets, position) - 1]
+            return self._by_username[name]
+
+        return None
+
+
+class RoutingSnapshot:
+    """매핑, 설정, 라우팅 인덱스를 한 번에 교체하기 위한 읽기 전용 스냅샷 (그룹 하나)
+
+    매핑을 바꿀 때는 새 스냅샷을 만들어 참조를 교체하므로(copy-on-write)
+    메시지 처리 중에 일부만 바뀐 매핑을 보는 일이 없습니다.
+    target_chat_id가 없으면 원본 그룹 안의 토픽으로 포워딩합니다.
+    rules(내용 기반 라우팅 규칙)가 있으면 발신 봇으로 정한 토픽 대신 규칙의 토픽으로 보냅니다.
+    """
+
+    __slots__ = ('bot_mappings', 'settings', 'index', 'source_chat_id', 'target_chat_id', 'description',
+                 'rules', 'content_router')
+
+    def __init__(self, bot_mappings: MappingStore, settings: Dict, source_chat_id: Optional[int] = None,
+                 target_chat_id: Optional[int] = None, description: str = '', rules: Optional[List[dict]] = None):
+        self.bot_mappings = bot_mappings
+        self.settings = settings
+        self.index = RoutingIndex(bot_mappings)
+        self.rules = rules or []
+        self.content_router = ContentRouter(self.rules) if self.rules else None
+        self.source_chat_id = source_chat_id
+        self.target_chat_id = target_chat_id if target_chat_id is not None else source_chat_id
+        self.description = description
+
+    def route(self, bot_user) -> Optional[Tuple[int, int]]:
+        """봇 사용자에 대한 (대상 채팅 ID, 토픽 ID) (매핑이 없으면 None)"""
+        topic_id = self.index.lookup(bot_user)
+        if topic_id is None and self.settings.get('forward_all_unknown_bots', False):
+            topic_id = self.settings.get('default_topic_id')
+        if topic_id is None:
+            return None
+        return self.target_chat_id, topic_id
+
+    def fan_out(self, bot_user) -> List[Tuple[int, int]]:
+        """발신 봇 매핑의 추가 대상 [(대상 채팅 ID, 토픽 ID), ...] (채팅을 지정하지 않은 대상은 그룹의 대상 채팅)"""
+        return [
+            (chat_id if chat_id is not None else self.target_chat_id, topic_id)
+            for chat_id, topic_id in self.index.extra_targets(bot_user)
+        ]
+
+    def rule_topic(self, message) -> Optional[int]:
+        """메시지 내용에 맞는 규칙의 토픽 ID (규칙이 없거나 일치하지 않으면 None)"""
+        if self.content_router is None:
+            return None
+        sender = None
+        if self.content_router.has_sender_rules:
+            bot_user = message.from_user
+            sender = self.index.owner(bot_user.id) or self.index.match(bot_user) or bot_user.username
+        return self.content_router.topic_for(message, sender)
+
+
+class RoutingTable:
+    """원본 그룹 ID -> 그룹별 라우팅 스냅샷
+
+    한 프로세스에서 여러 그룹을 처리할 때 사용합니다. 그룹마다 매핑과 설정이
+    따로 컴파일되고, 메시지는 원본 채팅 ID로 그룹을 찾은 뒤(딕셔너리 조회 한 번)
+    그 그룹의 인덱스에서만 발신 봇을 찾습니다. 그룹을 바꿀 때는 replace로
+    새 테이블을 만들어 참조를 교체합니다.
+    """
+
+    __slots__ = ('_groups',)
+
+    def __init__(self, snapshots: Iterable[RoutingSnapshot] = ()):
+        self._groups: Dict[int, RoutingSnapshot] = {snapshot.source_chat_id: snapshot for snapshot in snapshots}
+
+    def __len__(self):
+        return len(self._groups)
+
+    def __contains__(self, chat_id) -> bool:
+        return chat_id in self._groups
+
+    def __iter__(self) -> Iterator[RoutingSnapshot]:
+        return iter(self._groups.values())
+
+    @property
+    def chat_ids(self) -> List[int]:
+        return list(self._groups)
+
+    def get(self, chat_id: int) -> Optional[RoutingSnapshot]:
+        return self._groups.get(chat_id)
+
+    def route(self, chat_id: int, bot_user) -> Optional[Tuple[int, int]]:
+        """(원본 채팅 ID, 발신 봇) -> (대상 채팅 ID, 토픽 ID)"""
+        snapshot = self._groups.get(chat_id)
+        if snapshot is None:
+            return None
+        return snapshot.route(bot_user)
+
+    def replace(self, snapshot: RoutingSnapshot) -> 'RoutingTable':
+        """그룹 하나만 바꾼 새 테이블 (나머지 그룹의 스냅샷은 그대로 공유)"""
+        groups = dict(self._groups)
+        groups[snapshot.source_chat_id] = snapshot
+        table = RoutingTable()
+        table._groups = groups
+        return table
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from telegram.error import RetryAfter
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """비동기 토큰 버킷 (초당 rate개 충전, 최대 capacity개 보관)"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = None
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def pause(self, seconds: float):
+        """RetryAfter 응답 시 지정된 시간 동안 토큰 발급 중단"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    async def acquire(self) -> float:
+        """토큰 하나를 가져오고, 기다린 시간(초)을 반환"""
+        started_at = time.monotonic()
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # Lock은 대기 순서(FIFO)를 보장
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return now - started_at
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class SendScheduler:
+    """텔레그램 전송 제한(전체 초당 30개, 그룹당 분당 20개)을 지키는 전송 스케줄러
+
+    모든 전송은 채팅별 버킷과 전체 버킷에서 토큰을 받은 뒤 실행되며,
+    RetryAfter(429) 응답을 받으면 해당 채팅을 잠시 멈추고 다시 시도합니다.
+    """
+
+    def __init__(self, global_rate: float = 30.0, per_chat_per_minute: float = 20.0, max_retries: int = 5):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.per_chat_per_minute = per_chat_per_minute
+        self.max_retries = max_retries
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._chat_rates: Dict[int, float] = {}
+        self.sent = 0
+        self.retry_after_count = 0
+        self.throttled_seconds = 0.0
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            per_minute = self._chat_rates.get(chat_id, self.per_chat_per_minute)
+            bucket = TokenBucket(per_minute / 60.0, per_minute)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def set_chat_rate(self, chat_id: int, per_minute: Optional[float]):
+        """채팅별 분당 전송 한도 변경 (None이면 기본값)"""
+        if per_minute is None:
+            self._chat_rates.pop(chat_id, None)
+            per_minute = self.per_chat_per_minute
+        else:
+            self._chat_rates[chat_id] = per_minute
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is not None:
+            bucket.rate = per_minute / 60.0
+            bucket.capacity = per_minute
+            bucket.tokens = min(bucket.tokens, per_minute)
+
+    async def send(self, chat_id: int, method: Callable[..., Awaitable[Any]], /, **kwargs) -> Any:
+        """전송 제한을 지키면서 Bot API 전송 메서드 호출 (kwargs는 그대로 method에 전달)"""
+        chat_bucket = self._chat_bucket(chat_id)
+        for attempt in range(self.max_retries + 1):
+            # 채팅별 토큰을 먼저 받아야 전체 토큰을 붙잡고 기다리지 않음
+            waited = await chat_bucket.acquire()
+            waited += await self.global_bucket.acquire()
+            self.throttled_seconds += waited
+
+            try:
+                result = await method(**kwargs)
+                self.sent += 1
+                return result
+            except RetryAfter as e:
+                self.retry_after_count += 1
+                retry_after = e.retry_after
+                if isinstance(retry_after, timedelta):
+                    retry_after = retry_after.total_seconds()
+                if attempt >= self.max_retries:
+                    raise
+                logger.warning(f"⏳ 전송 제한(429) - 채팅 {chat_id}, {retry_after}초 후 재시도 ({attempt + 1}/{self.max_retries})")
+                chat_bucket.pause(retry_after)
+
+    def stats(self) -> Dict[str, float]:
+        """전송 스케줄러 통계"""
+        return {
+            'sent': self.sent,
+            'retry_after': self.retry_after_count,
+            'throttled_seconds': self.throttled_seconds,
+            'chats': len(self._chat_buckets)
+        }
@@ -1,20 +1,65 @@
 import os
 import json
+import time
+import signal
+import secrets
+import asyncio
 import logging
-from telegram import Update
-from telegram.ext import Application, MessageHandler, CommandHandler, filters, ContextTypes
+from itertools import islice
+from telegram import Update, Message, InputMediaAudio, InputMediaDocument, InputMediaPhoto, InputMediaVideo
+from telegram.ext import Application, CallbackContext, MessageHandler, CommandHandler, ChatMemberHandler, filters, ContextTypes
+from telegram.helpers import escape_markdown
 from dotenv import load_dotenv
 
+from membership_cache import MembershipCache
+from routing_index import RoutingSnapshot, RoutingTable
+from update_dispatcher import TopicOrderedUpdateProcessor
+from update_queue import SqliteUpdateQueue, shard_for
+from send_scheduler import SendScheduler
+from outbox import ForwardOutbox
+from persistence import DebouncedJsonWriter, atomic_write_json
+from config_watcher import ConfigFileWatcher
+from media_group import MediaGroupCollector
+from digest import DigestCollector, DigestDeliveryError, merge_texts, parse_digest, utf16_length
+from mapping_store import MappingRecord, MappingStore, SqliteMappingStore
+from dedup_cache import DedupCache
+from content_rules import RuleError, normalize_rule, parse_rules, rule_kind
+from config_manager import (
+    MappingImportError, detect_format, export_mapping_document, read_mapping_document, validate_mappings
+)
+from update_offset import TrackingUpdateQueue, UpdateOffsetTracker
+from copy_engine import CopyEngine, message_type
+from update_filters import BotSenderFilter, MappedSenderFilter, RejectCountingFilter, allowed_updates_for
+from metrics import ForwarderMetrics, MetricsServer
+from http_transport import build_bot_requests
+from log_setup import setup_logging
+
 # 환경 변수 로드
 load_dotenv()
 
-# 로깅 설정
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
+# /addrule 명령어의 규칙 종류 이름과 목록 표시용 이름
+RULE_KIND_ALIASES = {
+    'keyword': 'keyword',
+    'regex': 'regex',
+    'regex_cs': 'regex',
+    'hashtag': 'hashtag',
+    'media': 'media_type',
+    'media_type': 'media_type'
+}
+RULE_KIND_LABELS = {
+    'keyword': '키워드',
+    'regex': '정규식',
+    'hashtag': '해시태그',
+    'media_type': '미디어'
+}
+
+# /list 한 페이지에 보여 줄 매핑 수
+LIST_PAGE_SIZE = 20
+# /import로 받을 문서의 최대 크기
+MAX_IMPORT_BYTES = 5 * 1024 * 1024
+
 class TelegramForwarderBot:
     def __init__(self):
         self.bot_token = os.getenv('BOT_TOKEN')
@@ -27,94 +72,425 @@ class TelegramForwarderBot:
         if not all([self.bot_token, self.group_chat_id]):
             raise ValueError("BOT_TOKEN과 GROUP_CHAT_ID는 필수 환경 변수입니다.")
         
-        # 봇 매핑 설정 로드
-        self.bot_mappings = self.load_bot_mappings()
-        self.settings = self.load_settings()
+        # 봇 매핑 설정 로드 (파일은 한 번만 파싱, 그룹별로 라우팅 스냅샷 생성)
+        self.mapping_file = 'bot_mapping.json'
+        # 매핑이 많은 배포는 매핑을 SQLite에 행 단위로 저장 (설정/규칙/그룹 구성은 계속 bot_mapping.json)
+        mapping_db_path = os.getenv('MAPPING_DB_PATH', '')
+        self.mapping_db = SqliteMappingStore(mapping_db_path) if mapping_db_path else None
+        try:
+            data = self.read_mapping_file()
+        except json.JSONDecodeError as e:
+            logger.error(f"bot_mapping.json 파일 파싱 오류: {e}")
+            data = {}
+        self._routes = self.build_routing_table(data)
+        # 매핑 DB를 마지막으로 읽은 시점 (다른 연결이 커밋하지 않았으면 다시 읽지 않음)
+        self._mapping_db_version = self.mapping_db.data_version() if self.mapping_db is not None else None
+        
+        # 매핑 파일 저장기 (이벤트 루프 밖에서 원자적으로 저장, 연속 변경은 한 번에 기록)
+        self.mapping_writer = DebouncedJsonWriter(
+            self.mapping_file,
+            delay=float(os.getenv('MAPPING_SAVE_DELAY', 0.5))
+        )
+        self._mapping_save_task = None
+        
+        # 매핑 파일 변경 감시 (재시작 없이 매핑/설정 다시 로드)
+        self.config_watcher = None
+        if os.getenv('CONFIG_WATCH', 'true').lower() == 'true':
+            self.config_watcher = ConfigFileWatcher(
+                self.mapping_file,
+                self.reload_mappings,
+                poll_interval=float(os.getenv('CONFIG_POLL_INTERVAL', 2))
+            )
+        # 매핑 DB를 쓰면 설정 관리 도구가 DB에 커밋한 변경도 감시 (봇 자신의 저장은 data_version을 바꾸지 않음)
+        self.mapping_db_watcher = None
+        if self.config_watcher and self.mapping_db is not None:
+            self.mapping_db_watcher = ConfigFileWatcher(
+                mapping_db_path,
+                self.reload_mappings,
+                poll_interval=float(os.getenv('CONFIG_POLL_INTERVAL', 2)),
+                signature=self.mapping_db.data_version
+            )
+        
+        # 멤버 권한 캐시 (메시지마다 get_chat_member 호출 방지)
+        self.membership_cache = MembershipCache(
+            ttl_seconds=float(os.getenv('MEMBER_CACHE_TTL', 300)),
+            max_entries=int(os.getenv('MEMBER_CACHE_SIZE', 10000))
+        )
+        
+        # 전송 제한을 지키는 발신 스케줄러
+        self.send_scheduler = SendScheduler(
+            global_rate=float(os.getenv('SEND_RATE_GLOBAL', 30)),
+            per_chat_per_minute=float(os.getenv('SEND_RATE_PER_CHAT_PER_MINUTE', 20))
+        )
+        
+        # copyMessage 기반 서버 측 복사
+        self.copy_engine = CopyEngine(self.send_scheduler)
+        
+        # 포워딩 대기열 (실패한 포워딩 재시도 및 재시작 시 재전송)
+        self.outbox = ForwardOutbox(
+            os.getenv('OUTBOX_PATH', 'forward_outbox.db'),
+            max_attempts=int(os.getenv('OUTBOX_MAX_ATTEMPTS', 10))
+        )
+        self.outbox_retention_seconds = float(os.getenv('OUTBOX_RETENTION_HOURS', 24)) * 3600
+        self._outbox_inflight = set()
+        self._outbox_task = None
+        
+        # 앨범(media_group_id)을 모아 sendMediaGroup 한 번으로 전달
+        self.media_groups = MediaGroupCollector(
+            self.deliver_media_group,
+            window=float(os.getenv('MEDIA_GROUP_WINDOW', 1.0))
+        )
+        
+        # digest 설정이 있는 매핑의 연속된 텍스트 메시지를 모아 sendMessage 한 번으로 전달
+        self.digests = DigestCollector(self.deliver_digest)
+        
+        # 실행 역할: all(한 프로세스), ingest(수신 후 큐에 발행), worker(큐의 샤드를 소비해 포워딩)
+        self.role = os.getenv('BOT_ROLE', 'all').lower()
+        if self.role not in ('all', 'ingest', 'worker'):
+            raise ValueError(f"BOT_ROLE은 all, ingest, worker 중 하나여야 합니다: {self.role}")
+        self.shard_count = max(1, int(os.getenv('WORKER_SHARDS', 1)))
+        shard_ids = os.getenv('WORKER_SHARD_IDS', '')
+        self.worker_shards = (
+            sorted({int(shard) for shard in shard_ids.split(',') if shard.strip()})
+            if shard_ids else list(range(self.shard_count))
+        )
+        self.update_queue = None
+        if self.role != 'all':
+            self.update_queue = SqliteUpdateQueue(os.getenv('UPDATE_QUEUE_PATH', 'update_queue.db'))
+        
+        # 처리가 끝난 업데이트 오프셋 추적 (종료 시 저장, 재시작하면 이어서 처리)
+        # 워커는 큐에서 ack로 진행 상황을 관리하므로 사용하지 않음
+        self.offset_tracker = None
+        self._replay_updates = []
+        if self.role != 'worker':
+            bot_id = self.bot_token.split(':', 1)[0]
+            self.offset_tracker = UpdateOffsetTracker(
+                os.getenv('UPDATE_OFFSET_PATH', 'update_offset.json'),
+                bot_id=int(bot_id) if bot_id.isdigit() else None
+            )
+            self._replay_updates = self.offset_tracker.load()
+        self.shutdown_timeout = float(os.getenv('SHUTDOWN_TIMEOUT', 8))
+        self._stop_requested = False
+        
+        # 토픽별 순서를 보장하는 병렬 업데이트 처리 (그룹별 동시 처리 수 제한)
+        self.update_processor = TopicOrderedUpdateProcessor(
+            self.get_update_ordering_key,
+            max_concurrent_updates=int(os.getenv('MAX_CONCURRENT_UPDATES', 8)),
+            tenant_func=self.get_update_tenant,
+            max_concurrent_per_tenant=int(os.getenv('MAX_CONCURRENT_UPDATES_PER_GROUP', 0)) or None,
+            done_callback=self.offset_tracker.done if self.offset_tracker else None
+        )
+        
+        # 중복 업데이트/중복 내용 억제 (재시작 후 다시 받은 업데이트, 원본 봇의 재전송)
+        self.dedup = DedupCache(
+            window_seconds=float(os.getenv('DEDUP_WINDOW', 3600)),
+            max_entries=int(os.getenv('DEDUP_MAX_ENTRIES', 100000)),
+            content_dedup=os.getenv('DEDUP_CONTENT', 'false').lower() == 'true'
+        )
+        # 워커마다 맡은 샤드의 상태만 가지므로 기본 파일 이름에 샤드 번호를 붙임
+        default_dedup_path = 'dedup_state.json'
+        if self.role == 'worker':
+            default_dedup_path = f"dedup_state.{'-'.join(map(str, self.worker_shards))}.json"
+        self.dedup_state_path = os.getenv('DEDUP_STATE_PATH', default_dedup_path)
+        restored = self.dedup.load(self.dedup_state_path)
+        if restored:
+            logger.info(f"중복 억제 상태 복원: {restored}개 항목")
+        
+        # 지표 (METRICS_PORT가 설정되면 /metrics 엔드포인트로 노출)
+        self.metrics = ForwarderMetrics()
+        self._received_at = {}
+        self._queued_at = {}
+        self._outbox_counts = {}
+        self.metrics_server = None
+        if os.getenv('METRICS_PORT'):
+            self.metrics_server = MetricsServer(
+                self.metrics.registry,
+                int(os.getenv('METRICS_PORT')),
+                address=os.getenv('METRICS_ADDRESS', '127.0.0.1')
+            )
+        self.register_metric_gauges()
+        
+        # 전송용과 getUpdates용 HTTP 연결 풀 분리 (크기/타임아웃/HTTP 버전은 환경 변수로 조절)
+        send_request, updates_request = build_bot_requests(self.metrics)
+        builder = (
+            Application.builder()
+            .token(self.bot_token)
+            .request(send_request)
+            .get_updates_request(updates_request)
+        )
         
-        self.application = Application.builder().token(self.bot_token).build()
+        # 로컬/테스트용 Bot API 서버 주소 (예: http://127.0.0.1:8081)
+        api_base_url = os.getenv('BOT_API_BASE_URL')
+        if api_base_url:
+            builder = builder.base_url(f"{api_base_url.rstrip('/')}/bot").base_file_url(f"{api_base_url.rstrip('/')}/file/bot")
+        
+        if self.offset_tracker:
+            builder = builder.update_queue(TrackingUpdateQueue(self.offset_tracker))
+        
+        # post_init/post_stop/post_shutdown은 run_intake/run_worker가 종료 순서에 맞춰 직접 호출
+        self.application = builder.concurrent_updates(self.update_processor).build()
         self.setup_handlers()
+        self.apply_group_rate_limits(self._routes)
+    
+    @property
+    def routes(self):
+        """현재 라우팅 테이블 (원본 그룹 ID -> 그룹별 스냅샷)"""
+        return self._routes
     
-    def load_bot_mappings(self):
-        """봇 매핑 설정을 로드"""
+    @property
+    def bot_mappings(self):
+        """기본 그룹(GROUP_CHAT_ID)의 봇 매핑 (직접 수정하지 말고 swap_mappings 사용)"""
+        return self._routes.get(self.group_chat_id).bot_mappings
+    
+    @property
+    def settings(self):
+        """기본 그룹의 일반 설정"""
+        return self._routes.get(self.group_chat_id).settings
+    
+    def read_mapping_file(self):
+        """bot_mapping.json 파일을 읽어 파싱 (파일이 없으면 None)"""
         try:
-            with open('bot_mapping.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                mappings = {}
-                
-                # JSON 파일의 매핑 로드
-                for mapping in data.get('bot_mappings', []):
-                    username = mapping['source_bot_username'].replace('@', '')
-                    mappings[username] = {
-                        'topic_id': mapping['target_topic_id'],
-                        'description': mapping.get('description', '')
-                    }
-                
-                # 기존 환경 변수 설정이 있으면 추가 (하위 호환성)
-                if self.legacy_source_bot_username and self.legacy_target_topic_id:
-                    legacy_username = self.legacy_source_bot_username.replace('@', '')
-                    if legacy_username not in mappings:
-                        mappings[legacy_username] = {
-                            'topic_id': self.legacy_target_topic_id,
-                            'description': '환경 변수에서 로드된 레거시 설정'
-                        }
-                
-                logger.info(f"봇 매핑 로드 완료: {len(mappings)}개 봇 설정")
-                for username, config in mappings.items():
-                    logger.info(f"  @{username} -> 토픽 {config['topic_id']} ({config['description']})")
-                
-                return mappings
-                
+            with open(self.mapping_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
         except FileNotFoundError:
+            return None
+    
+    def load_bot_mappings(self, data, verbose=True, reuse=None):
+        """파싱된 설정에서 기본 그룹의 봇 매핑을 로드 (reuse는 load_group_mappings 참고)"""
+        if data is None and not (self.mapping_db and self.mapping_db.has(self.group_chat_id)):
             logger.warning("bot_mapping.json 파일을 찾을 수 없습니다. 환경 변수 설정을 사용합니다.")
+            mappings = MappingStore()
             if self.legacy_source_bot_username and self.legacy_target_topic_id:
-                username = self.legacy_source_bot_username.replace('@', '')
-                return {
-                    username: {
-                        'topic_id': self.legacy_target_topic_id,
-                        'description': '환경 변수 설정'
-                    }
-                }
-            return {}
-        except json.JSONDecodeError as e:
-            logger.error(f"bot_mapping.json 파일 파싱 오류: {e}")
-            return {}
+                mappings.put(MappingRecord(
+                    self.legacy_source_bot_username.replace('@', ''),
+                    self.legacy_target_topic_id,
+                    description='환경 변수 설정'
+                ))
+            return mappings
+        
+        # 파일(또는 매핑 DB)의 매핑 로드
+        mappings = self.load_group_mappings(self.group_chat_id, (data or {}).get('bot_mappings', []), reuse)
+        
+        # 기존 환경 변수 설정이 있으면 추가 (하위 호환성)
+        if self.legacy_source_bot_username and self.legacy_target_topic_id:
+            legacy_username = self.legacy_source_bot_username.replace('@', '')
+            if legacy_username not in mappings:
+                # 다시 쓰는 저장소는 현재 스냅샷과 공유하므로 복사본에 추가
+                mappings = mappings.copy()
+                mappings.put(MappingRecord(
+                    legacy_username,
+                    self.legacy_target_topic_id,
+                    description='환경 변수에서 로드된 레거시 설정'
+                ))
+        
+        if verbose:
+            logger.info(f"봇 매핑 로드 완료: {len(mappings)}개 봇 설정")
+            for record in islice(mappings, 50):
+                logger.info(f"  @{record.username} -> 토픽 {record.topic_id} ({record.description})")
+            if len(mappings) > 50:
+                logger.info(f"  … 외 {len(mappings) - 50}개")
+        
+        return mappings
+    
+    def load_group_mappings(self, chat_id, entries, reuse=None):
+        """그룹 하나의 매핑 로드 (매핑 DB를 쓰면 DB에서, DB가 비어 있으면 파일의 매핑을 DB로 옮김)
+        
+        reuse는 매핑 DB가 마지막으로 읽은 뒤 바뀌지 않았을 때 넘기는 현재 라우팅 테이블로,
+        여기 있는 그룹은 DB를 다시 읽지 않고 현재 매핑을 그대로 씁니다.
+        """
+        if self.mapping_db is None:
+            return MappingStore.from_entries(entries)
+        if reuse is not None and chat_id in reuse:
+            return reuse.get(chat_id).bot_mappings
+        if self.mapping_db.has(chat_id):
+            return self.mapping_db.load(chat_id)
+        mappings = MappingStore.from_entries(entries)
+        if len(mappings):
+            self.mapping_db.save(chat_id, mappings)
+            logger.info(f"그룹 {chat_id}의 매핑 {len(mappings)}개를 매핑 DB로 옮겼습니다.")
+        return mappings
+    
+    def build_routing_table(self, data, verbose=True, reuse=None):
+        """파싱된 설정에서 그룹별 라우팅 테이블 생성
+        
+        최상위 bot_mappings/settings는 기본 그룹(GROUP_CHAT_ID)에 적용되고,
+        groups 목록의 항목마다 source_chat_id 그룹의 매핑과 설정을 따로 가집니다.
+        rules(내용 기반 라우팅 규칙)도 같은 방식으로 그룹마다 따로 가집니다.
+        """
+        rules = parse_rules((data or {}).get('rules', []))
+        snapshots = [
+            RoutingSnapshot(
+                self.load_bot_mappings(data, verbose=verbose, reuse=reuse),
+                self.load_settings(data),
+                source_chat_id=self.group_chat_id,
+                target_chat_id=(data or {}).get('target_chat_id'),
+                rules=rules
+            )
+        ]
+        if verbose and rules:
+            logger.info(f"내용 규칙 로드 완료: {len(rules)}개")
+        for group in (data or {}).get('groups', []):
+            source_chat_id = int(group['source_chat_id'])
+            if source_chat_id == self.group_chat_id:
+                logger.warning(f"groups의 {source_chat_id}는 기본 그룹과 같습니다 - 무시합니다.")
+                continue
+            mappings = self.load_group_mappings(source_chat_id, group.get('bot_mappings', []), reuse)
+            rules = parse_rules(group.get('rules', []))
+            snapshots.append(RoutingSnapshot(
+                mappings,
+                self.load_settings(group),
+                source_chat_id=source_chat_id,
+                target_chat_id=group.get('target_chat_id'),
+                description=group.get('description', ''),
+                rules=rules
+            ))
+            if verbose:
+                logger.info(f"그룹 {source_chat_id} 매핑 로드 완료: {len(mappings)}개 봇 설정, 내용 규칙 {len(rules)}개")
+        return RoutingTable(snapshots)
+    
+    def load_settings(self, data):
+        """파싱된 설정에서 일반 설정을 로드"""
+        default_settings = {
+            'forward_all_unknown_bots': False,
+            'default_topic_id': None,
+            'log_unknown_bots': True
+        }
+        if not data:
+            return default_settings
+        return data.get('settings', default_settings)
+    
+    def swap_routes(self, routes):
+        """라우팅 테이블 전체 교체 (핸들러 필터와 그룹별 전송 한도도 함께 갱신)"""
+        self._routes = routes
+        self.mapped_sender_filter.rebuild(routes)
+        self.group_filter.chat_ids = routes.chat_ids
+        self.apply_group_rate_limits(routes)
     
-    def load_settings(self):
-        """일반 설정을 로드"""
+    def swap_mappings(self, chat_id, bot_mappings, settings=None, rules=None):
+        """그룹 하나의 매핑을 새 스냅샷으로 교체 (라우팅 인덱스와 내용 규칙 매처도 함께 재생성)"""
+        current = self._routes.get(chat_id)
+        snapshot = RoutingSnapshot(
+            bot_mappings,
+            settings if settings is not None else current.settings,
+            source_chat_id=chat_id,
+            target_chat_id=current.target_chat_id,
+            description=current.description,
+            rules=rules if rules is not None else current.rules
+        )
+        self.swap_routes(self._routes.replace(snapshot))
+        logger.info(f"라우팅 인덱스 재생성: 그룹 {chat_id}, {len(snapshot.index)}개 봇")
+    
+    def apply_group_rate_limits(self, routes):
+        """그룹 설정의 send_rate_per_minute를 대상 채팅의 전송 한도로 적용"""
+        for snapshot in routes:
+            self.send_scheduler.set_chat_rate(snapshot.target_chat_id, snapshot.settings.get('send_rate_per_minute'))
+    
+    async def reload_mappings(self):
+        """변경된 bot_mapping.json(또는 매핑 DB)을 다시 읽어 바뀐 부분만 반영"""
         try:
-            with open('bot_mapping.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return data.get('settings', {
-                    'forward_all_unknown_bots': False,
-                    'default_topic_id': None,
-                    'log_unknown_bots': True
-                })
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {
-                'forward_all_unknown_bots': False,
-                'default_topic_id': None,
-                'log_unknown_bots': True
-            }
+            data = await asyncio.to_thread(self.read_mapping_file)
+        except json.JSONDecodeError as e:
+            # 편집 중인 파일일 수 있으므로 기존 매핑 유지
+            logger.error(f"bot_mapping.json 파일 파싱 오류 - 기존 매핑 유지: {e}")
+            return
+        if data is None and self.mapping_db is None:
+            logger.warning("bot_mapping.json 파일이 삭제되었습니다 - 기존 매핑 유지")
+            return
+        
+        # 다른 연결이 매핑 DB에 커밋하지 않았으면 DB를 다시 읽지 않고 현재 매핑을 재사용
+        reuse = None
+        db_version = None
+        if self.mapping_db is not None:
+            db_version = await asyncio.to_thread(self.mapping_db.data_version)
+            if db_version == self._mapping_db_version:
+                reuse = self._routes
+        # 봇이 직접 저장한 내용이 다시 감지된 것이면 반영할 것이 없음
+        if data is not None and data == self.mapping_writer.last_written and (
+                self.mapping_db is None or reuse is not None):
+            return
+        
+        # 매핑이 많으면 인덱스 컴파일(과 매핑 DB 읽기)이 길어지므로 이벤트 루프 밖에서 생성
+        new_routes = await asyncio.to_thread(self.build_routing_table, data, False, reuse)
+        self._mapping_db_version = db_version
+        old_routes = self._routes
+        
+        changes = []
+        for snapshot in new_routes:
+            previous = old_routes.get(snapshot.source_chat_id)
+            old_mappings = previous.bot_mappings if previous else MappingStore()
+            new_mappings = snapshot.bot_mappings
+            added = [record.username for record in new_mappings if record.username not in old_mappings]
+            removed = [record.username for record in old_mappings if record.username not in new_mappings]
+            changed = [
+                record.username for record in new_mappings
+                if record.username in old_mappings and old_mappings.get(record.username) != record
+            ]
+            settings_changed = previous is None or (
+                snapshot.settings != previous.settings or snapshot.target_chat_id != previous.target_chat_id
+                or snapshot.rules != previous.rules
+            )
+            if added or removed or changed or settings_changed:
+                changes.append((snapshot, added, removed, changed, settings_changed))
+        removed_groups = [chat_id for chat_id in old_routes.chat_ids if chat_id not in new_routes]
+        
+        if not (changes or removed_groups):
+            return
+        
+        self.swap_routes(new_routes)
+        for snapshot, added, removed, changed, settings_changed in changes:
+            logger.info(
+                f"🔄 매핑 다시 로드 - 그룹 {snapshot.source_chat_id}: "
+                f"추가 {len(added)}, 삭제 {len(removed)}, 변경 {len(changed)}, 설정 변경: {settings_changed}, "
+                f"내용 규칙 {len(snapshot.rules)}개"
+            )
+            for username in (added + changed)[:50]:
+                logger.info(f"  @{username} -> 토픽 {snapshot.bot_mappings.get(username).topic_id}")
+            for username in removed:
+                logger.info(f"  @{username} 매핑 제거")
+        for chat_id in removed_groups:
+            logger.info(f"🔄 그룹 {chat_id} 라우팅 제거")
     
-    def save_bot_mappings(self):
-        """봇 매핑을 파일에 저장"""
+    async def save_bot_mappings(self):
+        """봇 매핑을 파일에 저장 (매핑 DB를 쓰면 매핑은 DB에 바뀐 행만 기록하고 파일에는 나머지 설정만 저장)"""
         try:
-            # 현재 매핑을 JSON 형태로 변환
-            bot_mappings_list = []
-            for username, config in self.bot_mappings.items():
-                bot_mappings_list.append({
-                    'source_bot_username': username,
-                    'target_topic_id': config['topic_id'],
-                    'description': config['description']
-                })
-            
-            data = {
-                'bot_mappings': bot_mappings_list,
-                'settings': self.settings
-            }
+            routes = self._routes
+            if self.mapping_db is not None:
+                written = await asyncio.to_thread(
+                    lambda: sum(self.mapping_db.save(snapshot.source_chat_id, snapshot.bot_mappings) for snapshot in routes)
+                )
+                logger.debug(f"매핑 DB에 {written}개 행 기록")
             
-            with open('bot_mapping.json', 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            # 현재 매핑을 JSON 형태로 변환 (기본 그룹은 최상위, 나머지는 groups 목록)
+            primary = routes.get(self.group_chat_id)
+            data = {}
+            if self.mapping_db is None:
+                data['bot_mappings'] = primary.bot_mappings.entries()
+            data['settings'] = dict(primary.settings)
+            if primary.target_chat_id != self.group_chat_id:
+                data['target_chat_id'] = primary.target_chat_id
+            if primary.rules:
+                data['rules'] = list(primary.rules)
+            
+            groups = []
+            for snapshot in routes:
+                if snapshot.source_chat_id == self.group_chat_id:
+                    continue
+                group = {'source_chat_id': snapshot.source_chat_id}
+                if snapshot.target_chat_id != snapshot.source_chat_id:
+                    group['target_chat_id'] = snapshot.target_chat_id
+                if snapshot.description:
+                    group['description'] = snapshot.description
+                if self.mapping_db is None:
+                    group['bot_mappings'] = snapshot.bot_mappings.entries()
+                group['settings'] = dict(snapshot.settings)
+                if snapshot.rules:
+                    group['rules'] = list(snapshot.rules)
+                groups.append(group)
+            if groups:
+                data['groups'] = groups
+            
+            if not await self.mapping_writer.save(data):
+                return False
             
             logger.info("봇 매핑이 파일에 저장되었습니다.")
             return True
@@ -124,36 +500,112 @@ class TelegramForwarderBot:
     
     def setup_handlers(self):
         """메시지 및 명령어 핸들러 설정"""
+        # 핸들러 앞단 필터: 관련 없는 업데이트는 핸들러 코루틴을 만들기 전에 버림
+        self.group_filter = filters.Chat(chat_id=self._routes.chat_ids)
+        self.mapped_sender_filter = MappedSenderFilter(self._routes)
+        
         # 명령어 핸들러
-        self.application.add_handler(CommandHandler("set", self.handle_set_command))
-        self.application.add_handler(CommandHandler("list", self.handle_list_command))
-        self.application.add_handler(CommandHandler("remove", self.handle_remove_command))
-        self.application.add_handler(CommandHandler("help", self.handle_help_command))
+        self.application.add_handler(CommandHandler("set", self.handle_set_command, filters=self.group_filter))
+        self.application.add_handler(CommandHandler("list", self.handle_list_command, filters=self.group_filter))
+        self.application.add_handler(CommandHandler("remove", self.handle_remove_command, filters=self.group_filter))
+        self.application.add_handler(CommandHandler("digest", self.handle_digest_command, filters=self.group_filter))
+        self.application.add_handler(CommandHandler("import", self.handle_import_command, filters=self.group_filter))
+        self.application.add_handler(CommandHandler("export", self.handle_export_command, filters=self.group_filter))
+        # 캡션이 /import인 문서 (명령어 대신 문서에 캡션으로 붙여 보낸 경우)
+        self.application.add_handler(MessageHandler(
+            self.group_filter & filters.Document.ALL & filters.CaptionRegex(r'^/import(@\w+)?(\s|$)'),
+            self.handle_import_command
+        ))
+        self.application.add_handler(CommandHandler("addrule", self.handle_addrule_command, filters=self.group_filter))
+        self.application.add_handler(CommandHandler("rules", self.handle_rules_command, filters=self.group_filter))
+        self.application.add_handler(CommandHandler("delrule", self.handle_delrule_command, filters=self.group_filter))
+        self.application.add_handler(CommandHandler("help", self.handle_help_command, filters=self.group_filter))
+        self.application.add_handler(CommandHandler("stats", self.handle_stats_command, filters=self.group_filter))
         
-        # 메시지 핸들러 (명령어가 아닌 일반 메시지)
-        message_handler = MessageHandler(filters.ALL & ~filters.COMMAND, self.handle_message)
+        # 멤버 권한 변경 핸들러 (권한 캐시 갱신)
+        self.application.add_handler(ChatMemberHandler(self.handle_chat_member, ChatMemberHandler.CHAT_MEMBER))
+        
+        # 메시지 핸들러 (그룹 안에서 매핑된 봇이 보낸, 명령어가 아닌 메시지)
+        count_drop = self.metrics.updates_dropped.inc
+        message_filter = (
+            RejectCountingFilter(self.group_filter, 'wrong_chat', count_drop)
+            & ~filters.COMMAND
+            & RejectCountingFilter(BotSenderFilter(), 'human', count_drop)
+            & RejectCountingFilter(self.mapped_sender_filter, 'unmapped', count_drop)
+        )
+        # 수신 역할이면 포워딩하지 않고 워커 큐에 발행
+        message_callback = self.publish_update if self.role == 'ingest' else self.handle_message
+        message_handler = MessageHandler(message_filter, message_callback)
         self.application.add_handler(message_handler)
     
+    def register_metric_gauges(self):
+        """다른 구성 요소의 상태를 스크레이프 시점에 읽는 지표 등록"""
+        registry = self.metrics.registry
+        registry.gauge(
+            'forwarder_updates_received_total', '수신한 업데이트 수',
+            lambda: [((), self.update_processor.received)], metric_type='counter')
+        registry.gauge(
+            'forwarder_update_queue_depth', '업데이트 처리 큐 상태',
+            lambda: [((state,), self.update_processor.stats()[state]) for state in ('queued', 'in_flight', 'max_key_depth')],
+            ['state'])
+        registry.gauge(
+            'forwarder_outbox_entries', '포워딩 대기열 항목 수 (상태별)',
+            lambda: [((status,), self._outbox_counts.get(status, 0)) for status in (ForwardOutbox.PENDING, ForwardOutbox.DEAD)],
+            ['status'])
+        registry.gauge(
+            'forwarder_media_groups_pending', '전송을 기다리는 앨범 수',
+            lambda: [((), self.media_groups.stats()['pending'])])
+        registry.gauge(
+            'forwarder_digests_pending', '전송을 기다리는 텍스트 묶음 수',
+            lambda: [((), self.digests.stats()['pending'])])
+        registry.gauge(
+            'forwarder_send_calls_total', '전송 스케줄러를 거친 API 호출 수',
+            lambda: [((), self.send_scheduler.sent)], metric_type='counter')
+        registry.gauge(
+            'forwarder_copy_fallbacks_total', '복사할 수 없어 전달로 대체한 메시지 수',
+            lambda: [((), self.copy_engine.fallbacks)], metric_type='counter')
+        registry.gauge(
+            'forwarder_send_throttled_seconds_total', '전송 제한 때문에 기다린 시간',
+            lambda: [((), self.send_scheduler.throttled_seconds)], metric_type='counter')
+        registry.gauge(
+            'forwarder_send_retry_after_total', 'RetryAfter(429) 응답 수',
+            lambda: [((), self.send_scheduler.retry_after_count)], metric_type='counter')
+        registry.gauge(
+            'forwarder_dedup_suppressed_total', '중복으로 억제된 메시지 수',
+            lambda: [((kind,), count) for kind, count in self.dedup.suppressed.items()],
+            ['kind'], metric_type='counter')
+        registry.gauge(
+            'forwarder_membership_cache_requests_total', '권한 캐시 조회 수',
+            lambda: [(('hit',), self.membership_cache.hits), (('miss',), self.membership_cache.misses)],
+            ['result'], metric_type='counter')
+    
+    def get_allowed_updates(self):
+        """등록된 핸들러가 처리하는 업데이트 타입 목록"""
+        handlers = [handler for group in self.application.handlers.values() for handler in group]
+        return allowed_updates_for(handlers)
+    
     async def handle_set_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """봇 매핑 설정 명령어 처리"""
         try:
-            # 그룹에서만 동작
-            if update.effective_chat.id != self.group_chat_id:
+            # 등록된 그룹에서만 동작 (명령어를 보낸 그룹의 매핑을 수정)
+            chat_id = update.effective_chat.id
+            group = self._routes.get(chat_id)
+            if group is None:
                 return
             
             # 관리자 권한 확인 (선택사항)
             user = update.effective_user
-            chat_member = await context.bot.get_chat_member(self.group_chat_id, user.id)
-            if chat_member.status not in ['administrator', 'creator']:
+            if not await self.membership_cache.is_admin(context.bot, chat_id, user.id):
                 await update.message.reply_text("❌ 이 명령어는 관리자만 사용할 수 있습니다.")
                 return
             
-            # 명령어 파싱: /set @bot_username topic_id [description]
+            # 명령어 파싱: /set @bot_username topic_id[,topic_id...] [description]
             args = context.args
             if len(args) < 2:
                 await update.message.reply_text(
-                    "❌ 사용법: `/set @bot_username topic_id [설명]`\n"
-                    "예시: `/set @news_bot 123 뉴스 봇 매핑`",
+                    "❌ 사용법: `/set @bot_username topic_id[,topic_id...] [설명]`\n"
+                    "예시: `/set @news_bot 123 뉴스 봇 매핑`\n"
+                    "여러 토픽으로 보내기: `/set @news_bot 123,456`",
                     parse_mode='Markdown'
                 )
                 return
@@ -163,33 +615,46 @@ class TelegramForwarderBot:
             bot_username = args[0].replace('@', '')
             logger.info(f"디버깅: 원본 입력 '{original_input}' -> 처리된 사용자명 '{bot_username}'")
             
+            # 쉼표로 여러 토픽을 주면 첫 번째가 기본 토픽, 나머지는 추가 대상
             try:
-                topic_id = int(args[1])
+                topic_ids = [int(part) for part in args[1].split(',') if part]
             except ValueError:
+                topic_ids = []
+            if not topic_ids:
                 await update.message.reply_text("❌ 토픽 ID는 숫자여야 합니다.")
                 return
+            topic_id = topic_ids[0]
             
             description = ' '.join(args[2:]) if len(args) > 2 else f"@{bot_username}의 메시지를 토픽 {topic_id}로 포워딩"
             
-            # 매핑 추가/업데이트
-            old_mapping = self.bot_mappings.get(bot_username)
-            self.bot_mappings[bot_username] = {
-                'topic_id': topic_id,
-                'description': description
-            }
+            # 매핑 추가/업데이트 (복사본을 수정한 뒤 교체)
+            old_mapping = group.bot_mappings.get(bot_username)
+            extra_topics = list(dict.fromkeys(extra for extra in topic_ids[1:] if extra != topic_id))
+            new_mapping = MappingRecord(
+                bot_username,
+                topic_id,
+                description=description,
+                extra_targets=tuple((None, extra) for extra in extra_topics),
+                # 이미 확인된 봇 사용자 ID와 묶음 설정은 유지
+                user_id=old_mapping.user_id if old_mapping else None,
+                digest=old_mapping.digest if old_mapping else None
+            )
+            new_mappings = group.bot_mappings.copy()
+            new_mappings.put(new_mapping)
+            self.swap_mappings(chat_id, new_mappings)
             
             # 파일에 저장
-            if self.save_bot_mappings():
+            if await self.save_bot_mappings():
                 if old_mapping:
                     await update.message.reply_text(
                         f"✅ 봇 매핑이 업데이트되었습니다!\n"
-                        f"@{bot_username}: 토픽 {old_mapping['topic_id']} → {topic_id}\n"
+                        f"@{bot_username}: 토픽 {self.format_targets(old_mapping)} → {self.format_targets(new_mapping)}\n"
                         f"설명: {description}"
                     )
                 else:
                     await update.message.reply_text(
                         f"✅ 새 봇 매핑이 추가되었습니다!\n"
-                        f"@{bot_username} → 토픽 {topic_id}\n"
+                        f"@{bot_username} → 토픽 {self.format_targets(new_mapping)}\n"
                         f"설명: {description}"
                     )
             else:
@@ -200,29 +665,46 @@ class TelegramForwarderBot:
             await update.message.reply_text("❌ 명령어 처리 중 오류가 발생했습니다.")
     
     async def handle_list_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """봇 매핑 목록 조회 명령어 처리"""
+        """봇 매핑 목록 조회 명령어 처리 (/list [페이지])"""
         try:
-            # 그룹에서만 동작
-            if update.effective_chat.id != self.group_chat_id:
+            # 등록된 그룹에서만 동작
+            group = self._routes.get(update.effective_chat.id)
+            if group is None:
                 return
             
-            if not self.bot_mappings:
+            if not group.bot_mappings:
                 await update.message.reply_text("📝 설정된 봇 매핑이 없습니다.")
                 return
             
-            message = "📋 **현재 봇 매핑 설정:**\n\n"
-            for i, (username, config) in enumerate(self.bot_mappings.items(), 1):
-                message += f"{i}. @{username} → 토픽 {config['topic_id']}\n"
-                if config['description']:
-                    message += f"   📝 {config['description']}\n"
-                message += "\n"
+            # 매핑이 많아도 메시지 하나가 길어지지 않도록 페이지 단위로 표시
+            page_count = (len(group.bot_mappings) + LIST_PAGE_SIZE - 1) // LIST_PAGE_SIZE
+            try:
+                page = int(context.args[0]) if context.args else 1
+            except ValueError:
+                page = 1
+            page = min(max(page, 1), page_count)
+            first = (page - 1) * LIST_PAGE_SIZE
             
-            message += "💡 **사용법:**\n"
-            message += "• `/set @bot_username topic_id [설명]` - 매핑 추가/수정\n"
-            message += "• `/remove @bot_username` - 매핑 삭제\n"
-            message += "• `/list` - 매핑 목록 조회"
+            lines = [f"📋 **현재 봇 매핑 설정** ({len(group.bot_mappings)}개, {page}/{page_count} 페이지)", ""]
+            if group.target_chat_id != group.source_chat_id:
+                lines += [f"📤 대상 채팅: {group.target_chat_id}", ""]
+            for i, record in enumerate(islice(group.bot_mappings, first, first + LIST_PAGE_SIZE), first + 1):
+                lines.append(f"{i}. @{escape_markdown(record.username)} → 토픽 {self.format_targets(record)}")
+                if record.description:
+                    lines.append(f"   📝 {escape_markdown(record.description)}")
+                if record.digest:
+                    lines.append(f"   🧾 텍스트 묶음: {record.digest['window_seconds']:g}초 / {record.digest['max_messages']}개")
+                lines.append("")
             
-            await update.message.reply_text(message, parse_mode='Markdown')
+            if page < page_count:
+                lines += [f"➡️ 다음 페이지: `/list {page + 1}`", ""]
+            lines.append("💡 **사용법:**")
+            lines.append("• `/set @bot_username topic_id[,topic_id...] [설명]` - 매핑 추가/수정")
+            lines.append("• `/remove @bot_username` - 매핑 삭제")
+            lines.append("• `/list [페이지]` - 매핑 목록 조회")
+            lines.append("• `/import`, `/export` - 매핑 일괄 가져오기/내보내기")
+            
+            await update.message.reply_text('\n'.join(lines), parse_mode='Markdown')
             
         except Exception as e:
             logger.error(f"list 명령어 처리 중 오류: {e}")
@@ -231,14 +713,15 @@ class TelegramForwarderBot:
     async def handle_remove_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """봇 매핑 제거 명령어 처리"""
         try:
-            # 그룹에서만 동작
-            if update.effective_chat.id != self.group_chat_id:
+            # 등록된 그룹에서만 동작
+            chat_id = update.effective_chat.id
+            group = self._routes.get(chat_id)
+            if group is None:
                 return
             
             # 관리자 권한 확인
             user = update.effective_user
-            chat_member = await context.bot.get_chat_member(self.group_chat_id, user.id)
-            if chat_member.status not in ['administrator', 'creator']:
+            if not await self.membership_cache.is_admin(context.bot, chat_id, user.id):
                 await update.message.reply_text("❌ 이 명령어는 관리자만 사용할 수 있습니다.")
                 return
             
@@ -254,16 +737,19 @@ class TelegramForwarderBot:
             
             bot_username = args[0].replace('@', '')
             
-            if bot_username in self.bot_mappings:
-                removed_mapping = self.bot_mappings.pop(bot_username)
-                if self.save_bot_mappings():
+            if bot_username in group.bot_mappings:
+                old_mappings = group.bot_mappings
+                new_mappings = old_mappings.copy()
+                removed_mapping = new_mappings.remove(bot_username)
+                self.swap_mappings(chat_id, new_mappings)
+                if await self.save_bot_mappings():
                     await update.message.reply_text(
-                        f"✅ @{bot_username} 매핑이 제거되었습니다.\n"
-                        f"(토픽 {removed_mapping['topic_id']})"
+                        f"✅ @{removed_mapping.username} 매핑이 제거되었습니다.\n"
+                        f"(토픽 {removed_mapping.topic_id})"
                     )
                 else:
                     # 실패 시 복원
-                    self.bot_mappings[bot_username] = removed_mapping
+                    self.swap_mappings(chat_id, old_mappings)
                     await update.message.reply_text("❌ 설정 저장 중 오류가 발생했습니다.")
             else:
                 await update.message.reply_text(f"❌ @{bot_username}에 대한 매핑을 찾을 수 없습니다.")
@@ -272,30 +758,368 @@ class TelegramForwarderBot:
             logger.error(f"remove 명령어 처리 중 오류: {e}")
             await update.message.reply_text("❌ 명령어 처리 중 오류가 발생했습니다.")
     
+    async def handle_import_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """매핑 일괄 가져오기 명령어 처리
+        
+        JSON/CSV 문서에 `/import` 캡션을 붙여 보내거나 문서에 `/import`로 답장합니다.
+        문서 전체를 먼저 검사한 뒤 바뀐 부분만 반영하고, 라우팅 인덱스 재생성과 파일 저장은 한 번만 합니다.
+        `/import replace`면 문서에 없는 기존 매핑을 삭제합니다.
+        """
+        try:
+            # 등록된 그룹에서만 동작
+            chat_id = update.effective_chat.id
+            group = self._routes.get(chat_id)
+            if group is None:
+                return
+            
+            # 관리자 권한 확인
+            user = update.effective_user
+            if not await self.membership_cache.is_admin(context.bot, chat_id, user.id):
+                await update.message.reply_text("❌ 이 명령어는 관리자만 사용할 수 있습니다.")
+                return
+            
+            # 명령어 파싱: /import [replace] (문서 캡션 또는 문서에 대한 답장)
+            message = update.message
+            reply_to = message.reply_to_message
+            document = message.document or (reply_to.document if reply_to else None)
+            args = ((message.caption if message.document else message.text) or '').split()[1:]
+            if document is None or [arg.lower() for arg in args] not in ([], ['replace']):
+                await message.reply_text(
+                    "❌ 사용법: JSON/CSV 문서에 `/import` 캡션을 붙여 보내거나 문서에 `/import`로 답장하세요.\n"
+                    "`/import replace`: 문서에 없는 기존 매핑은 삭제\n"
+                    "CSV 열: source\\_bot\\_username, target\\_topic\\_id, description",
+                    parse_mode='Markdown'
+                )
+                return
+            if document.file_size and document.file_size > MAX_IMPORT_BYTES:
+                await message.reply_text(f"❌ 문서가 너무 큽니다 (최대 {MAX_IMPORT_BYTES // (1024 * 1024)}MB).")
+                return
+            
+            file = await context.bot.get_file(document.file_id)
+            try:
+                content = bytes(await file.download_as_bytearray()).decode('utf-8-sig')
+            except UnicodeDecodeError:
+                await message.reply_text("❌ 문서는 UTF-8 텍스트(JSON 또는 CSV)여야 합니다.")
+                return
+            
+            # 문서 전체를 검사 (오류가 하나라도 있으면 아무것도 바꾸지 않음)
+            try:
+                incoming = validate_mappings(
+                    read_mapping_document(content, detect_format(document.file_name or '', content))
+                )
+            except MappingImportError as e:
+                shown = e.errors[:10]
+                text = "❌ 가져오기 실패 - 아무것도 바뀌지 않았습니다:\n" + '\n'.join(f"• {error}" for error in shown)
+                if len(e.errors) > len(shown):
+                    text += f"\n… 외 {len(e.errors) - len(shown)}개 오류"
+                await message.reply_text(text)
+                return
+            
+            merged, summary = group.bot_mappings.merged(incoming, replace=bool(args))
+            if not (summary['added'] or summary['updated'] or summary['removed']):
+                await message.reply_text(f"ℹ️ 바뀐 매핑이 없습니다 ({len(summary['unchanged'])}개 그대로).")
+                return
+            
+            # 한 번의 교체와 한 번의 저장으로 반영
+            old_mappings = group.bot_mappings
+            self.swap_mappings(chat_id, merged)
+            if not await self.save_bot_mappings():
+                self.swap_mappings(chat_id, old_mappings)
+                await message.reply_text("❌ 설정 저장 중 오류가 발생했습니다.")
+                return
+            
+            lines = [f"✅ 매핑 가져오기 완료 ({len(incoming)}개 항목)"]
+            for key, label in (('added', '추가'), ('updated', '변경'), ('removed', '삭제')):
+                if summary[key]:
+                    lines.append(f"• {label} {len(summary[key])}개: {self.format_usernames(summary[key])}")
+            if summary['unchanged']:
+                lines.append(f"• 그대로 {len(summary['unchanged'])}개")
+            await message.reply_text('\n'.join(lines))
+            logger.info(
+                f"📥 매핑 가져오기 - 그룹 {chat_id}: 추가 {len(summary['added'])}, 변경 {len(summary['updated'])}, "
+                f"삭제 {len(summary['removed'])}, 그대로 {len(summary['unchanged'])}"
+            )
+            
+        except Exception as e:
+            logger.error(f"import 명령어 처리 중 오류: {e}")
+            await update.message.reply_text("❌ 명령어 처리 중 오류가 발생했습니다.")
+    
+    async def handle_export_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """매핑 내보내기 명령어 처리 (/export [csv])"""
+        try:
+            # 등록된 그룹에서만 동작
+            chat_id = update.effective_chat.id
+            group = self._routes.get(chat_id)
+            if group is None:
+                return
+            
+            # 관리자 권한 확인
+            user = update.effective_user
+            if not await self.membership_cache.is_admin(context.bot, chat_id, user.id):
+                await update.message.reply_text("❌ 이 명령어는 관리자만 사용할 수 있습니다.")
+                return
+            
+            fmt = 'csv' if context.args and context.args[0].lower() == 'csv' else 'json'
+            content = export_mapping_document(group.bot_mappings.entries(), fmt)
+            caption = f"📦 봇 매핑 {len(group.bot_mappings)}개"
+            if fmt == 'csv':
+                caption += " (CSV에는 추가 대상/묶음 설정이 빠집니다)"
+            await update.message.reply_document(
+                document=content.encode('utf-8'),
+                filename=f"bot_mappings_{chat_id}.{fmt}",
+                caption=caption
+            )
+            
+        except Exception as e:
+            logger.error(f"export 명령어 처리 중 오류: {e}")
+            await update.message.reply_text("❌ 명령어 처리 중 오류가 발생했습니다.")
+    
+    def format_usernames(self, usernames, limit=10):
+        """사용자명 목록을 앞의 limit개만 보여 주는 한 줄로"""
+        text = ', '.join(f"@{username}" for username in usernames[:limit])
+        if len(usernames) > limit:
+            text += f" 외 {len(usernames) - limit}개"
+        return text
+    
+    async def handle_digest_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """텍스트 묶음 전송 설정 명령어 처리"""
+        try:
+            # 등록된 그룹에서만 동작
+            chat_id = update.effective_chat.id
+            group = self._routes.get(chat_id)
+            if group is None:
+                return
+            
+            # 관리자 권한 확인
+            user = update.effective_user
+            if not await self.membership_cache.is_admin(context.bot, chat_id, user.id):
+                await update.message.reply_text("❌ 이 명령어는 관리자만 사용할 수 있습니다.")
+                return
+            
+            # 명령어 파싱: /digest @bot_username 초 [최대개수] 또는 /digest @bot_username off
+            args = context.args
+            if len(args) not in (2, 3):
+                await update.message.reply_text(
+                    "❌ 사용법: `/digest @bot_username 초 [최대개수]` 또는 `/digest @bot_username off`\n"
+                    "예시: `/digest @log_bot 30 100`",
+                    parse_mode='Markdown'
+                )
+                return
+            
+            bot_username = args[0].replace('@', '')
+            old_mapping = group.bot_mappings.get(bot_username)
+            if old_mapping is None:
+                await update.message.reply_text(f"❌ @{bot_username}에 대한 매핑을 찾을 수 없습니다.")
+                return
+            
+            if args[1].lower() == 'off':
+                new_mapping = old_mapping.replace(digest=None)
+            else:
+                settings = {'window_seconds': args[1]}
+                if len(args) == 3:
+                    settings['max_messages'] = args[2]
+                try:
+                    new_mapping = old_mapping.replace(digest=parse_digest(settings))
+                except ValueError:
+                    await update.message.reply_text("❌ 초와 최대개수는 0보다 큰 숫자여야 합니다.")
+                    return
+            
+            old_mappings = group.bot_mappings
+            new_mappings = old_mappings.copy()
+            new_mappings.put(new_mapping)
+            self.swap_mappings(chat_id, new_mappings)
+            if not await self.save_bot_mappings():
+                self.swap_mappings(chat_id, old_mappings)
+                await update.message.reply_text("❌ 설정 저장 중 오류가 발생했습니다.")
+                return
+            
+            if new_mapping.digest:
+                digest = new_mapping.digest
+                await update.message.reply_text(
+                    f"✅ @{bot_username}의 텍스트 메시지를 묶어서 보냅니다.\n"
+                    f"최대 {digest['window_seconds']:g}초 또는 {digest['max_messages']}개씩"
+                )
+            else:
+                await update.message.reply_text(f"✅ @{bot_username}의 텍스트 메시지를 하나씩 보냅니다.")
+                
+        except Exception as e:
+            logger.error(f"digest 명령어 처리 중 오류: {e}")
+            await update.message.reply_text("❌ 명령어 처리 중 오류가 발생했습니다.")
+    
+    async def handle_addrule_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """내용 규칙 추가 명령어 처리"""
+        try:
+            # 등록된 그룹에서만 동작 (명령어를 보낸 그룹의 규칙을 수정)
+            chat_id = update.effective_chat.id
+            group = self._routes.get(chat_id)
+            if group is None:
+                return
+            
+            # 관리자 권한 확인
+            user = update.effective_user
+            if not await self.membership_cache.is_admin(context.bot, chat_id, user.id):
+                await update.message.reply_text("❌ 이 명령어는 관리자만 사용할 수 있습니다.")
+                return
+            
+            # 명령어 파싱: /addrule 종류 topic_id [@bot_username] 패턴 (패턴은 공백 포함 가능)
+            parts = update.message.text.split(None, 3)
+            kind = RULE_KIND_ALIASES.get(parts[1].lower()) if len(parts) > 1 else None
+            if len(parts) < 4 or kind is None:
+                await update.message.reply_text(
+                    "❌ 사용법: `/addrule 종류 topic_id [@bot_username] 패턴`\n"
+                    "종류: keyword, regex, regex\\_cs(대소문자 구분), hashtag, media\n"
+                    "예시: `/addrule keyword 123 @news_bot 속보`",
+                    parse_mode='Markdown'
+                )
+                return
+            
+            entry = {'target_topic_id': parts[2]}
+            pattern = parts[3]
+            if pattern.startswith('@') and len(pattern.split(None, 1)) == 2:
+                entry['source_bot_username'], pattern = pattern.split(None, 1)
+            entry[kind] = pattern
+            if parts[1].lower() == 'regex_cs':
+                # 대소문자를 구분하는 정규식
+                entry['case_sensitive'] = True
+            try:
+                rule = normalize_rule(entry)
+            except RuleError as e:
+                await update.message.reply_text(f"❌ {e}")
+                return
+            
+            # 규칙 추가 (복사본을 수정한 뒤 교체, 매처도 다시 컴파일)
+            old_rules = group.rules
+            self.swap_mappings(chat_id, group.bot_mappings, rules=old_rules + [rule])
+            if await self.save_bot_mappings():
+                await update.message.reply_text(f"✅ 내용 규칙이 추가되었습니다!\n{self.format_rule(len(old_rules) + 1, rule)}")
+            else:
+                # 실패 시 복원
+                self.swap_mappings(chat_id, group.bot_mappings, rules=old_rules)
+                await update.message.reply_text("❌ 설정 저장 중 오류가 발생했습니다.")
+            
+        except Exception as e:
+            logger.error(f"addrule 명령어 처리 중 오류: {e}")
+            await update.message.reply_text("❌ 명령어 처리 중 오류가 발생했습니다.")
+    
+    async def handle_rules_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """내용 규칙 목록 조회 명령어 처리"""
+        try:
+            # 등록된 그룹에서만 동작
+            group = self._routes.get(update.effective_chat.id)
+            if group is None:
+                return
+            
+            if not group.rules:
+                await update.message.reply_text("📝 설정된 내용 규칙이 없습니다.")
+                return
+            
+            # 패턴에 마크다운 특수문자가 있을 수 있으므로 일반 텍스트로 전송
+            message = "📋 현재 내용 규칙 (번호가 작은 규칙이 우선):\n\n"
+            for number, rule in enumerate(group.rules, 1):
+                message += self.format_rule(number, rule) + "\n"
+            message += "\n💡 /addrule 종류 topic_id [@bot_username] 패턴 - 규칙 추가\n"
+            message += "💡 /delrule 번호 - 규칙 삭제"
+            
+            await update.message.reply_text(message)
+            
+        except Exception as e:
+            logger.error(f"rules 명령어 처리 중 오류: {e}")
+            await update.message.reply_text("❌ 명령어 처리 중 오류가 발생했습니다.")
+    
+    async def handle_delrule_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """내용 규칙 삭제 명령어 처리"""
+        try:
+            # 등록된 그룹에서만 동작
+            chat_id = update.effective_chat.id
+            group = self._routes.get(chat_id)
+            if group is None:
+                return
+            
+            # 관리자 권한 확인
+            user = update.effective_user
+            if not await self.membership_cache.is_admin(context.bot, chat_id, user.id):
+                await update.message.reply_text("❌ 이 명령어는 관리자만 사용할 수 있습니다.")
+                return
+            
+            # 명령어 파싱: /delrule 번호
+            args = context.args
+            if len(args) != 1 or not args[0].isdigit():
+                await update.message.reply_text(
+                    "❌ 사용법: `/delrule 번호` (번호는 `/rules`에서 확인)",
+                    parse_mode='Markdown'
+                )
+                return
+            
+            number = int(args[0])
+            if not 1 <= number <= len(group.rules):
+                await update.message.reply_text(f"❌ {number}번 규칙을 찾을 수 없습니다.")
+                return
+            
+            old_rules = group.rules
+            new_rules = list(old_rules)
+            removed_rule = new_rules.pop(number - 1)
+            self.swap_mappings(chat_id, group.bot_mappings, rules=new_rules)
+            if await self.save_bot_mappings():
+                await update.message.reply_text(f"✅ 내용 규칙이 삭제되었습니다.\n{self.format_rule(number, removed_rule)}")
+            else:
+                # 실패 시 복원
+                self.swap_mappings(chat_id, group.bot_mappings, rules=old_rules)
+                await update.message.reply_text("❌ 설정 저장 중 오류가 발생했습니다.")
+            
+        except Exception as e:
+            logger.error(f"delrule 명령어 처리 중 오류: {e}")
+            await update.message.reply_text("❌ 명령어 처리 중 오류가 발생했습니다.")
+    
+    def format_targets(self, record):
+        """매핑의 대상 토픽 목록 (다른 채팅의 추가 대상은 채팅ID:토픽ID)"""
+        targets = [str(record.topic_id)]
+        for chat_id, topic_id in record.extra_targets:
+            targets.append(f"{chat_id}:{topic_id}" if chat_id is not None else str(topic_id))
+        return ', '.join(targets)
+    
+    def format_rule(self, number, rule):
+        """내용 규칙 한 줄 설명"""
+        kind = rule_kind(rule)
+        pattern = f"#{rule[kind]}" if kind == 'hashtag' else rule[kind]
+        line = f"{number}. [{RULE_KIND_LABELS[kind]}] {pattern} → 토픽 {rule['target_topic_id']}"
+        if rule.get('case_sensitive'):
+            line += " (대소문자 구분)"
+        if rule.get('source_bot_username'):
+            line += f" (@{rule['source_bot_username']}만)"
+        return line
+    
     async def handle_help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """도움말 명령어 처리"""
         try:
-            # 그룹에서만 동작
-            if update.effective_chat.id != self.group_chat_id:
+            # 등록된 그룹에서만 동작
+            if update.effective_chat.id not in self._routes:
                 return
             
             help_text = """
 🤖 **텔레그램 포워더 봇 도움말**
 
 **명령어:**
-• `/set @bot_username topic_id [설명]` - 봇 매핑 추가/수정
-• `/list` - 현재 매핑 목록 조회
+• `/set @bot_username topic_id[,topic_id...] [설명]` - 봇 매핑 추가/수정 (여러 토픽이면 모두로 전송)
+• `/list [페이지]` - 현재 매핑 목록 조회 (페이지 단위)
 • `/remove @bot_username` - 봇 매핑 삭제
+• `/import [replace]` - JSON/CSV 문서의 매핑 일괄 반영 (문서 캡션 또는 문서에 답장)
+• `/export [csv]` - 매핑을 문서로 내보내기
+• `/digest @bot_username 초 [최대개수]` - 봇의 텍스트 메시지를 묶어서 전송 (`off`로 해제)
+• `/addrule 종류 topic_id [@bot_username] 패턴` - 내용 규칙 추가 (종류: keyword, regex, regex\\_cs, hashtag, media)
+• `/rules` - 내용 규칙 목록 조회
+• `/delrule 번호` - 내용 규칙 삭제
+• `/stats` - 봇 상태 통계 조회
 • `/help` - 이 도움말 표시
 
 **사용 예시:**
 • `/set @news_bot 123 뉴스 봇`
 • `/set @weather_bot 456`
 • `/remove @news_bot`
+• `/addrule hashtag 789 #속보`
 
 **동작 방식:**
 1. 메인 채널에서 매핑된 봇이 메시지 전송
-2. 자동으로 해당 토픽으로 포워딩
+2. 자동으로 해당 토픽으로 포워딩 (내용 규칙에 맞으면 규칙의 토픽으로)
 
 **권한:** 관리자만 설정 변경 가능
             """
@@ -306,180 +1130,815 @@ class TelegramForwarderBot:
             logger.error(f"help 명령어 처리 중 오류: {e}")
             await update.message.reply_text("❌ 명령어 처리 중 오류가 발생했습니다.")
     
+    async def handle_stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """봇 상태 통계 명령어 처리"""
+        try:
+            # 등록된 그룹에서만 동작
+            if update.effective_chat.id not in self._routes:
+                return
+            
+            cache_stats = self.membership_cache.stats()
+            message = "📊 **봇 상태 통계:**\n\n"
+            message += "👑 **권한 캐시:**\n"
+            message += f"• 항목 수: {cache_stats['size']}\n"
+            message += f"• 적중: {cache_stats['hits']} / 미스: {cache_stats['misses']}\n"
+            message += f"• 적중률: {cache_stats['hit_rate']:.1%}\n"
+            message += f"• LRU 제거: {cache_stats['evictions']}\n\n"
+            
+            queue_stats = self.update_processor.stats()
+            message += "📬 **업데이트 처리 큐:**\n"
+            message += f"• 워커 수: {queue_stats['workers']}\n"
+            message += f"• 대기 중: {queue_stats['queued']} (최대 {queue_stats['peak_queued']})\n"
+            message += f"• 처리 중: {queue_stats['in_flight']}\n"
+            message += f"• 처리 완료: {queue_stats['processed']}\n"
+            message += f"• 활성 토픽: {queue_stats['active_keys']} (토픽별 최대 대기 {queue_stats['max_key_depth']})\n"
+            message += f"• 라우팅 그룹: {len(self._routes)}\n"
+            if self.offset_tracker:
+                offset_stats = self.offset_tracker.stats()
+                message += f"• 처리 완료 오프셋: {offset_stats['offset']} (이미 처리해 건너뛴 업데이트 {offset_stats['skipped']})\n"
+                if offset_stats['held']:
+                    message += f"• 재시작 후 다시 처리할 업데이트: {offset_stats['held']}\n"
+            message += "\n"
+            
+            send_stats = self.send_scheduler.stats()
+            message += "📤 **전송 스케줄러:**\n"
+            message += f"• 전송 완료: {send_stats['sent']}\n"
+            message += f"• 429 재시도: {send_stats['retry_after']}\n"
+            message += f"• 제한 대기 시간: {send_stats['throttled_seconds']:.1f}초\n\n"
+            
+            outbox_counts = await self.outbox.counts()
+            message += "📦 **포워딩 대기열:**\n"
+            message += f"• 재시도 대기: {outbox_counts[ForwardOutbox.PENDING]}\n"
+            message += f"• 전송 완료: {outbox_counts[ForwardOutbox.DONE]}\n"
+            message += f"• 포기: {outbox_counts[ForwardOutbox.DEAD]}\n\n"
+            
+            dedup_stats = self.dedup.stats()
+            message += "🧯 **중복 억제:**\n"
+            message += f"• 같은 업데이트: {dedup_stats['suppressed_updates']}\n"
+            message += f"• 같은 내용: {dedup_stats['suppressed_content']}\n"
+            message += f"• 기억 중인 항목: {dedup_stats['size']}\n\n"
+            
+            album_stats = self.media_groups.stats()
+            message += "🖼 **앨범 묶음 전송:**\n"
+            message += f"• 전송한 앨범: {album_stats['albums']} ({album_stats['items']}개 항목)\n"
+            message += f"• 절약한 API 호출: {album_stats['saved_calls']}\n\n"
+            
+            digest_stats = self.digests.stats()
+            message += "🧾 **텍스트 묶음 전송:**\n"
+            message += f"• 전송한 묶음: {digest_stats['digests']} ({digest_stats['items']}개 메시지)\n"
+            message += f"• 절약한 API 호출: {digest_stats['saved_calls']}"
+            
+            latency_stats = self.copy_engine.stats()
+            if latency_stats:
+                message += "\n\n⏱ **타입별 전송 지연:**\n"
+                for kind, stats in latency_stats.items():
+                    message += f"• {kind}: {stats['count']}건, 평균 {stats['avg'] * 1000:.0f}ms, 최대 {stats['max'] * 1000:.0f}ms\n"
+                message += f"• 전달로 대체: {self.copy_engine.fallbacks}건"
+            
+            await update.message.reply_text(message, parse_mode='Markdown')
+            
+        except Exception as e:
+            logger.error(f"stats 명령어 처리 중 오류: {e}")
+            await update.message.reply_text("❌ 명령어 처리 중 오류가 발생했습니다.")
+    
+    async def handle_chat_member(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """멤버 권한 변경 업데이트로 권한 캐시 갱신"""
+        chat_member_update = update.chat_member
+        if not chat_member_update:
+            return
+        
+        new_member = chat_member_update.new_chat_member
+        self.membership_cache.set(chat_member_update.chat.id, new_member.user.id, new_member.status)
+        logger.info(f"👑 권한 캐시 갱신: {new_member.user.id} -> {new_member.status}")
+    
+    def update_received_at(self, update):
+        """업데이트를 처음 받은 시각 (time.time 기준, 지연 시간 지표용)
+        
+        처리기와 샤드 큐에서 기다린 시간도 포함되도록 업데이트 큐에 들어간 시각(워커는 수신 프로세스가 큐에 기록한 시각)을 씁니다.
+        """
+        received_at = self._queued_at.get(update.update_id)
+        if received_at is None and self.offset_tracker:
+            received_at = self.offset_tracker.received_at(update.update_id)
+        return received_at if received_at is not None else time.time()
+    
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """메시지 처리 함수"""
         try:
+            received_at = self.update_received_at(update)
             message = update.message
             if not message:
                 logger.debug("메시지가 없음 - 스킵")
                 return
             
-            logger.info(f"📨 메시지 수신 - 채팅 ID: {message.chat.id}, 타입: {message.chat.type}")
-            
-            # 그룹 채팅에서만 동작
-            if message.chat.id != self.group_chat_id:
-                logger.info(f"❌ 다른 채팅에서 온 메시지 - 현재: {message.chat.id}, 대상: {self.group_chat_id}")
+            # 채팅/봇 여부/매핑 확인은 핸들러 필터에서 이미 처리됨 - 여기서는 방어적으로만 확인
+            sender = message.from_user
+            if message.chat.id not in self._routes or not sender or not sender.is_bot:
+                logger.debug("대상이 아닌 메시지 - 스킵 (채팅 ID: %s)", message.chat.id)
                 return
             
-            logger.info(f"✅ 올바른 그룹에서 온 메시지")
-            logger.info(f"📍 토픽 ID: {message.message_thread_id} (None이면 메인 채널)")
-            
-            # 임시로 메인 채널 필터 제거 - 모든 메시지 감지
-            # if message.message_thread_id is not None:
-            #     logger.info(f"❌ 토픽 메시지이므로 스킵 - 토픽 ID: {message.message_thread_id}")
-            #     return
+            # 메시지별 상세 로그는 DEBUG 레벨에서 일부만 샘플링해서 기록
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "📨 메시지 수신 - 채팅 ID: %s, 토픽 ID: %s, 발신자: @%s (%s, ID %s), 권한: %s, 내용: %s",
+                    message.chat.id,
+                    message.message_thread_id,
+                    sender.username or 'N/A',
+                    sender.first_name,
+                    sender.id,
+                    self.membership_cache.peek(message.chat.id, sender.id) or '알 수 없음',
+                    message.text[:50] if message.text else 'Media message',
+                    extra={'sampled': True}
+                )
             
-            if message.message_thread_id is not None:
-                logger.info(f"🔍 토픽 메시지 감지 - 토픽 ID: {message.message_thread_id}")
-            else:
-                logger.info(f"✅ 메인 채널 메시지 확인됨")
+            # 매핑된 봇인지 확인하고 대상 채팅/토픽 찾기 (추가 대상이 있으면 여러 개)
+            routes = self.get_routes(message.chat.id, sender, message)
             
-            # 발신자 정보 로그
-            if message.from_user:
-                logger.info(f"👤 발신자: @{message.from_user.username or 'N/A'} ({message.from_user.first_name})")
-                logger.info(f"🤖 봇 여부: {message.from_user.is_bot}")
-                logger.info(f"🆔 사용자 ID: {message.from_user.id}")
-                
-                # 발신자의 권한 확인
-                try:
-                    chat_member = await context.bot.get_chat_member(self.group_chat_id, message.from_user.id)
-                    logger.info(f"👑 권한 상태: {chat_member.status}")
-                except Exception as e:
-                    logger.info(f"❌ 권한 확인 실패: {e}")
-            else:
-                logger.info(f"❌ 발신자 정보 없음")
+            if not routes:
+                if self._routes.get(message.chat.id).settings.get('log_unknown_bots', True):
+                    logger.info("❌ 매핑되지 않은 봇 메시지: @%s (%s)", sender.username or 'N/A', sender.first_name)
                 return
+            target_chat_id, target_topic_id = routes[0]
             
-            # 봇 메시지인지 확인
-            if not message.from_user.is_bot:
-                logger.info(f"❌ 사용자 메시지이므로 스킵")
+            # 처음 보는 매핑된 봇이면 사용자 ID를 기록 (다음부터는 ID 조회 한 번으로 라우팅)
+            # 워커는 매핑을 쓰지 않음 - 수신 역할이 발행할 때 기록한 것을 매핑 감시로 받음
+            if self.role == 'all':
+                self.remember_bot_id(message.chat.id, sender)
+            
+            # 같은 업데이트나 같은 토픽으로 가는 같은 내용이면 포워딩하지 않음
+            duplicate = self.dedup.check(message, target_chat_id, target_topic_id)
+            if duplicate:
+                logger.info("⏭️ 중복 메시지 억제 (%s) - 메시지 ID: %s", duplicate, message.message_id)
                 return
             
-            logger.info(f"✅ 봇 메시지 확인됨")
+            # 포워딩 전에 대상별로 대기열에 기록 (이미 전송된 대상은 스킵)
+            try:
+                enqueued = await self.outbox.enqueue_many(
+                    message.chat.id, message.message_id, message.to_dict(), routes
+                )
+            except asyncio.CancelledError:
+                # 종료 중 중단되면 재시작 후 다시 처리될 수 있도록 중복 기록을 되돌림
+                self.dedup.forget(message, target_chat_id, target_topic_id)
+                raise
             
-            # 매핑된 봇인지 확인하고 타겟 토픽 찾기
-            target_topic_id = self.get_target_topic_for_bot(message.from_user)
+            deliveries = []
+            for route, is_new in zip(routes, enqueued):
+                if not is_new:
+                    logger.info("⏭️ 이미 포워딩된 메시지 - 메시지 ID: %s (%s 토픽 %s)", message.message_id, *route)
+                    continue
+                key = ForwardOutbox.make_key(message.chat.id, message.message_id, route[1], route[0])
+                self._outbox_inflight.add(key)
+                self._received_at[key] = received_at
+                deliveries.append((route, key))
             
-            if target_topic_id is None:
-                if self.settings.get('log_unknown_bots', True):
-                    logger.info(f"❌ 매핑되지 않은 봇 메시지: @{message.from_user.username or 'N/A'} ({message.from_user.first_name})")
+            # 앨범 항목은 대상별로 모아서 한 번에 전달 (같은 토픽의 텍스트 묶음을 먼저 보내 순서 유지)
+            if message.media_group_id:
+                for route, key in deliveries:
+                    await self.digests.flush_topic(route)
+                    group_key = (message.chat.id, message.media_group_id) + route
+                    await self.media_groups.add(group_key, route, (key, message))
                 return
             
-            logger.info(f"🎯 봇 메시지 감지: @{message.from_user.username or 'N/A'} -> 토픽 {target_topic_id}")
-            logger.info(f"📝 메시지 내용: {message.text[:50] if message.text else 'Media message'}")
+            # 묶음 설정이 있는 봇의 텍스트 메시지는 대상별로 모았다가 합쳐서 전달
+            digest = self.get_digest(message)
+            if digest is not None:
+                for route, key in deliveries:
+                    await self.media_groups.flush_topic(route)
+                    await self.digests.add((route, sender.id), route, (key, message), utf16_length(message.text), digest)
+                return
             
-            # 메시지를 해당 토픽으로 포워딩
-            await self.forward_to_topic(message, context, target_topic_id)
+            # 모든 대상으로 동시에 포워딩 (전송 제한은 스케줄러가 대상 채팅별로 적용)
+            results = await asyncio.gather(*(
+                self.deliver_to_route(route, [(key, message)], context) for route, key in deliveries
+            ))
+            if len(deliveries) > 1:
+                self.log_fan_out(message, [route for route, _ in deliveries], results)
             
         except Exception as e:
-            logger.error(f"메시지 처리 중 오류 발생: {e}")
-            import traceback
-            logger.error(traceback.format_exc())
-    
-    def get_target_topic_for_bot(self, bot_user):
-        """봇 사용자에 대한 타겟 토픽 ID를 찾기"""
-        # 사용자명으로 매핑 확인
-        if bot_user.username:
-            username = bot_user.username.replace('@', '')
-            if username in self.bot_mappings:
-                return self.bot_mappings[username]['topic_id']
-        
-        # 이름으로 매핑 확인 (부분 일치)
-        bot_name = bot_user.first_name.replace('@', '').lower()
-        for mapped_username, config in self.bot_mappings.items():
-            if mapped_username in bot_name or bot_name in mapped_username:
-                return config['topic_id']
-        
-        # 알 수 없는 봇에 대한 기본 처리
-        if self.settings.get('forward_all_unknown_bots', False):
-            return self.settings.get('default_topic_id')
-        
-        return None
-    
-    async def forward_to_topic(self, message, context, target_topic_id):
-        """메시지를 특정 토픽으로 포워딩"""
+            logger.exception("메시지 처리 중 오류 발생: %s", e)
+    
+    async def publish_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """수신 역할: 업데이트를 대상 토픽 기준 샤드 큐에 발행 (같은 토픽은 같은 워커가 처리)
+        
+        발행이 계속 실패하면 업데이트를 완료로 기록하지 않고 남겨 재시작 후 다시 발행합니다.
+        """
+        # 매핑 변경(/set 등)을 처리하는 수신 역할만 확인된 봇 ID를 기록 (워커는 매핑 감시로 반영)
+        message = update.message
+        if message and message.from_user and message.chat.id in self._routes:
+            self.remember_bot_id(message.chat.id, message.from_user)
+        
+        for attempt in range(3):
+            try:
+                shard = shard_for(self.get_update_ordering_key(update), self.shard_count)
+                received_at = self.offset_tracker.received_at(update.update_id) if self.offset_tracker else None
+                await self.update_queue.publish(shard, update.to_dict(), received_at)
+                return
+            except Exception as e:
+                logger.exception("업데이트 발행 중 오류 발생 (%d회차): %s", attempt + 1, e)
+                await asyncio.sleep(0.5 * 2 ** attempt)
+        if self.offset_tracker:
+            self.offset_tracker.hold(update)
+            logger.error("업데이트 %s 발행 실패 - 재시작 후 다시 처리합니다.", update.update_id)
+    
+    async def consume_shard(self, shard):
+        """워커 역할: 샤드 큐의 업데이트를 순서대로 기존 핸들러로 처리"""
+        poll_interval = float(os.getenv('WORKER_POLL_INTERVAL', 0.2))
+        while not self._stop_requested:
+            try:
+                batch = await self.update_queue.claim(shard)
+                if not batch:
+                    await asyncio.sleep(poll_interval)
+                    continue
+                for _, payload, received_at in batch:
+                    update = Update.de_json(payload, self.application.bot)
+                    self._queued_at[update.update_id] = received_at
+                    try:
+                        await self.application.process_update(update)
+                    finally:
+                        self._queued_at.pop(update.update_id, None)
+                # 처리 도중 종료되면 다시 받게 되지만, 이미 포워딩된 메시지는 대기열이 걸러냄
+                await self.update_queue.ack([item_id for item_id, _, _ in batch])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"샤드 {shard} 처리 중 오류: {e}")
+                await asyncio.sleep(poll_interval)
+    
+    def owns_outbox_entry(self, entry):
+        """이 프로세스가 재시도할 대기열 항목인지 (워커는 자기 샤드의 항목만)
+        
+        여러 대상으로 보내는 항목은 업데이트를 처리한 워커(첫 대상의 샤드)가 모두 맡으므로
+        다른 워커가 전송 중인 추가 대상 항목을 동시에 보내지 않습니다.
+        """
+        if self.role == 'all':
+            return True
+        key = ('topic',) + tuple(entry['owner'])
+        return shard_for(key, self.shard_count) in self.worker_shards
+    
+    def remember_bot_id(self, chat_id, bot_user):
+        """매핑된 봇의 사용자 ID를 확인해 bot_mapping.json에 기록
+        
+        사용자명이 정확히 일치할 때만 ID를 기록하고(이름 부분 일치는 기록하지 않음),
+        새로 확인된 ID는 현재 라우팅 인덱스에 바로 추가한 뒤 모아서 저장합니다.
+        확인된 봇의 사용자명이 바뀌면 매핑 이름을 새 사용자명으로 바꿉니다.
+        같은 사용자명을 다른 봇이 쓰게 되면 새 봇의 ID로 다시 확인합니다.
+        """
+        group = self._routes.get(chat_id)
+        rules = None
+        mapped = group.index.owner(bot_user.id)
+        if mapped is not None:
+            new_username = bot_user.username
+            if not new_username or mapped == new_username or new_username in group.bot_mappings:
+                return
+            new_mappings = group.bot_mappings.copy()
+            new_mappings.rename(mapped, new_username)
+            # 이 봇 전용 내용 규칙도 새 사용자명으로
+            rules = [
+                dict(rule, source_bot_username=new_username) if rule.get('source_bot_username') == mapped else rule
+                for rule in group.rules
+            ]
+            logger.info(f"🔁 봇 사용자명 변경 반영: @{mapped} -> @{new_username} (ID {bot_user.id})")
+        else:
+            mapped = group.index.match_username(bot_user)
+            if mapped is None:
+                return
+            record = group.bot_mappings.get(mapped)
+            if record.user_id is not None:
+                logger.warning(f"⚠️ @{mapped} 사용자명을 다른 봇이 사용 중 - 봇 ID 다시 확인: {record.user_id} -> {bot_user.id}")
+            else:
+                logger.info(f"🔎 @{mapped} 봇 ID 확인: {bot_user.id}")
+            # 레코드와 인덱스를 그 자리에서 갱신 (메시지마다 인덱스를 다시 만들지 않음)
+            group.bot_mappings.put(record.replace(user_id=bot_user.id))
+            group.index.resolve(bot_user.id, mapped, previous_id=record.user_id)
+            self.schedule_mapping_save()
+            return
+        
+        self.swap_mappings(chat_id, new_mappings, rules=rules)
+        self.schedule_mapping_save()
+    
+    def schedule_mapping_save(self):
+        """자동으로 바뀐 매핑(확인된 봇 ID 등)을 모아 한 번에 저장 (메시지 처리를 기다리게 하지 않음)"""
+        if self._mapping_save_task is None:
+            self._mapping_save_task = self.application.create_task(self._save_resolved_mappings())
+    
+    async def _save_resolved_mappings(self):
+        await asyncio.sleep(self.mapping_writer.delay)
+        # 저장 중에 확인된 ID는 다음 저장에서 기록되도록 먼저 비움
+        self._mapping_save_task = None
+        await self.save_bot_mappings()
+    
+    def get_update_ordering_key(self, update):
+        """업데이트 처리 순서 키 (같은 키끼리는 순서대로 처리)"""
+        message = getattr(update, 'message', None)
+        if not message:
+            return None
+        
+        # 명령어는 매핑 변경 순서가 중요하므로 하나의 키로 직렬화
+        if message.text and message.text.startswith('/'):
+            return ('control', message.chat.id)
+        
+        if message.chat.id not in self._routes or not message.from_user or not message.from_user.is_bot:
+            return None
+        
+        route = self.get_route(message.chat.id, message.from_user, message)
+        if route is None:
+            return None
+        return ('topic',) + route
+    
+    def get_update_tenant(self, update):
+        """업데이트가 속한 그룹 (그룹별 동시 처리 수 제한용)"""
+        message = getattr(update, 'message', None)
+        if not message or message.chat.id not in self._routes:
+            return None
+        return message.chat.id
+    
+    def get_digest(self, message):
+        """메시지를 묶어 보낼 경우 발신 봇 매핑의 묶음 설정 (묶지 않으면 None)
+        
+        버튼이 없는 텍스트 메시지만 묶습니다 (미디어, 앨범, 인라인 키보드는 그대로 복사).
+        """
+        if not message.text or message.reply_markup or message.media_group_id:
+            return None
+        group = self._routes.get(message.chat.id)
+        if group is None:
+            return None
+        return group.index.digest(message.from_user)
+    
+    def get_route(self, chat_id, bot_user, message=None):
+        """(원본 그룹, 봇 사용자)에 대한 기본 대상 (대상 채팅 ID, 토픽 ID) 찾기 (매핑이 없으면 None)
+        
+        처리 순서 키를 정할 때 쓰므로 라우팅 조회 지표에는 세지 않습니다 (handle_message에서 메시지당 한 번).
+        """
+        routes = self.get_routes(chat_id, bot_user, message, fan_out=False, count=False)
+        return routes[0] if routes else None
+    
+    def get_routes(self, chat_id, bot_user, message=None, fan_out=True, count=True):
+        """(원본 그룹, 봇 사용자)에 대한 모든 대상 [(대상 채팅 ID, 토픽 ID), ...] 찾기
+        
+        첫 번째가 기본 대상이고, 매핑에 추가 대상이 있으면 뒤에 붙습니다 (매핑이 없으면 빈 목록).
+        message를 주면 그룹의 내용 규칙에 맞는 메시지는 규칙의 토픽 하나로만 보냅니다.
+        count가 False면 라우팅 조회 지표에 기록하지 않습니다.
+        """
+        group = self._routes.get(chat_id)
+        if group is None:
+            if count:
+                self.metrics.routing_lookups.inc('unmapped')
+            return []
+        
+        # 사용자 ID/사용자명/이름 매칭은 그룹별로 미리 컴파일된 라우팅 인덱스에서 처리
+        topic_id = group.index.lookup(bot_user)
+        result = 'mapped'
+        
+        # 알 수 없는 봇에 대한 기본 처리 (그룹별 설정)
+        if topic_id is None and group.settings.get('forward_all_unknown_bots', False):
+            topic_id = group.settings.get('default_topic_id')
+            result = 'default'
+        
+        if topic_id is None:
+            if count:
+                self.metrics.routing_lookups.inc('unmapped')
+            return []
+        
+        # 내용 규칙은 미리 컴파일된 매처로 메시지당 한 번만 평가
+        if message is not None and group.content_router is not None:
+            rule_topic_id = group.rule_topic(message)
+            if rule_topic_id is not None:
+                topic_id = rule_topic_id
+                result = 'rule'
+        
+        if count:
+            self.metrics.routing_lookups.inc(result)
+        routes = [(group.target_chat_id, topic_id)]
+        if fan_out and result == 'mapped' and group.index.has_fan_out:
+            routes.extend(route for route in group.fan_out(bot_user) if route not in routes)
+        return routes
+    
+    async def forward_to_topic(self, message, context, target_topic_id, target_chat_id=None):
+        """메시지를 특정 토픽으로 포워딩 (copyMessage로 엔티티와 미디어를 그대로 복사)
+        
+        target_chat_id가 없으면 원본 그룹 안의 토픽으로 보냅니다.
+        """
+        if target_chat_id is None:
+            target_chat_id = message.chat.id
         try:
-            # 텍스트 메시지인 경우
-            if message.text:
-                await context.bot.send_message(
-                    chat_id=self.group_chat_id,
-                    text=message.text,
-                    message_thread_id=target_topic_id,
-                    parse_mode=message.parse_entities() and 'HTML' or None
-                )
-            
-            # 사진 메시지인 경우
-            elif message.photo:
-                await context.bot.send_photo(
-                    chat_id=self.group_chat_id,
-                    photo=message.photo[-1].file_id,
-                    caption=message.caption,
-                    message_thread_id=target_topic_id
-                )
+            await self.copy_engine.copy(context.bot, message, target_chat_id, target_topic_id)
+            logger.debug("메시지를 토픽 %s로 포워딩 완료", target_topic_id)
             
-            # 문서 메시지인 경우
-            elif message.document:
-                await context.bot.send_document(
-                    chat_id=self.group_chat_id,
-                    document=message.document.file_id,
-                    caption=message.caption,
+        except Exception as e:
+            logger.error("메시지 포워딩 중 오류 발생: %s", e)
+            raise
+    
+    async def forward_digest(self, messages, context, target_topic_id, target_chat_id=None):
+        """텍스트 메시지들을 이어 붙여 특정 토픽에 전달 (4096자를 넘으면 메시지 경계에서 나눠 보냄)
+        
+        중간 묶음이 실패하면 앞 묶음까지 전송이 끝난 메시지 수를 담아 DigestDeliveryError를 발생시킵니다.
+        """
+        if target_chat_id is None:
+            target_chat_id = messages[0].chat.id
+        chunks = merge_texts([(message.text, message.entities) for message in messages])
+        delivered = 0
+        for text, entities, completed in chunks:
+            try:
+                await self.send_scheduler.send(
+                    target_chat_id,
+                    context.bot.send_message,
+                    chat_id=target_chat_id,
+                    text=text,
+                    entities=entities or None,
                     message_thread_id=target_topic_id
                 )
-            
-            # 비디오 메시지인 경우
+            except Exception as e:
+                logger.error("묶음 메시지 포워딩 중 오류 발생: %s", e)
+                raise DigestDeliveryError(e, delivered)
+            delivered = completed
+        logger.debug("텍스트 %s개를 메시지 %s개로 묶어 토픽 %s로 포워딩 완료", len(messages), len(chunks), target_topic_id)
+    
+    async def forward_media_group(self, messages, context, target_topic_id, target_chat_id=None):
+        """앨범 메시지들을 한 번의 호출로 특정 토픽에 전달"""
+        if target_chat_id is None:
+            target_chat_id = messages[0].chat.id
+        # copy_messages를 지원하면 앨범 구성 그대로 서버 측 복사
+        try:
+            if await self.copy_engine.copy_batch(context.bot, messages, target_chat_id, target_topic_id):
+                logger.debug("앨범 %s개 항목을 토픽 %s로 포워딩 완료", len(messages), target_topic_id)
+                return
+        except Exception as e:
+            logger.error("앨범 포워딩 중 오류 발생: %s", e)
+            raise
+        
+        media = []
+        for message in messages:
+            kwargs = {
+                'caption': message.caption,
+                'caption_entities': message.caption_entities or None
+            }
+            if message.photo:
+                media.append(InputMediaPhoto(message.photo[-1].file_id, **kwargs))
             elif message.video:
-                await context.bot.send_video(
-                    chat_id=self.group_chat_id,
-                    video=message.video.file_id,
-                    caption=message.caption,
-                    message_thread_id=target_topic_id
-                )
-            
-            # 음성 메시지인 경우
-            elif message.voice:
-                await context.bot.send_voice(
-                    chat_id=self.group_chat_id,
-                    voice=message.voice.file_id,
-                    caption=message.caption,
-                    message_thread_id=target_topic_id
-                )
-            
-            # 스티커 메시지인 경우
-            elif message.sticker:
-                await context.bot.send_sticker(
-                    chat_id=self.group_chat_id,
-                    sticker=message.sticker.file_id,
-                    message_thread_id=target_topic_id
-                )
-            
-            # 기타 메시지 타입의 경우 포워딩 사용
+                media.append(InputMediaVideo(message.video.file_id, **kwargs))
+            elif message.document:
+                media.append(InputMediaDocument(message.document.file_id, **kwargs))
+            elif message.audio:
+                media.append(InputMediaAudio(message.audio.file_id, **kwargs))
             else:
-                await context.bot.forward_message(
-                    chat_id=self.group_chat_id,
-                    from_chat_id=message.chat.id,
-                    message_id=message.message_id,
-                    message_thread_id=target_topic_id
-                )
-            
-            logger.info(f"메시지를 토픽 {target_topic_id}로 포워딩 완료")
-            
+                media = None
+                break
+        
+        # 앨범으로 보낼 수 없는 항목이 있으면 하나씩 전달
+        if not media:
+            for message in messages:
+                await self.forward_to_topic(message, context, target_topic_id, target_chat_id)
+            return
+        
+        try:
+            started_at = time.monotonic()
+            await self.send_scheduler.send(
+                target_chat_id,
+                context.bot.send_media_group,
+                chat_id=target_chat_id,
+                media=media,
+                message_thread_id=target_topic_id
+            )
+            self.copy_engine.observe_media_group(started_at)
+            logger.debug("앨범 %s개 항목을 토픽 %s로 포워딩 완료", len(media), target_topic_id)
         except Exception as e:
-            logger.error(f"메시지 포워딩 중 오류 발생: {e}")
+            logger.error("앨범 포워딩 중 오류 발생: %s", e)
+            raise
+    
+    async def deliver_from_outbox(self, entries, context, target_chat_id, target_topic_id, digest=False):
+        """대기열 항목들을 포워딩하고 결과를 기록 (여러 항목이면 앨범으로, digest면 텍스트 묶음으로 전달)"""
+        keys = [key for key, _ in entries]
+        messages = [message for _, message in entries]
+        chat_label = str(target_chat_id)
+        topic_label = str(target_topic_id)
+        self._outbox_inflight.update(keys)
+        error = None
+        delivered = len(entries)
+        try:
+            if len(messages) == 1:
+                await self.forward_to_topic(messages[0], context, target_topic_id, target_chat_id)
+            elif digest:
+                await self.forward_digest(messages, context, target_topic_id, target_chat_id)
+            else:
+                await self.forward_media_group(messages, context, target_topic_id, target_chat_id)
+        except DigestDeliveryError as e:
+            # 이미 전송된 묶음의 메시지는 완료로 기록해 재시도 때 다시 보내지 않음
+            error, delivered = e.error, e.delivered
+        except Exception as e:
+            error, delivered = e, 0
+        finally:
+            self._outbox_inflight.difference_update(keys)
+        
+        if error is not None:
+            failed_keys = keys[delivered:]
+            self.metrics.forward_failures.inc(chat_label, topic_label, amount=len(failed_keys))
+            for key in failed_keys:
+                status = await self.outbox.mark_failed(key, error)
+                if status == ForwardOutbox.DEAD:
+                    self._received_at.pop(key, None)
+                    logger.error(f"💀 재시도 한도 초과로 포워딩 포기: {key}")
+                else:
+                    logger.warning(f"🔁 포워딩 실패 - 나중에 재시도: {key}")
+        
+        for key in keys[:delivered]:
+            await self.outbox.mark_done(key)
+        
+        # 포워딩된 메시지마다 지표 기록과 요약 로그 한 건
+        completed_at = time.time()
+        for key, message in entries[:delivered]:
+            sender = message.from_user
+            bot_label = (sender.username or str(sender.id)) if sender else 'unknown'
+            self.metrics.forwarded.inc(bot_label, chat_label, topic_label)
+            received_at = self._received_at.pop(key, None)
+            if received_at is not None:
+                self.metrics.forward_latency_by_topic.observe(completed_at - received_at, chat_label, topic_label)
+                self.metrics.forward_latency_by_bot.observe(completed_at - received_at, bot_label)
+
+            logger.info(
+                "✅ 포워딩 완료: @%s -> %s 토픽 %s (메시지 ID: %s)",
+                sender.username if sender else 'N/A',
+                target_chat_id,
+                target_topic_id,
+                message.message_id,
+                extra={
+                    'event': 'forwarded',
+                    'chat_id': message.chat.id,
+                    'message_id': message.message_id,
+                    'sender_id': sender.id if sender else None,
+                    'sender': sender.username if sender else None,
+                    'target_chat_id': target_chat_id,
+                    'topic_id': target_topic_id,
+                    'kind': message_type(message),
+                    'batch_size': len(messages)
+                }
+            )
+        return error is None
+    
+    async def deliver_to_route(self, route, entries, context):
+        """같은 토픽으로 갈 앨범/텍스트 묶음을 먼저 보낸 뒤(순서 유지) 대상 하나로 전달, 성공 여부 반환"""
+        await self.digests.flush_topic(route)
+        await self.media_groups.flush_topic(route)
+        target_chat_id, target_topic_id = route
+        return await self.deliver_from_outbox(entries, context, target_chat_id, target_topic_id)
+    
+    def log_fan_out(self, message, routes, results):
+        """여러 대상으로 보낸 메시지의 대상별 결과 요약"""
+        failed = [f"{chat_id} 토픽 {topic_id}" for (chat_id, topic_id), ok in zip(routes, results) if not ok]
+        if failed:
+            logger.warning(
+                f"📣 팬아웃 결과 - 메시지 ID {message.message_id}: {len(routes) - len(failed)}/{len(routes)}개 대상 성공, "
+                f"실패(재시도 예정): {', '.join(failed)}"
+            )
+        else:
+            logger.debug("📣 팬아웃 완료 - 메시지 ID %s: %s개 대상", message.message_id, len(routes))
+    
+    async def deliver_media_group(self, route, entries):
+        """모아 둔 앨범 항목을 메시지 ID 순서대로 전달"""
+        target_chat_id, target_topic_id = route
+        entries.sort(key=lambda entry: entry[1].message_id)
+        await self.deliver_from_outbox(entries, CallbackContext(self.application), target_chat_id, target_topic_id)
+    
+    async def deliver_digest(self, route, entries):
+        """모아 둔 텍스트 메시지를 메시지 ID 순서대로 합쳐서 전달"""
+        target_chat_id, target_topic_id = route
+        entries.sort(key=lambda entry: entry[1].message_id)
+        await self.deliver_from_outbox(
+            entries, CallbackContext(self.application), target_chat_id, target_topic_id, digest=True
+        )
+    
+    async def outbox_worker(self):
+        """대기열에 남은 항목을 지수 백오프로 재시도 (재시작 시 미전송 항목 재전송 포함)"""
+        context = CallbackContext(self.application)
+        last_purge = 0.0
+        last_dedup_save = time.monotonic()
+        dedup_save_interval = float(os.getenv('DEDUP_SAVE_INTERVAL', 60))
+        while True:
+            try:
+                # 같은 앨범의 항목은 다시 한 번에 전달
+                batches = {}
+                for entry in await self.outbox.due_entries():
+                    if entry['key'] in self._outbox_inflight or not self.owns_outbox_entry(entry):
+                        continue
+                    media_group_id = entry['payload'].get('media_group_id')
+                    batch_key = (
+                        (media_group_id, entry['target_chat_id'], entry['topic_id']) if media_group_id else entry['key']
+                    )
+                    batches.setdefault(batch_key, []).append(entry)
+                
+                for batch in batches.values():
+                    items = [
+                        (entry['key'], Message.de_json(entry['payload'], self.application.bot))
+                        for entry in batch
+                    ]
+                    logger.info(f"🔁 대기열 재시도 ({batch[0]['attempts'] + 1}회차): {', '.join(key for key, _ in items)}")
+                    await self.deliver_from_outbox(items, context, batch[0]['target_chat_id'], batch[0]['topic_id'])
+                
+                # 지표용 상태별 항목 수 (스크레이프마다 DB를 읽지 않도록 여기서 갱신)
+                self._outbox_counts = await self.outbox.counts()
+                
+                if time.monotonic() - last_dedup_save > dedup_save_interval:
+                    last_dedup_save = time.monotonic()
+                    await asyncio.to_thread(atomic_write_json, self.dedup_state_path, self.dedup.snapshot())
+                
+                if time.monotonic() - last_purge > 3600:
+                    last_purge = time.monotonic()
+                    purged = await self.outbox.purge_done(self.outbox_retention_seconds)
+                    if purged:
+                        logger.info(f"🧹 오래된 대기열 항목 {purged}개 정리")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"대기열 처리 중 오류: {e}")
+            
+            await asyncio.sleep(1.0)
+    
+    async def post_init(self, application):
+        """애플리케이션 시작 후 백그라운드 작업 시작"""
+        counts = await self.outbox.counts()
+        if counts[ForwardOutbox.PENDING]:
+            logger.info(f"📦 미전송 대기열 항목 {counts[ForwardOutbox.PENDING]}개를 다시 전송합니다.")
+        # 지난 종료 때 처리하지 못한 업데이트부터 다시 처리
+        if self._replay_updates:
+            logger.info(f"⏯️ 지난 종료 때 처리하지 못한 업데이트 {len(self._replay_updates)}개를 다시 처리합니다.")
+            for payload in self._replay_updates:
+                await application.update_queue.put(Update.de_json(payload, application.bot))
+            self._replay_updates = []
+        # 수신 역할은 포워딩하지 않으므로 재시도 작업도 워커에게 맡김
+        if self.role != 'ingest':
+            self._outbox_task = asyncio.create_task(self.outbox_worker())
+        if self.config_watcher:
+            self.config_watcher.start()
+        if self.mapping_db_watcher:
+            self.mapping_db_watcher.start()
+        if self.metrics_server:
+            self.metrics_server.start()
+    
+    async def post_stop(self, application):
+        """업데이트 처리가 멈춘 뒤, 봇 연결이 닫히기 전에 재시도 작업을 멈추고 모아 둔 앨범 전달"""
+        # 전송 중이던 재시도 항목은 대기열에 남아 재시작 후 다시 전송됨
+        if self._outbox_task:
+            self._outbox_task.cancel()
+            try:
+                await self._outbox_task
+            except asyncio.CancelledError:
+                pass
+            self._outbox_task = None
+        await self.digests.flush_all()
+        await self.media_groups.flush_all()
+    
+    async def post_shutdown(self, application):
+        """애플리케이션 종료 시 백그라운드 작업 정리"""
+        if self.config_watcher:
+            await self.config_watcher.stop()
+        if self.mapping_db_watcher:
+            await self.mapping_db_watcher.stop()
+        if self.metrics_server:
+            self.metrics_server.stop()
+        if self._mapping_save_task is not None:
+            await self._mapping_save_task
+        await self.mapping_writer.flush()
+        # 수신 역할은 포워딩하지 않으므로 저장할 상태가 없음
+        if self.role != 'ingest':
+            try:
+                self.dedup.save(self.dedup_state_path)
+            except OSError as e:
+                logger.error(f"중복 억제 상태 저장 중 오류: {e}")
+        self.outbox.close()
+        if self.mapping_db is not None:
+            self.mapping_db.close()
+        if self.update_queue:
+            self.update_queue.close()
+    
+    def stop_signal_event(self):
+        """SIGINT/SIGTERM(재배포 시 Railway/Docker가 보냄)을 받으면 설정되는 이벤트"""
+        loop = asyncio.get_running_loop()
+        stop_event = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, stop_event.set)
+            except NotImplementedError:
+                pass
+        return stop_event
+    
+    async def run_intake(self, webhook_options=None):
+        """롱 폴링(또는 웹훅)으로 업데이트를 받아 처리하다가 종료 신호를 받으면 정상 종료"""
+        stop_event = self.stop_signal_event()
+        await self.application.initialize()
+        await self.post_init(self.application)
+        if webhook_options:
+            await self.application.updater.start_webhook(**webhook_options)
+        else:
+            await self.application.updater.start_polling(allowed_updates=self.get_allowed_updates())
+        await self.application.start()
+        try:
+            await stop_event.wait()
+        finally:
+            await self.shutdown_gracefully()
+    
+    async def shutdown_gracefully(self):
+        """수신 중단 → 처리 중인 업데이트 마무리(SHUTDOWN_TIMEOUT초 안에서) → 재시작 지점 저장 → 정리
+        
+        기한 안에 끝나지 않은 업데이트는 중단하고 재시작 지점에 남겨, 다음 실행 때 다시 처리합니다.
+        """
+        logger.info(f"🛑 종료 시작 - 새 업데이트 수신을 멈추고 처리 중인 업데이트를 마무리합니다 (최대 {self.shutdown_timeout:g}초)")
+        if self.application.updater.running:
+            await self.application.updater.stop()
+        
+        if not await self.offset_tracker.wait_idle(self.shutdown_timeout):
+            # 중단하기 전에 먼저 저장 (정리 도중 강제 종료되어도 재시작 지점은 남음)
+            self.save_update_offset()
+            aborted = self.update_processor.abort()
+            logger.warning(f"⏱️ 종료 기한 초과 - 처리 중이던 업데이트 {aborted}개를 중단하고 재시작 후 다시 처리합니다.")
+        
+        if self.application.running:
+            await self.application.stop()
+        await self.post_stop(self.application)
+        self.save_update_offset()
+        await self.application.shutdown()
+        await self.post_shutdown(self.application)
+    
+    def save_update_offset(self):
+        """처리가 끝난 업데이트 오프셋과 끝나지 않은 업데이트를 파일에 저장"""
+        try:
+            self.offset_tracker.save()
+        except OSError as e:
+            logger.error(f"업데이트 오프셋 저장 중 오류: {e}")
+            return
+        stats = self.offset_tracker.stats()
+        logger.info(f"💾 재시작 지점 저장: 업데이트 {stats['offset']}부터 (미처리 {stats['pending']}개)")
+    
+    async def run_worker(self):
+        """워커 역할로 실행 (텔레그램에서 직접 업데이트를 받지 않고 큐의 샤드를 소비)"""
+        stop_event = self.stop_signal_event()
+        await self.application.initialize()
+        await self.post_init(self.application)
+        await self.application.start()
+        logger.info(f"워커 시작: 샤드 {', '.join(map(str, self.worker_shards))} / 전체 {self.shard_count}개")
+        consumers = [asyncio.create_task(self.consume_shard(shard)) for shard in self.worker_shards]
+        try:
+            await stop_event.wait()
+        finally:
+            # 지금 처리 중인 배치는 기한 안에서 마무리 (ack하지 못한 배치는 재시작 후 다시 처리됨)
+            logger.info(f"🛑 종료 시작 - 처리 중인 배치를 마무리합니다 (최대 {self.shutdown_timeout:g}초)")
+            self._stop_requested = True
+            _, unfinished = await asyncio.wait(consumers, timeout=self.shutdown_timeout)
+            if unfinished:
+                logger.warning(f"⏱️ 종료 기한 초과 - 샤드 {len(unfinished)}개의 처리 중인 배치를 중단합니다 (재시작 후 다시 처리).")
+            for consumer in unfinished:
+                consumer.cancel()
+            await asyncio.gather(*consumers, return_exceptions=True)
+            await self.application.stop()
+            await self.post_stop(self.application)
+            await self.application.shutdown()
+            await self.post_shutdown(self.application)
     
     def run(self):
         """봇 실행"""
         logger.info("텔레그램 포워더 봇을 시작합니다...")
         logger.info(f"그룹 ID: {self.group_chat_id}")
         logger.info(f"설정된 봇 매핑: {len(self.bot_mappings)}개")
+        if len(self._routes) > 1:
+            logger.info(f"라우팅 그룹: {len(self._routes)}개 ({', '.join(str(chat_id) for chat_id in self._routes.chat_ids)})")
         
         if not self.bot_mappings:
             logger.warning("설정된 봇 매핑이 없습니다. /set 명령어로 매핑을 추가하세요.")
         
-        logger.info("사용 가능한 명령어: /set, /list, /remove, /help")
+        logger.info("사용 가능한 명령어: /set, /list, /remove, /import, /export, /digest, /addrule, /rules, /delrule, /stats, /help")
+        logger.info(f"수신할 업데이트 타입: {', '.join(self.get_allowed_updates())}")
+        
+        if self.role != 'all':
+            logger.info(f"실행 역할: {self.role} (샤드 {self.shard_count}개, 큐: {self.update_queue.path})")
+        if self.role == 'worker':
+            asyncio.run(self.run_worker())
+            return
+        
+        mode = os.getenv('BOT_MODE', 'polling').lower()
+        asyncio.run(self.run_intake(self.webhook_options() if mode == 'webhook' else None))
+    
+    def webhook_options(self):
+        """웹훅 모드 설정 (업데이트 수신 즉시 200 응답 후 큐에서 비동기 처리)"""
+        webhook_url = os.getenv('WEBHOOK_URL')
+        if not webhook_url:
+            raise ValueError("웹훅 모드에서는 WEBHOOK_URL 환경 변수가 필요합니다.")
+        
+        url_path = os.getenv('WEBHOOK_PATH', 'webhook').strip('/')
+        # 시크릿 토큰이 없으면 실행할 때마다 새로 생성 (setWebhook으로 함께 등록됨)
+        secret_token = os.getenv('WEBHOOK_SECRET') or secrets.token_urlsafe(32)
+        listen = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+        port = int(os.getenv('WEBHOOK_PORT') or os.getenv('PORT') or 8443)
         
-        self.application.run_polling(allowed_updates=Update.ALL_TYPES)
+        logger.info(f"웹훅 모드: {listen}:{port}/{url_path} -> {webhook_url}")
+        return {
+            'listen': listen,
+            'port': port,
+            'url_path': url_path,
+            'webhook_url': f"{webhook_url.rstrip('/')}/{url_path}",
+            'secret_token': secret_token,
+            'allowed_updates': self.get_allowed_updates()
+        }
 
 def main():
+    # 로깅 설정 (LOG_FORMAT=json이면 구조화 로그, 출력은 별도 스레드에서 처리)
+    log_listener = setup_logging()
     try:
         bot = TelegramForwarderBot()
         bot.run()
@@ -487,6 +1946,9 @@ def main():
         logger.info("봇이 사용자에 의해 중단되었습니다.")
     except Exception as e:
         logger.error(f"봇 실행 중 오류 발생: {e}")
+    finally:
+        if log_listener:
+            log_listener.stop()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
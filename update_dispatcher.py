@@ -0,0 +1,168 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set
+
+from telegram.ext import BaseUpdateProcessor
+
+
+class _NoLimit:
+    """테넌트 제한이 없을 때 쓰는 빈 컨텍스트 매니저"""
+
+    async def __aenter__(self):
+        return None
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+_NO_LIMIT = _NoLimit()
+
+
+class TopicOrderedUpdateProcessor(BaseUpdateProcessor):
+    """서로 다른 토픽의 업데이트는 병렬로, 같은 토픽의 업데이트는 순서대로 처리
+
+    key_func가 반환한 키가 같은 업데이트끼리는 도착 순서대로 하나씩 처리되고,
+    키가 None인 업데이트는 순서 제약 없이 처리됩니다.
+    동시에 실행되는 업데이트 수는 max_concurrent_updates로 제한됩니다.
+    tenant_func를 주면 같은 테넌트(그룹)의 업데이트는 max_concurrent_per_tenant개까지만
+    동시에 실행되어, 한 그룹에 몰린 업데이트가 다른 그룹의 처리를 막지 않습니다.
+    done_callback은 업데이트 처리가 끝나면(실패해도) 호출되고, 취소된 업데이트에는 호출되지 않습니다.
+
+    BaseUpdateProcessor.process_update는 @final이지만 전체 세마포어를 먼저 잡은 뒤
+    do_process_update를 호출하므로, 순서 대기를 do_process_update에 두면 같은 토픽에서 기다리는
+    업데이트들이 워커 자리를 모두 차지해 다른 토픽이 멈춥니다. 그래서 process_update를 재정의해
+    순서/테넌트 대기를 워커 자리를 잡기 전에 하고, 워커 자리는 기본 클래스의 내부 세마포어 대신
+    자체 세마포어로 제한합니다. Application은 공개 인터페이스인 process_update(update, coroutine)만 호출합니다.
+    """
+
+    def __init__(self, key_func: Callable[[object], Optional[Hashable]], max_concurrent_updates: int,
+                 tenant_func: Optional[Callable[[object], Optional[Hashable]]] = None,
+                 max_concurrent_per_tenant: Optional[int] = None,
+                 done_callback: Optional[Callable[[object], None]] = None):
+        super().__init__(max_concurrent_updates)
+        self.key_func = key_func
+        self.tenant_func = tenant_func
+        self.max_concurrent_per_tenant = max_concurrent_per_tenant or max_concurrent_updates
+        self.done_callback = done_callback
+        self._workers = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._tasks: Set[asyncio.Task] = set()
+        self._aborted: Set[asyncio.Task] = set()
+        self.closed = False
+        self._tenant_semaphores: Dict[Hashable, asyncio.BoundedSemaphore] = {}
+        self._tails: Dict[Hashable, asyncio.Future] = {}
+        self._depths: Dict[Hashable, int] = {}
+        self.received = 0
+        self.queued = 0
+        self.in_flight = 0
+        self.processed = 0
+        self.peak_queued = 0
+
+    async def process_update(  # type: ignore[misc]  # 재정의 이유는 클래스 설명 참고
+            self, update: object, coroutine: "Awaitable[Any]") -> None:
+        """같은 키의 이전 업데이트가 끝날 때까지 기다린 뒤 처리"""
+        if self.closed:
+            # 종료 중단 이후 들어온 업데이트는 처리하지 않음 (재시작 지점에 남아 다시 처리됨)
+            if asyncio.iscoroutine(coroutine):
+                coroutine.close()
+            return
+        self.received += 1
+        key = self.key_func(update)
+        previous = None
+        done = None
+        if key is not None:
+            # 대기 순서는 await 이전에 동기적으로 정해지므로 도착 순서가 유지됨
+            previous = self._tails.get(key)
+            done = asyncio.get_running_loop().create_future()
+            self._tails[key] = done
+            self._depths[key] = self._depths.get(key, 0) + 1
+
+        self.queued += 1
+        self.peak_queued = max(self.peak_queued, self.queued)
+        tenant_semaphore = self._tenant_semaphore(update)
+        started = False
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            if previous is not None:
+                await asyncio.shield(previous)
+            # 테넌트 자리를 먼저 받아야 전체 워커를 붙잡고 기다리지 않음
+            async with tenant_semaphore, self._workers:
+                self.queued -= 1
+                self.in_flight += 1
+                started = True
+                try:
+                    await self.do_process_update(update, coroutine)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    if self.done_callback:
+                        self.done_callback(update)
+                    raise
+                else:
+                    if self.done_callback:
+                        self.done_callback(update)
+                finally:
+                    self.in_flight -= 1
+                    self.processed += 1
+        except asyncio.CancelledError:
+            # abort로 취소한 경우는 정상 종료 (Application이 업데이트 큐 정리를 마칠 수 있도록)
+            if task not in self._aborted:
+                raise
+        finally:
+            self._tasks.discard(task)
+            self._aborted.discard(task)
+            if not started:
+                # 실행되기 전에 취소된 경우
+                self.queued -= 1
+                if asyncio.iscoroutine(coroutine):
+                    coroutine.close()
+            if done is not None:
+                done.set_result(None)
+                self._depths[key] -= 1
+                if not self._depths[key]:
+                    del self._depths[key]
+                if self._tails.get(key) is done:
+                    del self._tails[key]
+
+    def abort(self) -> int:
+        """대기 중이거나 실행 중인 업데이트 처리를 모두 취소하고 이후 업데이트는 받지 않음 (종료 기한 초과 시)
+
+        취소한 업데이트 수를 반환합니다. 취소된 업데이트에는 done_callback이 호출되지 않습니다.
+        """
+        self.closed = True
+        tasks = [task for task in self._tasks if not task.done()]
+        for task in tasks:
+            self._aborted.add(task)
+            task.cancel()
+        return len(tasks)
+
+    def _tenant_semaphore(self, update: object):
+        tenant = self.tenant_func(update) if self.tenant_func else None
+        if tenant is None or self.max_concurrent_per_tenant >= self.max_concurrent_updates:
+            return _NO_LIMIT
+        semaphore = self._tenant_semaphores.get(tenant)
+        if semaphore is None:
+            semaphore = self._tenant_semaphores[tenant] = asyncio.BoundedSemaphore(self.max_concurrent_per_tenant)
+        return semaphore
+
+    async def do_process_update(self, update: object, coroutine: "Awaitable[Any]") -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, int]:
+        """큐 깊이 통계 (백프레셔 확인용)"""
+        return {
+            'workers': self.max_concurrent_updates,
+            'received': self.received,
+            'queued': self.queued,
+            'in_flight': self.in_flight,
+            'processed': self.processed,
+            'peak_queued': self.peak_queued,
+            'active_keys': len(self._depths),
+            'tenants': len(self._tenant_semaphores),
+            'max_key_depth': max(self._depths.values(), default=0)
+        }
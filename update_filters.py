@@ -0,0 +1,71 @@
+from typing import Callable, Iterable, List
+
+from telegram import Message, Update
+from telegram.ext import BaseHandler, CallbackQueryHandler, ChatMemberHandler, CommandHandler, MessageHandler, filters
+
+
+class BotSenderFilter(filters.MessageFilter):
+    """봇이 보낸 메시지만 통과"""
+
+    __slots__ = ()
+
+    def __init__(self):
+        super().__init__(name='BotSenderFilter')
+
+    def filter(self, message: Message) -> bool:
+        return message.from_user is not None and message.from_user.is_bot
+
+
+class MappedSenderFilter(filters.MessageFilter):
+    """등록된 그룹에서 매핑된(또는 기본 토픽으로 보낼) 봇의 메시지만 통과
+
+    매핑이 바뀔 때마다 rebuild로 새 라우팅 테이블을 받아 다시 구성됩니다.
+    """
+
+    __slots__ = ('_table',)
+
+    def __init__(self, table=None):
+        super().__init__(name='MappedSenderFilter')
+        self._table = table
+
+    def rebuild(self, table):
+        """새 라우팅 테이블로 필터 재구성"""
+        self._table = table
+
+    def filter(self, message: Message) -> bool:
+        return self._table is not None and self._table.route(message.chat.id, message.from_user) is not None
+
+
+class RejectCountingFilter(filters.UpdateFilter):
+    """감싼 필터가 거부한 업데이트 수를 사유별로 기록"""
+
+    __slots__ = ('inner', 'reason', 'on_reject')
+
+    def __init__(self, inner: filters.BaseFilter, reason: str, on_reject: Callable[[str], None]):
+        super().__init__(name=inner.name)
+        self.inner = inner
+        self.reason = reason
+        self.on_reject = on_reject
+
+    def filter(self, update: Update) -> bool:
+        if self.inner.check_update(update):
+            return True
+        self.on_reject(self.reason)
+        return False
+
+
+def allowed_updates_for(handlers: Iterable[BaseHandler]) -> List[str]:
+    """등록된 핸들러가 실제로 처리하는 업데이트 타입만 계산 (getUpdates/setWebhook용)"""
+    update_types = set()
+    for handler in handlers:
+        if isinstance(handler, (MessageHandler, CommandHandler)):
+            # 핸들러 콜백은 update.message만 처리하므로 수정/채널 메시지는 받지 않음
+            update_types.add(Update.MESSAGE)
+        elif isinstance(handler, ChatMemberHandler):
+            if handler.chat_member_types in (ChatMemberHandler.CHAT_MEMBER, ChatMemberHandler.ANY_CHAT_MEMBER):
+                update_types.add(Update.CHAT_MEMBER)
+            if handler.chat_member_types in (ChatMemberHandler.MY_CHAT_MEMBER, ChatMemberHandler.ANY_CHAT_MEMBER):
+                update_types.add(Update.MY_CHAT_MEMBER)
+        elif isinstance(handler, CallbackQueryHandler):
+            update_types.add(Update.CALLBACK_QUERY)
+    return sorted(update_types)
@@ -0,0 +1,138 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, List, Optional, Set
+
+from telegram import Update
+
+from persistence import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+# 업데이트가 일주일 넘게 없으면 텔레그램이 다음 update_id를 무작위로 정하므로 오래된 오프셋은 버림
+OFFSET_MAX_AGE = 6 * 24 * 3600
+
+
+class UpdateOffsetTracker:
+    """받은 업데이트 중 처리가 끝나지 않은 것을 추적해 재시작 지점을 파일로 남김
+
+    offset은 getUpdates의 offset과 같은 의미로, 이보다 작은 update_id는 모두 처리가 끝났다는 뜻입니다.
+    종료할 때 offset과 함께 아직 처리되지 않은 업데이트 자체도 저장해, 재시작하면
+    그 업데이트부터 다시 처리하고 offset보다 작은 업데이트는 다시 받아도 건너뜁니다.
+    hold로 남긴 업데이트는 처리가 끝나도 완료로 기록하지 않고 재시작 때 다시 처리합니다.
+    """
+
+    def __init__(self, path: str = 'update_offset.json', bot_id: Optional[int] = None):
+        self.path = path
+        self.bot_id = bot_id
+        self.offset = 0
+        self._pending: Dict[int, Update] = {}
+        self._held: Set[int] = set()
+        self._received_at: Dict[int, float] = {}
+        self._next = 0
+        self._idle: Optional[asyncio.Event] = None
+        self.skipped = 0
+
+    def load(self) -> List[Dict]:
+        """저장된 재시작 지점 복원, 다시 처리할 업데이트 목록 반환"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return []
+        except (json.JSONDecodeError, OSError) as e:
+            logger.error(f"업데이트 오프셋 파일을 읽을 수 없습니다 - 처음부터 시작: {e}")
+            return []
+
+        if self.bot_id is not None and data.get('bot_id') not in (None, self.bot_id):
+            logger.warning("업데이트 오프셋 파일이 다른 봇의 것입니다 - 무시합니다.")
+            return []
+        if time.time() - data.get('saved_at', 0) <= OFFSET_MAX_AGE:
+            self.offset = self._next = int(data.get('offset', 0))
+        return data.get('pending', [])
+
+    def accept(self, update: Update) -> bool:
+        """업데이트를 처리 대기로 기록 (이미 처리했거나 처리 중인 업데이트면 False)"""
+        update_id = update.update_id
+        if update_id < self.offset or update_id in self._pending:
+            self.skipped += 1
+            return False
+        self._pending[update_id] = update
+        self._received_at[update_id] = time.time()
+        self._next = max(self._next, update_id + 1)
+        if self._idle is not None:
+            self._idle.clear()
+        return True
+
+    def done(self, update: object):
+        """업데이트 처리 완료 기록"""
+        if not isinstance(update, Update) or update.update_id in self._held:
+            return
+        self._received_at.pop(update.update_id, None)
+        if self._pending.pop(update.update_id, None) is not None:
+            if self._is_idle() and self._idle is not None:
+                self._idle.set()
+
+    def received_at(self, update_id: int) -> Optional[float]:
+        """업데이트를 받아 처리 대기로 기록한 시각 (time.time 기준, 처리가 끝났으면 None)"""
+        return self._received_at.get(update_id)
+
+    def hold(self, update: Update):
+        """처리하지 못한 업데이트를 완료로 기록하지 않고 남김 (종료 시 저장되어 재시작 후 다시 처리)"""
+        if update.update_id in self._pending:
+            self._held.add(update.update_id)
+            if self._is_idle() and self._idle is not None:
+                self._idle.set()
+
+    def _is_idle(self) -> bool:
+        # 남겨 둔 업데이트는 종료를 기다리게 하지 않음
+        return len(self._pending) == len(self._held)
+
+    def safe_offset(self) -> int:
+        """이보다 작은 update_id는 모두 처리가 끝난 오프셋"""
+        return min(self._pending) if self._pending else self._next
+
+    async def wait_idle(self, timeout: float) -> bool:
+        """처리 중인 업데이트가 모두 끝날 때까지 최대 timeout초 대기"""
+        if self._is_idle():
+            return True
+        if self._idle is None:
+            self._idle = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def save(self):
+        """재시작 지점(오프셋 + 끝나지 않은 업데이트)을 파일에 저장"""
+        atomic_write_json(self.path, {
+            'bot_id': self.bot_id,
+            'offset': self.safe_offset(),
+            'pending': [self._pending[update_id].to_dict() for update_id in sorted(self._pending)],
+            'saved_at': time.time()
+        })
+
+    def stats(self) -> Dict[str, int]:
+        """재시작 지점 통계"""
+        return {
+            'offset': self.safe_offset(),
+            'pending': len(self._pending),
+            'held': len(self._held),
+            'skipped': self.skipped
+        }
+
+
+class TrackingUpdateQueue(asyncio.Queue):
+    """Application.update_queue 대체 - 넣는 업데이트를 추적기에 기록하고 이미 처리한 업데이트는 버림"""
+
+    def __init__(self, tracker: UpdateOffsetTracker):
+        super().__init__()
+        self.tracker = tracker
+
+    def put_nowait(self, item):
+        # 종료 신호 등 업데이트가 아닌 항목은 그대로 전달
+        if isinstance(item, Update) and not self.tracker.accept(item):
+            return
+        super().put_nowait(item)
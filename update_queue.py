@@ -0,0 +1,93 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Hashable, List, Optional, Tuple
+
+
+def shard_for(key: Optional[Hashable], shard_count: int) -> int:
+    """순서 키를 샤드 번호로 변환 (프로세스가 달라도 같은 값)"""
+    if key is None or shard_count <= 1:
+        return 0
+    return zlib.crc32(repr(key).encode('utf-8')) % shard_count
+
+
+class SqliteUpdateQueue:
+    """수신 프로세스와 워커 프로세스 사이의 SQLite(WAL) 업데이트 큐
+
+    수신 프로세스는 publish로 업데이트를 샤드별로 넣고, 워커는 자기 샤드를
+    claim으로 들어온 순서대로 읽은 뒤 처리가 끝나면 ack로 지웁니다.
+    샤드 하나는 워커 하나만 소비해야 샤드 안의 순서가 유지됩니다.
+    같은 publish/claim/ack 인터페이스로 Redis 등 다른 브로커로 바꿀 수 있습니다.
+    """
+
+    def __init__(self, path: str = 'update_queue.db'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            '''CREATE TABLE IF NOT EXISTS updates (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                shard INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )'''
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS updates_shard ON updates (shard, id)')
+        # 이전 버전 DB에는 수신 시각 컬럼이 없음 (NULL이면 발행 시각을 사용)
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(updates)')}
+        if 'received_at' not in columns:
+            self._conn.execute('ALTER TABLE updates ADD COLUMN received_at REAL')
+        self.published = 0
+        self.acked = 0
+
+    def _publish(self, shard, payload, received_at):
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO updates (shard, payload, created_at, received_at) VALUES (?, ?, ?, ?)',
+                (shard, json.dumps(payload, ensure_ascii=False), time.time(), received_at)
+            )
+        self.published += 1
+
+    def _claim(self, shard, limit) -> List[Tuple[int, Dict, float]]:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT id, payload, COALESCE(received_at, created_at) FROM updates WHERE shard = ? ORDER BY id LIMIT ?',
+                (shard, limit)
+            ).fetchall()
+        return [(item_id, json.loads(payload), received_at) for item_id, payload, received_at in rows]
+
+    def _ack(self, item_ids):
+        with self._lock:
+            self._conn.executemany('DELETE FROM updates WHERE id = ?', [(item_id,) for item_id in item_ids])
+        self.acked += len(item_ids)
+
+    def _depths(self) -> Dict[int, int]:
+        with self._lock:
+            rows = self._conn.execute('SELECT shard, COUNT(*) FROM updates GROUP BY shard').fetchall()
+        return dict(rows)
+
+    async def publish(self, shard: int, payload: Dict, received_at: Optional[float] = None):
+        """업데이트를 샤드 큐 끝에 추가 (received_at: 수신 프로세스가 업데이트를 받은 time.time 시각)"""
+        await asyncio.to_thread(self._publish, shard, payload, received_at)
+
+    async def claim(self, shard: int, limit: int = 100) -> List[Tuple[int, Dict, float]]:
+        """샤드의 가장 오래된 업데이트부터 limit개 (ID, 업데이트, 수신 시각) 조회 (ack 전까지는 남아 있음)"""
+        return await asyncio.to_thread(self._claim, shard, limit)
+
+    async def ack(self, item_ids: List[int]):
+        """처리가 끝난 업데이트 삭제"""
+        if item_ids:
+            await asyncio.to_thread(self._ack, item_ids)
+
+    async def depths(self) -> Dict[int, int]:
+        """샤드별 남은 업데이트 수"""
+        return await asyncio.to_thread(self._depths)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()